@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'listings.metrics.MetricsMiddleware',
+    'listings.db.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -58,11 +60,53 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'alx_travel_app.wsgi.application'
 
-# Database
-DATABASES = {
+# Database: SQLite unless DATABASE_ENGINE=postgresql. DATABASE_REPLICAS lists read replicas
+# (host[:port] for PostgreSQL, database files for SQLite) served by listings.db.PrimaryReplicaRouter
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+DATABASE_REPLICAS = [replica for replica in os.environ.get('DATABASE_REPLICAS', '').split(',') if replica]
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'alx_travel_app'),
+            'USER': os.environ.get('DATABASE_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            # Persistent connections, checked before being reused after a request
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # PgBouncer in transaction pooling mode cannot keep server-side cursors across transactions
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_PGBOUNCER') == '1',
+            'OPTIONS': {'connect_timeout': 5},
+        }
+    }
+    for index, replica in enumerate(DATABASE_REPLICAS, 1):
+        host, _, port = replica.partition(':')
+        DATABASES[f'replica_{index}'] = dict(
+            DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'], TEST={'MIRROR': 'default'}
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            # Seconds a writer waits for the database lock
+            'OPTIONS': {'timeout': 20},
+            # A file rather than the in-memory default, so tests can write from several threads
+            'TEST': {'NAME': os.environ.get('DATABASE_TEST_NAME', BASE_DIR / 'test_db.sqlite3')},
+        }
+    }
+    for index, replica in enumerate(DATABASE_REPLICAS, 1):
+        DATABASES[f'replica_{index}'] = dict(DATABASES['default'], NAME=replica, TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['listings.db.PrimaryReplicaRouter']
+
+# Cache
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -108,9 +152,101 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'listings.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'listings.pagination.HybridPagination',
     'PAGE_SIZE': 10,
 }
 
 # CORS settings
-CORS_ALLOW_ALL_ORIGINS = True  # For development only, restrict in production
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True  # For development only, restrict in production
+
+# Listings app settings
+# Extra amenities stored only in the Listing.amenities bitmask; append new names, never reorder
+LISTING_EXTRA_AMENITIES = []
+
+# Largest page_size a client may request
+LISTINGS_MAX_PAGE_SIZE = 100
+
+# Read cache in front of the listings endpoints (see listings.cache)
+LISTINGS_CACHE_ENABLED = True
+LISTINGS_CACHE_ALIAS = 'default'
+LISTINGS_CACHE_TIMEOUT = 300
+LISTINGS_CACHE_LOCAL_SIZE = 1024
+
+# Answer ?search= from the full-text index (FTS5 on SQLite, tsvector/GIN on PostgreSQL)
+LISTINGS_FULL_TEXT_SEARCH = True
+# PostgreSQL text search configuration of the index
+LISTINGS_SEARCH_CONFIG = 'simple'
+
+# Callable (dotted path) turning (address, city, country) into (latitude, longitude) or None
+LISTINGS_GEOCODER = 'listings.geo.offline_geocoder'
+# Radius of ?near= searches without radius_km
+LISTINGS_DEFAULT_RADIUS_KM = 10
+
+# Largest batch accepted by the bulk booking and review endpoints
+LISTINGS_BULK_MAX_ITEMS = 500
+
+# Serve list endpoints from values() rows with compiled serializers (see listings.fastpath)
+LISTINGS_FAST_SERIALIZATION = True
+
+# Longest date window and most listings of one availability calendar request
+LISTINGS_CALENDAR_MAX_DAYS = 366
+LISTINGS_CALENDAR_MAX_LISTINGS = 50
+
+# Rows fetched and serialized per batch by the NDJSON streaming responses
+LISTINGS_STREAM_CHUNK_SIZE = 2000
+
+# Request metrics exposed at /metrics (see listings.metrics): share of requests recorded,
+# slow request log threshold (None disables it), SQL statements logged per slow request
+# and bearer token required to scrape the endpoint (without one, /metrics answers 403 unless DEBUG)
+LISTINGS_METRICS_ENABLED = True
+LISTINGS_METRICS_SAMPLE_RATE = 1.0
+LISTINGS_SLOW_REQUEST_MS = 500
+LISTINGS_SLOW_REQUEST_MAX_QUERIES = 20
+LISTINGS_METRICS_TOKEN = os.environ.get('LISTINGS_METRICS_TOKEN')
+
+# Read replicas (see listings.db): aliases receiving the reads of LISTINGS_REPLICA_MODELS,
+# largest replication lag tolerated (also how long a client's reads stay on the primary
+# after it wrote) and seconds between two health checks of a replica
+LISTINGS_READ_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+LISTINGS_REPLICA_MODELS = ['listings.listing', 'listings.review', 'auth.user']
+LISTINGS_REPLICA_MAX_LAG_SECONDS = 5
+LISTINGS_REPLICA_CHECK_SECONDS = 10
+
+# Pragmas applied to every SQLite connection: WAL lets readers run alongside the writer
+LISTINGS_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'temp_store': 'memory',
+    'cache_size': -20000,
+    'mmap_size': 134217728,
+}
+
+# Background tasks (see listings.taskqueue): 'local' runs them in a thread pool of the web
+# process, 'database' writes them to the outbox table for `manage.py run_tasks` workers
+LISTINGS_TASK_BACKEND = os.environ.get('LISTINGS_TASK_BACKEND', 'local')
+LISTINGS_TASK_WORKERS = 4
+LISTINGS_TASK_MAX_ATTEMPTS = 5
+# Retry delays double from LISTINGS_TASK_RETRY_DELAY up to LISTINGS_TASK_MAX_RETRY_DELAY seconds
+LISTINGS_TASK_RETRY_DELAY = 5
+LISTINGS_TASK_MAX_RETRY_DELAY = 600
+# Seconds after which a task claimed by a worker that died is claimed again
+LISTINGS_TASK_LEASE_SECONDS = 300
+
+# Email (booking notifications)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'bookings@alxtravelapp.com')
+
+# Booking lifecycle (manage.py update_booking_statuses): hours a pending booking holds its nights
+# before being cancelled, and bookings updated per transaction
+LISTINGS_PENDING_HOLD_HOURS = 24
+LISTINGS_LIFECYCLE_BATCH_SIZE = 1000
+
+# Pricing (see listings.pricing): compiled rate plans memoized per process, and stays per quote request
+LISTINGS_RATE_PLAN_CACHE_SIZE = 4096
+LISTINGS_RATE_PLAN_TIMEOUT = 3600
+LISTINGS_QUOTE_MAX_STAYS = 100
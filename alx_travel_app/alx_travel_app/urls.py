@@ -2,10 +2,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from listings.db import health_view
+from listings.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('listings.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('health', health_view, name='health'),
 ]
 
 # Serve media files in development
@@ -1,14 +1,23 @@
 from django.contrib import admin
-from .models import Listing, Booking, Review
+from django.utils import timezone
+from .models import Listing, Booking, Review, OutboxTask, RateRule
+
+
+class RateRuleInline(admin.TabularInline):
+    model = RateRule
+    extra = 0
+    fields = ('kind', 'name', 'start_date', 'end_date', 'weekdays', 'amount', 'percent', 'min_nights', 'priority')
 
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
-    list_display = ('title', 'city', 'country', 'property_type', 'price_per_night', 'host', 'created_at')
+    inlines = [RateRuleInline]
+    list_display = ('title', 'city', 'country', 'property_type', 'price_per_night', 'average_rating', 'host', 'created_at')
     list_filter = ('property_type', 'city', 'country', 'has_wifi', 'has_kitchen', 'has_air_conditioning',
                   'has_heating', 'has_tv', 'has_parking', 'has_pool')
     search_fields = ('title', 'description', 'address', 'city', 'country', 'host__username')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'review_count', 'rating_sum', 'average_rating',
+                       'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count')
     fieldsets = (
         ('Basic Information', {
             'fields': ('title', 'description', 'host', 'image')
@@ -23,6 +32,10 @@ class ListingAdmin(admin.ModelAdmin):
             'fields': ('has_wifi', 'has_kitchen', 'has_air_conditioning', 'has_heating',
                       'has_tv', 'has_parking', 'has_pool')
         }),
+        ('Ratings', {
+            'fields': ('review_count', 'rating_sum', 'average_rating', 'rating_1_count', 'rating_2_count',
+                      'rating_3_count', 'rating_4_count', 'rating_5_count')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
@@ -67,4 +80,16 @@ class ReviewAdmin(admin.ModelAdmin):
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(OutboxTask)
+class OutboxTaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('locked_at', 'locked_by', 'last_error', 'created_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry the selected tasks now')
+    def retry_now(self, request, queryset):
+        queryset.exclude(status='running').update(status='pending', run_at=timezone.now(), attempts=0)
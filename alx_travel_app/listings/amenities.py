@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+
+# Amenities backed by a has_<name> field on Listing. The position in this list
+# is the bit used in Listing.amenities, so new entries must only be appended.
+BUILTIN_AMENITIES = ['wifi', 'kitchen', 'air_conditioning', 'heating', 'tv', 'parking', 'pool']
+
+
+def amenity_catalogue():
+    """All amenity names; LISTING_EXTRA_AMENITIES adds bitmask-only amenities after the built-ins"""
+    return BUILTIN_AMENITIES + list(getattr(settings, 'LISTING_EXTRA_AMENITIES', []))
+
+
+def amenity_bit(name):
+    """Bit of an amenity in the Listing.amenities mask"""
+    try:
+        return 1 << amenity_catalogue().index(name)
+    except ValueError:
+        raise ValueError(f"Unknown amenity: {name}")
+
+
+def amenity_mask(names):
+    """Combined mask of the given amenity names"""
+    mask = 0
+    for name in names:
+        mask |= amenity_bit(name)
+    return mask
+
+
+def amenity_names(mask):
+    """Names of the amenities set in a mask"""
+    return [name for index, name in enumerate(amenity_catalogue()) if mask & (1 << index)]
+
+
+BUILTIN_MASK = (1 << len(BUILTIN_AMENITIES)) - 1
+
+
+def pack_amenities(listing):
+    """Mask of a listing built from its boolean fields, keeping its bitmask-only amenities"""
+    mask = (listing.amenities or 0) & ~BUILTIN_MASK
+    for index, name in enumerate(BUILTIN_AMENITIES):
+        if getattr(listing, f'has_{name}'):
+            mask |= 1 << index
+    return mask
+
+
+def amenities_expression(values):
+    """SQL expression recomputing the mask when some has_<name> fields are set to the boolean `values`"""
+    expression = F('amenities').bitand(~BUILTIN_MASK)
+    for index, name in enumerate(BUILTIN_AMENITIES):
+        field = f'has_{name}'
+        if field in values:
+            bit = Value(1 << index if values[field] else 0)
+        else:
+            bit = Case(When(**{field: True}, then=Value(1 << index)), default=Value(0))
+        expression = expression + bit
+    return expression
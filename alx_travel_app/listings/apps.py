@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class ListingsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'listings'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite)
@@ -0,0 +1,106 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseNotAllowed
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from .cache import CachedReadMixin, listing_cache
+from .fastpath import CompiledSerializer, NotCompilable
+from .metrics import atimed_serialization
+from .renderers import FastJSONRenderer
+from .views import ListingViewSet, ReviewViewSet
+
+
+class ReadPlan:
+    """Synchronous half of an async read, run in a worker thread.
+
+    Authenticates the request, checks permissions, builds the filtered
+    queryset and compiles the serializer exactly like the ViewSet would, and
+    looks the response up in the cache. Only the rows are left to fetch.
+    """
+
+    def __init__(self, viewset_class, action, request, kwargs):
+        self.view = view = viewset_class()
+        view.action_map = {'get': action, 'head': action}
+        view.args, view.kwargs = (), kwargs
+        # JSON only: the browsable API renders forms with database queries
+        view.renderer_classes = [FastJSONRenderer]
+        view.request = view.initialize_request(request)
+        view.headers = view.default_response_headers
+        self.response = None
+        self.cache_key = None
+        try:
+            view.initial(view.request)
+            self.compiled = CompiledSerializer(view.get_serializer())
+            queryset = view.filter_queryset(view.get_queryset()).prefetch_related(None).select_related(None)
+            if 'pk' in kwargs:
+                queryset = queryset.filter(pk=kwargs['pk'])
+            self.rows = self.compiled.fetch(queryset)
+            if isinstance(view, CachedReadMixin) and listing_cache.enabled:
+                self.lookup_cache(action, kwargs)
+        except NotCompilable:
+            self.compiled = None
+        except Exception as exc:
+            self.response = view.handle_exception(exc)
+
+    def lookup_cache(self, action, kwargs):
+        if action == 'list':
+            tags = self.view.cache_list_tags(self.view.request)
+        else:
+            tags = self.view.cache_detail_tags(kwargs['pk'])
+        self.cache_key = self.view.cache_key(action, tags)
+        entry = listing_cache.get(self.cache_key)
+        if entry is not None:
+            self.response = Response(entry[0])
+
+    async def list(self):
+        view = self.view
+        page = await view.paginator.apaginate_queryset(self.rows, view.request, view)
+        items = await atimed_serialization(self.compiled.aserialize, page)
+        return view.get_paginated_response([item for _, item in items])
+
+    async def retrieve(self):
+        rows = [row async for row in self.rows[:1]]
+        if not rows:
+            raise NotFound()
+        items = await atimed_serialization(self.compiled.aserialize, rows)
+        return Response(items[0][1])
+
+
+def async_read_view(viewset_class, action):
+    """Async view serving the list or retrieve action of a ViewSet with the async ORM.
+
+    Nested relations of the page are fetched concurrently, and the page count
+    and rows too. Serializers the fast path cannot compile, and
+    LISTINGS_FAST_SERIALIZATION = False, fall back to the sync ViewSet.
+    """
+    sync_view = sync_to_async(viewset_class.as_view({'get': action}))
+
+    async def view(request, pk=None):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        kwargs = {} if pk is None else {'pk': pk}
+        if not getattr(settings, 'LISTINGS_FAST_SERIALIZATION', True):
+            return await sync_view(request, **kwargs)
+        plan = await sync_to_async(ReadPlan)(viewset_class, action, request, kwargs)
+        if plan.response is None and plan.compiled is None:
+            return await sync_view(request, **kwargs)
+
+        response = plan.response
+        if response is None:
+            try:
+                response = await (plan.list() if action == 'list' else plan.retrieve())
+            except NotFound as exc:
+                response = plan.view.handle_exception(exc)
+            else:
+                if plan.cache_key is not None:
+                    # Without validators, which the async path does not compute
+                    await sync_to_async(listing_cache.set)(plan.cache_key, (response.data, None, None))
+        response = plan.view.finalize_response(plan.view.request, response)
+        return response.render()
+    return view
+
+
+listing_list = async_read_view(ListingViewSet, 'list')
+listing_detail = async_read_view(ListingViewSet, 'retrieve')
+review_list = async_read_view(ReviewViewSet, 'list')
+review_detail = async_read_view(ReviewViewSet, 'retrieve')
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from .models import BookedNight, Booking
+
+# Booking statuses that hold their nights
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+
+class BookingConflict(Exception):
+    """Raised when some of the requested nights are already booked"""
+
+
+def stay_nights(check_in, check_out):
+    """Dates of the nights between check-in (included) and check-out (excluded)"""
+    return [check_in + timedelta(days=offset) for offset in range((check_out - check_in).days)]
+
+
+def is_available(listing, check_in, check_out, exclude_booking=None):
+    """Check with a single indexed query that no night of the stay is booked"""
+    nights = BookedNight.objects.filter(listing=listing, date__gte=check_in, date__lt=check_out)
+    if exclude_booking is not None and exclude_booking.pk:
+        nights = nights.exclude(booking=exclude_booking)
+    return not nights.exists()
+
+
+def filter_available(listings, check_in, check_out):
+    """Restrict a listing queryset to listings without an overlapping active booking"""
+    overlapping = Booking.objects.filter(
+        listing=OuterRef('pk'),
+        status__in=ACTIVE_STATUSES,
+        check_in_date__lt=check_out,
+        check_out_date__gt=check_in,
+    )
+    return listings.filter(~Exists(overlapping))
+
+
+def availability_calendar(listings, start, end):
+    """Per-night availability and price of listings between start (included) and end (excluded).
+
+    Read from the booked nights maintained on every booking change, with a
+    single indexed query for all the listings, and priced by their rate plans.
+    """
+    from .pricing import rate_plans
+
+    nights = stay_nights(start, end)
+    plans = rate_plans(listings)
+    booked = set(
+        BookedNight.objects.filter(listing__in=listings, date__gte=start, date__lt=end).values_list('listing_id', 'date')
+    )
+    return [
+        {
+            'listing': listing.pk,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'available': [0 if (listing.pk, night) in booked else 1 for night in nights],
+            'prices': ['{:f}'.format(price) for price in plans[listing.pk].nightly_prices(start, end)],
+        }
+        for listing in listings
+    ]
+
+
+def sync_booked_nights(booking):
+    """Make the booked nights of a booking match its dates and status.
+
+    Relies on the (listing, date) unique constraint so that concurrent
+    reservations of the same night cannot both succeed.
+    """
+    nights = BookedNight.objects.using(booking._state.db)
+    if getattr(booking, '_loaded_stay', None) is not None:
+        # Previously saved booking, drop the nights it held
+        nights.filter(booking=booking).delete()
+    if booking.status not in ACTIVE_STATUSES:
+        return
+    try:
+        with transaction.atomic(using=booking._state.db):
+            nights.bulk_create([
+                BookedNight(listing_id=booking.listing_id, booking=booking, date=date)
+                for date in stay_nights(booking.check_in_date, booking.check_out_date)
+            ])
+    except IntegrityError:
+        raise BookingConflict("This listing is already booked for the selected dates")
+
+
+def rebuild_booked_nights(bookings):
+    """Regenerate the booked nights of the given bookings, returning the conflicting ones"""
+    conflicts = []
+    for booking in bookings.iterator():
+        try:
+            with transaction.atomic():
+                sync_booked_nights(booking)
+        except BookingConflict:
+            conflicts.append(booking)
+    return conflicts
@@ -0,0 +1,464 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .availability import ACTIVE_STATUSES, BookingConflict, stay_nights
+from .cache import invalidate
+from .models import BookedNight, Booking, Listing, Review
+from .pricing import rate_plans
+from .tasks import notify_bookings
+
+MAX_ITEMS = getattr(settings, 'LISTINGS_BULK_MAX_ITEMS', 500)
+
+# Status changes allowed by the bulk transition endpoint; none of them reserves nights
+TRANSITIONS = {
+    'pending': ['confirmed', 'cancelled'],
+    'confirmed': ['completed', 'cancelled'],
+}
+
+# Listings per OR-ed condition of the booked nights lookup
+LOOKUP_CHUNK_SIZE = 200
+
+NOT_FOUND = {'detail': ['Not found.']}
+PERMISSION_DENIED = {'detail': ['You do not have permission to perform this action.']}
+
+
+class BulkResult:
+    """Per-item outcome of a bulk request, in input order"""
+
+    def __init__(self, size):
+        self.items = [None] * size
+
+    def fail(self, index, errors):
+        self.items[index] = {'index': index, 'status': 'failed', 'errors': errors}
+
+    def succeed(self, index, outcome, pk):
+        self.items[index] = {'index': index, 'status': outcome, 'id': pk}
+
+    def count(self, *statuses):
+        return sum(1 for item in self.items if item['status'] in statuses)
+
+    def roll_back(self):
+        """Report the items written by a batch that was then rolled back as skipped"""
+        for index, item in enumerate(self.items):
+            if item['status'] != 'failed':
+                self.items[index] = {'index': index, 'status': 'skipped'}
+
+    def response(self, success_status):
+        """201/200 when every item succeeded, 207 on partial failure, 400 when none succeeded"""
+        failed = self.count('failed')
+        succeeded = len(self.items) - failed - self.count('skipped')
+        if not failed:
+            code = success_status
+        elif succeeded:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'succeeded': succeeded,
+            'failed': failed,
+            'results': self.items,
+        }, status=code)
+
+
+class BulkBookingSerializer(serializers.ModelSerializer):
+    """Item of a bulk booking request, validated without touching the database"""
+    id = serializers.IntegerField(required=False)
+    listing_id = serializers.IntegerField()
+
+    class Meta:
+        model = Booking
+        fields = ['id', 'listing_id', 'check_in_date', 'check_out_date', 'guests_count', 'status']
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    """Item of a bulk status transition request"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Booking.STATUS_CHOICES)
+
+
+class BulkReviewSerializer(serializers.ModelSerializer):
+    """Item of a bulk review request, validated without touching the database"""
+    id = serializers.IntegerField(required=False)
+    listing_id = serializers.IntegerField()
+    booking_id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Review
+        fields = ['id', 'listing_id', 'booking_id', 'rating', 'comment']
+
+
+def batch_items(data):
+    """Items of a bulk request body, which must be a non-empty list of at most MAX_ITEMS"""
+    if not isinstance(data, list) or not data:
+        raise ValidationError({'non_field_errors': ['Expected a non-empty list of items.']})
+    if len(data) > MAX_ITEMS:
+        raise ValidationError({'non_field_errors': [f'At most {MAX_ITEMS} items per request.']})
+    return data
+
+
+def all_or_nothing(request):
+    """Whether the client asked with ?atomic=true for the batch to be written whole or not at all"""
+    return request.query_params.get('atomic', '').lower() in ('1', 'true')
+
+
+def run_batch(function, user, items, atomic=False):
+    """Apply a bulk write function; when atomic, roll the whole batch back if any item failed"""
+    if not atomic:
+        return function(user, items)
+    with transaction.atomic():
+        result = function(user, items)
+        if result.count('failed'):
+            # Also drops the notifications and cache invalidations queued with the transaction
+            transaction.set_rollback(True)
+            result.roll_back()
+    return result
+
+
+def validate_items(serializer_class, items, result, partial=False):
+    """Field-level validation of every item, returning validated data by index"""
+    valid = {}
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item, partial=partial)
+        if not serializer.is_valid():
+            result.fail(index, serializer.errors)
+        elif partial and 'id' not in serializer.validated_data:
+            result.fail(index, {'id': ['This field is required.']})
+        else:
+            valid[index] = serializer.validated_data
+    return valid
+
+
+def drop_duplicate_ids(valid, result):
+    """Fail items repeating the id of an earlier item of the batch"""
+    seen = set()
+    for index in sorted(valid):
+        pk = valid[index]['id']
+        if pk in seen:
+            result.fail(index, {'id': ['Duplicate id in batch.']})
+            del valid[index]
+        seen.add(pk)
+
+
+def can_edit_booking(user, booking):
+    """Same rule as IsOwnerOrAdmin"""
+    return user.is_staff or booking.guest_id == user.pk
+
+
+def can_see_booking(user, booking, listings):
+    """Same scope as BookingViewSet.get_queryset"""
+    listing = listings.get(booking.listing_id)
+    return user.is_staff or booking.guest_id == user.pk or (listing is not None and listing.host_id == user.pk)
+
+
+def booking_errors(data, listing):
+    """Checks of BookingSerializer.validate that do not need the other bookings"""
+    if listing is None:
+        return {'listing_id': [f'Invalid pk "{data["listing_id"]}" - object does not exist.']}
+    if data['check_in_date'] >= data['check_out_date']:
+        return {'non_field_errors': ['Check-out date must be after check-in date']}
+    if data['guests_count'] > listing.max_guests:
+        return {'non_field_errors': [f'This listing can only accommodate {listing.max_guests} guests']}
+    return None
+
+
+def booked_nights(stays):
+    """Holder of every booked night in the date span each listing of the stays is requested for"""
+    spans = {}
+    for _, listing_id, check_in, check_out in stays.values():
+        low, high = spans.get(listing_id, (check_in, check_out))
+        spans[listing_id] = (min(low, check_in), max(high, check_out))
+    spans = list(spans.items())
+    booked = {}
+    for start in range(0, len(spans), LOOKUP_CHUNK_SIZE):
+        condition = Q()
+        for listing_id, (low, high) in spans[start:start + LOOKUP_CHUNK_SIZE]:
+            condition |= Q(listing_id=listing_id, date__gte=low, date__lt=high)
+        rows = BookedNight.objects.filter(condition).values_list('listing_id', 'date', 'booking_id')
+        booked.update(((listing_id, date), booking_id) for listing_id, date, booking_id in rows)
+    return booked
+
+
+def drop_conflicting_stays(stays, valid, result):
+    """Fail stays overlapping a booked night or an earlier stay of the batch.
+
+    `stays` maps item indexes to (holder, listing_id, check_in, check_out),
+    the holder being the booking id for updates. A booking never conflicts
+    with the nights it already holds.
+    """
+    if not stays:
+        return
+    booked = booked_nights(stays)
+    for index in sorted(stays):
+        holder, listing_id, check_in, check_out = stays[index]
+        nights = [(listing_id, date) for date in stay_nights(check_in, check_out)]
+        if any(booked.get(night, holder) != holder for night in nights):
+            result.fail(index, {'non_field_errors': ['This listing is already booked for the selected dates']})
+            del valid[index]
+            continue
+        booked.update((night, holder) for night in nights)
+
+
+def night_rows(bookings):
+    return [
+        BookedNight(listing_id=booking.listing_id, booking_id=booking.pk, date=date)
+        for booking in bookings if booking.status in ACTIVE_STATUSES
+        for date in stay_nights(booking.check_in_date, booking.check_out_date)
+    ]
+
+
+def save_one_by_one(bookings, result, outcome):
+    """Per-row fallback when a concurrent request took some nights after they were checked"""
+    for index, booking in bookings.items():
+        try:
+            with transaction.atomic():
+                booking.save()
+        except BookingConflict as exc:
+            result.fail(index, {'non_field_errors': [str(exc)]})
+        else:
+            result.succeed(index, outcome, booking.pk)
+
+
+def create_bookings(user, items):
+    """Create the valid bookings of a batch with two bulk inserts"""
+    result = BulkResult(len(items))
+    valid = validate_items(BulkBookingSerializer, items, result)
+    listings = Listing.objects.only('id', 'price_per_night', 'max_guests').in_bulk(
+        {data['listing_id'] for data in valid.values()}
+    )
+    stays = {}
+    for index, data in list(valid.items()):
+        data.pop('id', None)
+        errors = booking_errors(data, listings.get(data['listing_id']))
+        if errors:
+            result.fail(index, errors)
+            del valid[index]
+        elif data.get('status', 'pending') in ACTIVE_STATUSES:
+            stays[index] = (('new', index), data['listing_id'], data['check_in_date'], data['check_out_date'])
+    drop_conflicting_stays(stays, valid, result)
+
+    plans = rate_plans(listings[data['listing_id']] for data in valid.values())
+    bookings = {}
+    for index, data in valid.items():
+        total = plans[data['listing_id']].quote(data['check_in_date'], data['check_out_date'])['total']
+        bookings[index] = Booking(guest=user, total_price=total, **data)
+    if not bookings:
+        return result
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Booking.objects.bulk_create(bookings.values())
+                BookedNight.objects.bulk_create(night_rows(bookings.values()))
+        except IntegrityError:
+            for booking in bookings.values():
+                booking.pk = None
+                booking._state.adding = True
+            save_one_by_one(bookings, result, 'created')
+        else:
+            for index, booking in bookings.items():
+                booking._loaded_stay = booking.stay_key
+                result.succeed(index, 'created', booking.pk)
+            notify_bookings([(booking.pk, 'created') for booking in bookings.values()])
+        # bulk_create sends no signals
+        invalidate('bookings')
+    return result
+
+
+def update_bookings(user, items):
+    """Apply partial updates to the bookings of a batch with one bulk UPDATE"""
+    result = BulkResult(len(items))
+    valid = validate_items(BulkBookingSerializer, items, result, partial=True)
+    drop_duplicate_ids(valid, result)
+    bookings = Booking.objects.in_bulk([data['id'] for data in valid.values()])
+    listing_ids = {booking.listing_id for booking in bookings.values()}
+    listing_ids.update(data['listing_id'] for data in valid.values() if 'listing_id' in data)
+    listings = Listing.objects.only('id', 'host_id', 'max_guests').in_bulk(listing_ids)
+
+    stays, changed, fields = {}, {}, {'updated_at'}
+    for index, data in list(valid.items()):
+        booking = bookings.get(data.pop('id'))
+        if booking is None or not can_see_booking(user, booking, listings):
+            result.fail(index, NOT_FOUND)
+            del valid[index]
+            continue
+        if not can_edit_booking(user, booking):
+            result.fail(index, PERMISSION_DENIED)
+            del valid[index]
+            continue
+        for name, value in data.items():
+            setattr(booking, name, value)
+        merged = {
+            'listing_id': booking.listing_id, 'check_in_date': booking.check_in_date,
+            'check_out_date': booking.check_out_date, 'guests_count': booking.guests_count,
+        }
+        errors = booking_errors(merged, listings.get(booking.listing_id))
+        if errors:
+            result.fail(index, errors)
+            del valid[index]
+            continue
+        if booking.status in ACTIVE_STATUSES and booking.stay_key != booking._loaded_stay:
+            stays[index] = (booking.pk, booking.listing_id, booking.check_in_date, booking.check_out_date)
+        changed[index] = booking
+        fields.update(data)
+    drop_conflicting_stays(stays, valid, result)
+    changed = {index: booking for index, booking in changed.items() if index in valid}
+    if not changed:
+        return result
+
+    now = timezone.now()
+    moved = [booking for booking in changed.values() if booking.stay_key != booking._loaded_stay]
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                for booking in changed.values():
+                    booking.updated_at = now
+                Booking.objects.bulk_update(changed.values(), sorted(fields))
+                BookedNight.objects.filter(booking__in=moved).delete()
+                BookedNight.objects.bulk_create(night_rows(moved))
+        except IntegrityError:
+            save_one_by_one(changed, result, 'updated')
+        else:
+            notify_bookings([
+                (booking.pk, booking.status) for booking in changed.values() if booking.status != booking._loaded_stay[3]
+            ])
+            for index, booking in changed.items():
+                booking._loaded_stay = booking.stay_key
+                result.succeed(index, 'updated', booking.pk)
+        # bulk_update sends no signals
+        invalidate('bookings')
+    return result
+
+
+def transition_bookings(user, items):
+    """Move bookings along TRANSITIONS with one UPDATE per target status"""
+    result = BulkResult(len(items))
+    valid = validate_items(BulkStatusSerializer, items, result)
+    drop_duplicate_ids(valid, result)
+
+    with transaction.atomic():
+        bookings = Booking.objects.select_for_update().only('id', 'status', 'guest_id', 'listing_id').in_bulk(
+            [data['id'] for data in valid.values()]
+        )
+        listings = Listing.objects.only('id', 'host_id').in_bulk({booking.listing_id for booking in bookings.values()})
+        targets = {}
+        for index, data in valid.items():
+            booking = bookings.get(data['id'])
+            if booking is None or not can_see_booking(user, booking, listings):
+                result.fail(index, NOT_FOUND)
+            elif not can_edit_booking(user, booking):
+                result.fail(index, PERMISSION_DENIED)
+            elif data['status'] not in TRANSITIONS.get(booking.status, []):
+                result.fail(index, {'status': [f'Cannot change a {booking.status} booking to {data["status"]}.']})
+            else:
+                targets.setdefault(data['status'], []).append((index, booking.pk))
+
+        now = timezone.now()
+        for target, entries in targets.items():
+            ids = [pk for _, pk in entries]
+            Booking.objects.filter(pk__in=ids).update(status=target, updated_at=now)
+            if target not in ACTIVE_STATUSES:
+                BookedNight.objects.filter(booking_id__in=ids).delete()
+            for index, pk in entries:
+                result.succeed(index, 'updated', pk)
+            notify_bookings([(pk, target) for _, pk in entries])
+        if targets:
+            invalidate('bookings')
+    return result
+
+
+def create_reviews(user, items):
+    """Create the valid reviews of a batch with one bulk insert.
+
+    The reviewer must have a completed booking of the listing, as required by
+    IsBookingGuest, and a booking can be reviewed once.
+    """
+    result = BulkResult(len(items))
+    valid = validate_items(BulkReviewSerializer, items, result)
+    listing_ids = {data['listing_id'] for data in valid.values()}
+    listings = Listing.objects.only('id').in_bulk(listing_ids)
+    completed = dict(
+        Booking.objects.filter(guest=user, status='completed', listing_id__in=listing_ids).values_list('pk', 'listing_id')
+    )
+    booking_ids = {data['booking_id'] for data in valid.values() if data.get('booking_id')}
+    reviewable = set(completed.values())
+    reviewed = set(Review.objects.filter(booking_id__in=booking_ids).values_list('booking_id', flat=True))
+
+    reviews = {}
+    for index, data in valid.items():
+        data.pop('id', None)
+        booking_id = data.get('booking_id')
+        if data['listing_id'] not in listings:
+            result.fail(index, {'listing_id': [f'Invalid pk "{data["listing_id"]}" - object does not exist.']})
+        elif data['listing_id'] not in reviewable:
+            result.fail(index, PERMISSION_DENIED)
+        elif booking_id and completed.get(booking_id) != data['listing_id']:
+            result.fail(index, {'booking_id': ['Must be one of your completed bookings of this listing.']})
+        elif booking_id and booking_id in reviewed:
+            result.fail(index, {'booking_id': ['This booking has already been reviewed.']})
+        else:
+            if booking_id:
+                reviewed.add(booking_id)
+            reviews[index] = Review(reviewer=user, **data)
+    if not reviews:
+        return result
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                # Refreshes the rating aggregates and cache tags of the listings
+                Review.objects.bulk_create(reviews.values())
+        except IntegrityError:
+            # A concurrent request reviewed one of the bookings first
+            for index, review in reviews.items():
+                review.pk = None
+                review._state.adding = True
+                try:
+                    with transaction.atomic():
+                        review.save()
+                except IntegrityError:
+                    result.fail(index, {'booking_id': ['This booking has already been reviewed.']})
+                else:
+                    result.succeed(index, 'created', review.pk)
+        else:
+            for index, review in reviews.items():
+                result.succeed(index, 'created', review.pk)
+    return result
+
+
+def update_reviews(user, items):
+    """Apply partial rating and comment updates with one bulk UPDATE"""
+    result = BulkResult(len(items))
+    valid = validate_items(BulkReviewSerializer, items, result, partial=True)
+    drop_duplicate_ids(valid, result)
+    reviews = Review.objects.in_bulk([data['id'] for data in valid.values()])
+
+    changed, fields = {}, {'updated_at'}
+    for index, data in valid.items():
+        review = reviews.get(data.pop('id'))
+        if review is None:
+            result.fail(index, NOT_FOUND)
+        elif not (user.is_staff or review.reviewer_id == user.pk):
+            result.fail(index, PERMISSION_DENIED)
+        elif {'listing_id', 'booking_id'} & set(data):
+            result.fail(index, {'non_field_errors': ['Only rating and comment can be changed in bulk.']})
+        else:
+            for name, value in data.items():
+                setattr(review, name, value)
+            changed[index] = review
+            fields.update(data)
+    if not changed:
+        return result
+
+    now = timezone.now()
+    for review in changed.values():
+        review.updated_at = now
+    with transaction.atomic():
+        # Goes through ReviewQuerySet.update, which keeps the listing aggregates in sync
+        Review.objects.bulk_update(changed.values(), sorted(fields))
+    for index, review in changed.items():
+        result.succeed(index, 'updated', review.pk)
+    return result
@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_http_date
+from rest_framework.response import Response
+from .conditional import conditional_response
+
+VERSION_KEY_PREFIX = 'listings:version:'
+
+
+class LocalLRUCache:
+    """Per-process LRU tier holding at most `max_entries` values"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache:
+    """Two-tier read cache (local LRU, then the shared Django cache) with tag versioning.
+
+    Every key embeds the current version of its tags, so bumping a tag's version
+    makes all entries built from it unreachable without deleting them.
+    """
+
+    def __init__(self):
+        self.local = LocalLRUCache(getattr(settings, 'LISTINGS_CACHE_LOCAL_SIZE', 1024))
+        self.lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'LISTINGS_CACHE_ENABLED', True)
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, 'LISTINGS_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'LISTINGS_CACHE_TIMEOUT', 300)
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        """Hit, miss and eviction counters of this process"""
+        with self.lock:
+            return dict(self.counters, evictions=self.local.evictions)
+
+    def versions(self, tags):
+        """Current version of each tag, fetched from the shared tier in one call"""
+        keys = [VERSION_KEY_PREFIX + tag for tag in tags]
+        found = self.shared.get_many(keys)
+        return [found.get(key, 0) for key in keys]
+
+    def bump(self, *tags):
+        """Invalidate every entry built from one of the tags"""
+        for tag in tags:
+            key = VERSION_KEY_PREFIX + tag
+            # add() is a no-op when the version exists; incr() is atomic on shared backends
+            self.shared.add(key, 0, timeout=None)
+            try:
+                self.shared.incr(key)
+            except ValueError:
+                self.shared.set(key, 1, timeout=None)
+
+    def make_key(self, name, tags, request):
+        """Cache key of a request from its absolute path, normalized query parameters and tag versions"""
+        params = sorted((key, sorted(request.query_params.getlist(key))) for key in request.query_params)
+        versions = self.versions(tags)
+        raw = repr((name, request.build_absolute_uri(request.path), params, list(zip(tags, versions))))
+        return 'listings:read:' + hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self.count('local_hits')
+            return value
+        value = self.shared.get(key)
+        if value is not None:
+            self.count('shared_hits')
+            self.local.set(key, value, self.timeout)
+            return value
+        self.count('misses')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value, self.timeout)
+        self.shared.set(key, value, self.timeout)
+
+
+listing_cache = TieredCache()
+
+
+def invalidate(*tags):
+    """Bump the tags once the current transaction commits, so readers never cache uncommitted state"""
+    transaction.on_commit(lambda: listing_cache.bump(*tags))
+
+
+def listing_tag(pk):
+    return f'listing:{pk}'
+
+
+class CachedReadMixin:
+    """ViewSet mixin serving list and retrieve responses from the tiered cache.
+
+    Views declare `cache_list_tags(request)` and `cache_detail_tags(pk)`.
+    Entries hold the response data with its ETag and Last-Modified headers,
+    under the same tag versions, so placed before ConditionalRequestMixin a
+    cache hit answers conditional requests without querying the database.
+    """
+
+    def cache_key(self, name, tags):
+        # The catalogue tag is bumped by queryset-wide writes that send no signals
+        return listing_cache.make_key(name, ['catalogue'] + list(tags), self.request)
+
+    def cached_response(self, name, tags, render):
+        if not listing_cache.enabled:
+            return render()
+        key = self.cache_key(name, tags)
+        entry = listing_cache.get(key)
+        # Entries of the async views carry no validators; render those again to add them
+        if entry is not None and entry[1] is not None:
+            data, etag, last_modified = entry
+            return conditional_response(
+                self.request, etag, last_modified and parse_http_date(last_modified), lambda: Response(data)
+            )
+        response = render()
+        if response.status_code == 200:
+            listing_cache.set(key, (response.data, response.get('ETag'), response.get('Last-Modified')))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            'list', self.cache_list_tags(request), lambda: super(CachedReadMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            'retrieve', self.cache_detail_tags(pk),
+            lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,124 @@
+import hashlib
+from calendar import timegm
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def validators(state, timestamps):
+    """ETag of a hashable state and Last-Modified timestamp of the latest of `timestamps`"""
+    etag = quote_etag(hashlib.sha1(repr(state).encode()).hexdigest())
+    present = [t for t in timestamps if t is not None]
+    last_modified = timegm(max(present).utctimetuple()) if present else None
+    return etag, last_modified
+
+
+def conditional_response(request, etag, last_modified, render):
+    """304 or 412 when the request's preconditions allow it, else the rendered response with its validators"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalRequestMixin:
+    """ViewSet mixin answering conditional requests from `updated_at` timestamps.
+
+    `etag_fields` lists the timestamp lookups that change when the serialized
+    representation changes. The validators of a detail response come from
+    one aggregate over its row, and those of a list response from the primary
+    keys and timestamps of the rows of the page it serves, so
+    If-None-Match / If-Modified-Since can be answered with a 304 and If-Match
+    on writes with a 412 when the client's copy is stale.
+    """
+    etag_fields = ['updated_at']
+
+    def compute_validators(self, queryset):
+        """Row count, ETag and Last-Modified timestamp of the rows of a queryset"""
+        aggregates = {f'last_{index}': Max(field) for index, field in enumerate(self.etag_fields)}
+        state = queryset.order_by().aggregate(rows=Count('pk', distinct=True), **aggregates)
+        timestamps = [state[f'last_{index}'] for index in range(len(self.etag_fields))]
+        etag, last_modified = validators(
+            (self.basename, state['rows'], [t and t.isoformat() for t in timestamps]), timestamps
+        )
+        return state['rows'], etag, last_modified
+
+    def page_validators(self, queryset):
+        """ETag and Last-Modified timestamp of the page of a list response.
+
+        The page is located like the paginator does, reading only the primary
+        keys and timestamps of its rows (and the row count on page-number
+        pages) with one query, instead of aggregating over every filtered row.
+        """
+        columns = self.etag_columns(queryset.model)
+        # Keep annotations such as a search distance available to the ordering, as the fast path does
+        rows = queryset.prefetch_related(None).select_related(None).values(
+            'pk', *queryset.query.annotation_select, **columns
+        )
+        paginator = self.pagination_class() if self.pagination_class is not None else None
+        rows = paginator.page_state(rows, self.request) if paginator is not None else list(rows)
+        timestamps = [row[column] for row in rows for column in columns]
+        return validators((self.basename, [tuple(row.values()) for row in rows]), timestamps)
+
+    def etag_columns(self, model):
+        """`values()` expressions of the etag fields, keyed by column name.
+
+        A timestamp behind a foreign key is read with a subquery on the
+        related primary key rather than through an inner join, so the
+        database can still walk the filtered table in page order instead of
+        driving the query from the related table.
+        """
+        columns = {}
+        for index, field in enumerate(self.etag_fields):
+            name, _, rest = field.partition('__')
+            relation = model._meta.get_field(name) if rest else None
+            if relation is not None and relation.many_to_one:
+                related = relation.related_model.objects.filter(pk=OuterRef(relation.attname))
+                columns[f'etag_{index}'] = Subquery(related.values(rest)[:1])
+            else:
+                columns[f'etag_{index}'] = F(field)
+        return columns
+
+    def conditional_response(self, queryset, render):
+        rows, etag, last_modified = self.compute_validators(queryset)
+        if not rows and self.detail:
+            # Unknown object, let the regular path answer with a 404
+            return render()
+        return conditional_response(self.request, etag, last_modified, render)
+
+    def detail_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        return queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.page_validators(self.filter_queryset(self.get_queryset()))
+        return conditional_response(
+            request, etag, last_modified,
+            lambda: super(ConditionalRequestMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.detail_queryset(),
+            lambda: super(ConditionalRequestMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def update(self, request, *args, **kwargs):
+        # Also used by partial_update
+        return self.conditional_response(
+            self.detail_queryset(),
+            lambda: super(ConditionalRequestMixin, self).update(request, *args, **kwargs)
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.detail_queryset(),
+            lambda: super(ConditionalRequestMixin, self).destroy(request, *args, **kwargs)
+        )
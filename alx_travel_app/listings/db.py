@@ -0,0 +1,219 @@
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.http import JsonResponse
+
+# Replication delay of a PostgreSQL standby in seconds, 0 when it has replayed everything it received
+POSTGRES_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_routing = contextvars.ContextVar('listings_db_routing', default=None)
+
+
+class RoutingState:
+    """Whether reads of the current request or task must go to the primary"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def routing_state():
+    state = _routing.get()
+    if state is None:
+        # Outside any scope: a write pins nothing, only open transactions keep reads on the primary
+        return RoutingState()
+    return state
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """Routing state of one unit of work (a request, a task, a command run), reset when it ends.
+
+    Its writes pin its later reads to the primary; the next unit starts
+    unpinned, so a long-running worker or command is not kept off the
+    replicas for good after its first write.
+    """
+    state = RoutingState(pinned)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def replica_aliases():
+    return getattr(settings, 'LISTINGS_READ_REPLICAS', [])
+
+
+def max_replica_lag():
+    return getattr(settings, 'LISTINGS_REPLICA_MAX_LAG_SECONDS', 5)
+
+
+def ping(alias):
+    """Run a trivial query; raises DatabaseError when the database is unreachable"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def replica_lag(alias):
+    """Replication delay of a replica in seconds; raises DatabaseError when it is unreachable"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        # SQLite replicas are files on the same host, e.g. the primary itself in development
+        ping(alias)
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaMonitor:
+    """Per-process view of the replicas that are reachable and within the tolerated lag.
+
+    Each replica is checked at most every LISTINGS_REPLICA_CHECK_SECONDS.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = {}
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError:
+            lag = None
+        with self.lock:
+            self.status[alias] = (time.monotonic(), lag)
+        return lag
+
+    def lag(self, alias):
+        interval = getattr(settings, 'LISTINGS_REPLICA_CHECK_SECONDS', 10)
+        with self.lock:
+            checked_at, lag = self.status.get(alias, (None, None))
+        if checked_at is None or time.monotonic() - checked_at >= interval:
+            lag = self.check(alias)
+        return lag
+
+    def usable(self):
+        """Replicas reads can be sent to right now"""
+        tolerated = max_replica_lag()
+        usable = []
+        for alias in replica_aliases():
+            lag = self.lag(alias)
+            if lag is not None and lag <= tolerated:
+                usable.append(alias)
+        return usable
+
+
+replica_monitor = ReplicaMonitor()
+
+
+class PrimaryReplicaRouter:
+    """Send reads of LISTINGS_REPLICA_MODELS to a healthy replica and everything else to the primary.
+
+    Bookings and booked nights are always read from the primary, so the
+    availability checks never see a stale calendar. A write pins the rest
+    of the request to the primary, as do open transactions and the
+    stickiness cookie set by ReplicaStickinessMiddleware after a write.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_aliases() or model._meta.label_lower not in self.replica_models():
+            return DEFAULT_DB_ALIAS
+        if routing_state().pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = replica_monitor.usable()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing_state()
+        state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        pool = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in replica_aliases():
+            return False
+        return None
+
+    def replica_models(self):
+        return getattr(settings, 'LISTINGS_REPLICA_MODELS', ['listings.listing', 'listings.review', 'auth.user'])
+
+
+class ReplicaStickinessMiddleware:
+    """Keep a client's reads on the primary while its writes may not have reached the replicas.
+
+    After a request that wrote, a cookie pins the client's following
+    requests to the primary for LISTINGS_REPLICA_MAX_LAG_SECONDS, the
+    largest lag of a replica the router still reads from.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing_scope(pinned=self.cookie_name in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        with routing_scope(pinned=self.cookie_name in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote and replica_aliases():
+            response.set_cookie(self.cookie_name, '1', max_age=max_replica_lag(), httponly=True, samesite='Lax')
+        return response
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created handler applying LISTINGS_SQLITE_PRAGMAS (WAL mode by default) to SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'LISTINGS_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def health_view(request):
+    """Reachability of every database and replication lag of the replicas; 503 when the primary is down"""
+    databases = {}
+    for alias in connections:
+        if alias in replica_aliases():
+            lag = replica_monitor.check(alias)
+            databases[alias] = {
+                'ok': lag is not None, 'lag_seconds': lag,
+                'serving_reads': lag is not None and lag <= max_replica_lag(),
+            }
+            continue
+        try:
+            ping(alias)
+            databases[alias] = {'ok': True}
+        except DatabaseError:
+            databases[alias] = {'ok': False}
+    status = 200 if databases[DEFAULT_DB_ALIAS]['ok'] else 503
+    return JsonResponse({'databases': databases}, status=status)
@@ -0,0 +1,248 @@
+import asyncio
+import decimal
+from django.conf import settings
+from django.db.models import ForeignKey
+from rest_framework import fields, relations, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .metrics import timed_serialization
+
+
+class NotCompilable(Exception):
+    """Raised when a serializer uses a field the fast path cannot reproduce"""
+
+
+def decimal_formatter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def format_decimal(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return format_decimal
+
+
+def datetime_formatter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != 'iso-8601' or timezone is None:
+        return field.to_representation
+
+    def format_datetime(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return format_datetime
+
+
+def date_formatter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != 'iso-8601':
+        return field.to_representation
+    return lambda value: value.isoformat()
+
+
+def file_formatter(field, model_field):
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return field.to_representation
+    storage = model_field.storage
+    request = field.context.get('request')
+
+    def format_file(value):
+        if not value:
+            return None
+        url = storage.url(value)
+        return request.build_absolute_uri(url) if request is not None else url
+    return format_file
+
+
+def scalar_formatter(field, model_field):
+    """Formatter reproducing field.to_representation for a raw column value"""
+    if isinstance(field, fields.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: choices.get(str(value), value)
+    if isinstance(field, fields.CharField):
+        return str
+    if isinstance(field, fields.BooleanField):
+        return bool
+    if isinstance(field, fields.IntegerField):
+        return int
+    if isinstance(field, fields.FloatField):
+        return float
+    if isinstance(field, fields.DecimalField):
+        return decimal_formatter(field)
+    if isinstance(field, fields.DateTimeField):
+        return datetime_formatter(field)
+    if isinstance(field, fields.DateField):
+        return date_formatter(field)
+    if isinstance(field, fields.FileField):
+        return file_formatter(field, model_field)
+    if isinstance(field, fields.ModelField) or type(field) in (fields.Field, fields.ReadOnlyField):
+        return field.to_representation
+    raise NotCompilable(f'Unsupported field {field.__class__.__name__}')
+
+
+class CompiledSerializer:
+    """Read-only compilation of a ModelSerializer working on values() rows.
+
+    Each output field becomes a column accessor plus a formatter reproducing
+    the DRF representation, and nested serializers are resolved with one
+    batched query per relation instead of per-object serializer calls.
+    """
+
+    def __init__(self, serializer):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        self.model = serializer.Meta.model
+        self.columns = [self.model._meta.pk.attname]
+        self.plan = []
+        self.relations = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.compile_field(name, field)
+
+    def compile_field(self, name, field):
+        if field.source == '*' or '.' in field.source:
+            raise NotCompilable(f'Unsupported source for {name}')
+        model_field = self.model._meta.get_field(field.source)
+
+        if isinstance(field, (serializers.BaseSerializer, relations.ManyRelatedField)):
+            if not isinstance(field, serializers.BaseSerializer):
+                raise NotCompilable(f'Unsupported relation {name}')
+            nested = CompiledSerializer(field)
+            if isinstance(model_field, ForeignKey) and not model_field.auto_created:
+                # Forward foreign key or one-to-one: fetch the related rows by id
+                self.add_column(model_field.attname)
+                self.relations.append((name, 'forward', model_field.attname, model_field.target_field.attname, nested))
+            elif model_field.one_to_many:
+                self.relations.append((name, 'many', None, model_field.field.attname, nested))
+            elif model_field.one_to_one and model_field.auto_created:
+                self.relations.append((name, 'reverse_one', None, model_field.field.attname, nested))
+            else:
+                raise NotCompilable(f'Unsupported relation {name}')
+            self.plan.append((name, None, None))
+            return
+
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            if field.pk_field is not None or not model_field.many_to_one and not model_field.one_to_one:
+                raise NotCompilable(f'Unsupported relation {name}')
+            self.add_column(model_field.attname)
+            self.plan.append((name, model_field.attname, lambda value: value))
+            return
+
+        if not model_field.concrete or model_field.is_relation:
+            raise NotCompilable(f'Unsupported field {name}')
+        self.add_column(model_field.attname)
+        self.plan.append((name, model_field.attname, scalar_formatter(field, model_field)))
+
+    @property
+    def field_names(self):
+        return [name for name, _, _ in self.plan]
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def fetch(self, queryset):
+        """values() rows of a queryset with the columns this serializer reads"""
+        # Keep annotations such as a search distance available to the ordering and pagination
+        return queryset.values(*self.columns, *queryset.query.annotation_select)
+
+    def relation_rows(self, relation, rows):
+        """values() queryset of the nested rows of a relation for a batch of rows, None when there are none"""
+        name, kind, column, remote, nested = relation
+        manager = nested.model._default_manager
+        if kind == 'forward':
+            ids = {row[column] for row in rows if row[column] is not None}
+            return nested.fetch(manager.filter(**{f'{remote}__in': ids})) if ids else None
+        ids = [row[self.model._meta.pk.attname] for row in rows]
+        columns = nested.columns if remote in nested.columns else nested.columns + [remote]
+        return manager.filter(**{f'{remote}__in': ids}).values(*columns) if ids else None
+
+    def relation_accessor(self, relation, found):
+        """Function returning the nested representation of a row from the serialized nested rows"""
+        name, kind, column, remote, nested = relation
+        pk = self.model._meta.pk.attname
+        if kind == 'forward':
+            by_id = {item_row[remote]: item for item_row, item in found}
+            return lambda row: by_id.get(row[column])
+        grouped = {}
+        for item_row, item in found:
+            grouped.setdefault(item_row[remote], []).append(item)
+        if kind == 'many':
+            return lambda row: grouped.get(row[pk], [])
+        return lambda row: grouped.get(row[pk], [None])[0]
+
+    def assemble(self, rows, related):
+        results = []
+        for row in rows:
+            item = {}
+            for name, column, formatter in self.plan:
+                if column is None:
+                    item[name] = related[name](row)
+                else:
+                    value = row[column]
+                    item[name] = None if value is None else formatter(value)
+            results.append((row, item))
+        return results
+
+    def serialize(self, rows):
+        """Representations of values() rows, resolving nested serializers in batches"""
+        rows = list(rows)
+        related = {}
+        for relation in self.relations:
+            nested_rows = self.relation_rows(relation, rows)
+            found = relation[4].serialize(nested_rows) if nested_rows is not None else []
+            related[relation[0]] = self.relation_accessor(relation, found)
+        return self.assemble(rows, related)
+
+    async def aserialize(self, rows):
+        """serialize() with the async ORM, fetching the nested relations concurrently"""
+        async def resolve(relation):
+            nested_rows = self.relation_rows(relation, rows)
+            if nested_rows is None:
+                return []
+            return await relation[4].aserialize([row async for row in nested_rows])
+
+        found = await asyncio.gather(*(resolve(relation) for relation in self.relations))
+        related = {
+            relation[0]: self.relation_accessor(relation, items) for relation, items in zip(self.relations, found)
+        }
+        return self.assemble(rows, related)
+
+    def to_representation(self, rows):
+        return timed_serialization(lambda: [item for _, item in self.serialize(rows)])
+
+
+class FastListMixin:
+    """ViewSet mixin serving read-only list responses through CompiledSerializer.
+
+    Falls back to the regular serializer when LISTINGS_FAST_SERIALIZATION is
+    off or the serializer cannot be compiled.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'LISTINGS_FAST_SERIALIZATION', True):
+            return super().list(request, *args, **kwargs)
+        try:
+            compiled = CompiledSerializer(self.get_serializer())
+        except NotCompilable:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).select_related(None)
+        rows = compiled.fetch(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.to_representation(page))
+        return Response(compiled.to_representation(rows))
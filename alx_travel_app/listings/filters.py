@@ -0,0 +1,167 @@
+import django_filters
+from django import forms
+from django.conf import settings
+from .amenities import amenity_bit, amenity_mask
+from .availability import filter_available
+from .geo import within_bbox, within_radius
+from .models import Listing, Booking, Review
+
+
+def parse_coordinates(value, count):
+    """Floats of a comma-separated parameter holding `count` numbers"""
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise forms.ValidationError(f"Expected {count} comma-separated numbers")
+    return numbers
+
+
+def check_latitude(value):
+    if not -90 <= value <= 90:
+        raise forms.ValidationError("Latitudes must be between -90 and 90")
+
+
+def check_longitude(value):
+    if not -180 <= value <= 180:
+        raise forms.ValidationError("Longitudes must be between -180 and 180")
+
+
+class ListingFilterForm(forms.Form):
+    """Form validating the stay and map parameters of the listings search"""
+
+    def clean_amenities(self):
+        value = self.cleaned_data.get('amenities')
+        if not value:
+            return None
+        try:
+            return amenity_mask(name.strip() for name in value.split(',') if name.strip())
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+
+    def clean_near(self):
+        value = self.cleaned_data.get('near')
+        if not value:
+            return None
+        latitude, longitude = parse_coordinates(value, 2)
+        check_latitude(latitude)
+        check_longitude(longitude)
+        return latitude, longitude
+
+    def clean_radius_km(self):
+        value = self.cleaned_data.get('radius_km')
+        if value is not None and value <= 0:
+            raise forms.ValidationError("The radius must be positive")
+        return value
+
+    def clean_bbox(self):
+        value = self.cleaned_data.get('bbox')
+        if not value:
+            return None
+        # GeoJSON order; min_lng > max_lng crosses the antimeridian
+        min_lng, min_lat, max_lng, max_lat = parse_coordinates(value, 4)
+        for latitude in (min_lat, max_lat):
+            check_latitude(latitude)
+        for longitude in (min_lng, max_lng):
+            check_longitude(longitude)
+        if min_lat > max_lat:
+            raise forms.ValidationError("The minimum latitude must not exceed the maximum latitude")
+        return min_lat, min_lng, max_lat, max_lng
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('radius_km') is not None and not cleaned_data.get('near'):
+            raise forms.ValidationError("radius_km requires near")
+        check_in = cleaned_data.get('check_in')
+        check_out = cleaned_data.get('check_out')
+        if bool(check_in) != bool(check_out):
+            raise forms.ValidationError("Both check_in and check_out are required to search by dates")
+        if check_in and check_in >= check_out:
+            raise forms.ValidationError("Check-out date must be after check-in date")
+        return cleaned_data
+
+
+class ListingFilter(django_filters.FilterSet):
+    """FilterSet for the listings endpoint"""
+    min_rating = django_filters.NumberFilter(field_name='average_rating', lookup_expr='gte')
+    max_rating = django_filters.NumberFilter(field_name='average_rating', lookup_expr='lte')
+    check_in = django_filters.DateFilter(method='filter_stay')
+    check_out = django_filters.DateFilter(method='filter_stay')
+    guests = django_filters.NumberFilter(field_name='max_guests', lookup_expr='gte')
+    amenities = django_filters.CharFilter(method='filter_amenities')
+    near = django_filters.CharFilter(method='filter_map')
+    radius_km = django_filters.NumberFilter(method='filter_map')
+    bbox = django_filters.CharFilter(method='filter_map')
+
+    class Meta:
+        model = Listing
+        form = ListingFilterForm
+        # The has_* filters are kept for compatibility; amenities=wifi,pool compiles to one bitwise predicate
+        fields = ['city', 'country', 'property_type', 'max_guests', 'bedrooms', 'bathrooms',
+                  'has_wifi', 'has_kitchen', 'has_air_conditioning', 'has_heating',
+                  'has_tv', 'has_parking', 'has_pool']
+
+    @classmethod
+    def filter_for_field(cls, field, field_name, lookup_expr='exact'):
+        if field_name.startswith('has_') and lookup_expr == 'exact':
+            # Answered from the indexed amenities bitmask rather than the unindexed boolean column
+            return django_filters.BooleanFilter(field_name=field_name, method='filter_has_amenity')
+        return super().filter_for_field(field, field_name, lookup_expr)
+
+    def filter_has_amenity(self, queryset, name, value):
+        mask = amenity_bit(name[len('has_'):])
+        return queryset.with_amenities(mask) if value else queryset.without_amenities(mask)
+
+    def filter_amenities(self, queryset, name, value):
+        # value is the mask built by ListingFilterForm.clean_amenities
+        return queryset.with_amenities(value) if value else queryset
+
+    def filter_stay(self, queryset, name, value):
+        # check_in and check_out are applied together in filter_queryset
+        return queryset
+
+    def filter_map(self, queryset, name, value):
+        # near, radius_km and bbox are applied together in filter_queryset
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        check_in = self.form.cleaned_data.get('check_in')
+        check_out = self.form.cleaned_data.get('check_out')
+        if check_in and check_out:
+            queryset = filter_available(queryset, check_in, check_out)
+        bbox = self.form.cleaned_data.get('bbox')
+        if bbox:
+            queryset = within_bbox(queryset, bbox)
+        near = self.form.cleaned_data.get('near')
+        if near:
+            radius_km = self.form.cleaned_data.get('radius_km') or getattr(settings, 'LISTINGS_DEFAULT_RADIUS_KM', 10)
+            # Closest first, unless the client asks for another ordering
+            queryset = within_radius(queryset, *near, float(radius_km)).order_by('distance_km', 'pk')
+        return queryset
+
+
+class BookingFilter(django_filters.FilterSet):
+    """FilterSet for bookings; start and end select the stays overlapping [start, end)"""
+    # A plain IN on the booking table, no DISTINCT needed
+    status = django_filters.MultipleChoiceFilter(choices=Booking.STATUS_CHOICES, distinct=False)
+    start = django_filters.DateFilter(field_name='check_out_date', lookup_expr='gt')
+    end = django_filters.DateFilter(field_name='check_in_date', lookup_expr='lt')
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Booking
+        fields = ['status', 'listing', 'guest']
+
+
+class ReviewFilter(django_filters.FilterSet):
+    """FilterSet for reviews"""
+    min_rating = django_filters.NumberFilter(field_name='rating', lookup_expr='gte')
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Review
+        fields = ['listing', 'reviewer', 'rating']
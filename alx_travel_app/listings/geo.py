@@ -0,0 +1,214 @@
+import math
+from django.conf import settings
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt, Substr
+from django.utils.module_loading import import_string
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Length of the stored Listing.geohash (cells of about 5 x 5 m)
+GEOHASH_PRECISION = 9
+# Most geohash cells OR-ed into the coarse filter of one search
+MAX_COVER_CELLS = 32
+
+# Approximate centres used by the offline geocoder, by lowercase city name
+CITY_CENTRES = {
+    'new york': (40.7128, -74.0060),
+    'los angeles': (34.0522, -118.2437),
+    'chicago': (41.8781, -87.6298),
+    'miami': (25.7617, -80.1918),
+    'san francisco': (37.7749, -122.4194),
+    'seattle': (47.6062, -122.3321),
+    'boston': (42.3601, -71.0589),
+    'austin': (30.2672, -97.7431),
+}
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        target, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (target[0] + target[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            target[0] = middle
+        else:
+            target[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def decode_geohash(geohash):
+    """(min_lat, min_lng, max_lat, max_lng) of a geohash cell"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            target = lng_range if even else lat_range
+            middle = (target[0] + target[1]) / 2
+            if value >> shift & 1:
+                target[0] = middle
+            else:
+                target[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size(precision):
+    """(height, width) in degrees of the geohash cells of a precision"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def split_bbox(bbox):
+    """Boxes not crossing the antimeridian; a bbox with min_lng > max_lng wraps around it"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    if min_lng <= max_lng:
+        return [bbox]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def cover_cells(bbox, precision):
+    """Geohash cells of a precision covering a bbox"""
+    height, width = cell_size(precision)
+    cells = set()
+    for min_lat, min_lng, max_lat, max_lng in split_bbox(bbox):
+        # Start from the cell containing the south-west corner
+        lat = math.floor((min_lat + 90) / height) * height - 90
+        while lat <= max_lat:
+            lng = math.floor((min_lng + 180) / width) * width - 180
+            while lng <= max_lng:
+                cells.add(encode_geohash(min(lat + height / 2, 90.0), min(lng + width / 2, 180.0), precision))
+                lng += width
+            lat += height
+    return cells
+
+
+def cover(bbox):
+    """Finest set of at most MAX_COVER_CELLS geohash cells covering a bbox"""
+    best = {''}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cells = cover_cells(bbox, precision)
+        if len(cells) > MAX_COVER_CELLS:
+            break
+        best = cells
+    return best
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Bounding box of a circle"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        # The circle reaches a pole or goes round the earth
+        return min_lat, -180.0, max_lat, 180.0
+    lng_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    min_lng = (longitude - lng_delta + 540) % 360 - 180
+    max_lng = (longitude + lng_delta + 540) % 360 - 180
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def geohash_condition(cells):
+    """Index range predicates matching the geohashes starting with one of the cells"""
+    condition = Q()
+    for cell in cells:
+        # '~' sorts after every geohash character
+        condition |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+    return condition
+
+
+def bbox_condition(bbox):
+    """Exact predicate of the points inside a bbox"""
+    condition = Q()
+    for min_lat, min_lng, max_lat, max_lng in split_bbox(bbox):
+        condition |= Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+    return condition
+
+
+def distance_expression(latitude, longitude):
+    """Haversine distance in km from a point to the listing coordinates"""
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    half_dlat = (Radians(F('latitude')) - lat1) / 2
+    half_dlng = (Radians(F('longitude')) - lng1) / 2
+    a = Power(Sin(half_dlat), 2) + math.cos(lat1) * Cos(Radians(F('latitude'))) * Power(Sin(half_dlng), 2)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def within_bbox(queryset, bbox):
+    """Listings inside a bbox: geohash index ranges first, then the exact coordinates"""
+    return queryset.filter(geohash_condition(cover(bbox))).filter(bbox_condition(bbox))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Listings within radius_km of a point, annotated with distance_km"""
+    queryset = within_bbox(queryset, radius_bbox(latitude, longitude, radius_km))
+    return queryset.annotate(distance_km=distance_expression(latitude, longitude)).filter(distance_km__lte=radius_km)
+
+
+def cluster_precision(bbox):
+    """Geohash length of the clusters of a map viewport, one level finer than its cover"""
+    return min(max(len(cell) for cell in cover(bbox)) + 1, GEOHASH_PRECISION)
+
+
+def clusters(queryset, precision):
+    """Listings grouped by geohash cell, with the count, centroid and price range of each cell"""
+    cells = queryset.exclude(geohash='').order_by().annotate(cell=Substr('geohash', 1, precision))
+    rows = cells.values('cell').annotate(
+        count=Count('pk'),
+        centre_latitude=Avg('latitude'),
+        centre_longitude=Avg('longitude'),
+        min_price=Min('price_per_night'),
+        max_price=Max('price_per_night'),
+        listing_id=Min('pk'),
+    ).order_by('cell')
+    return [
+        {
+            'geohash': row['cell'],
+            'count': row['count'],
+            'latitude': row['centre_latitude'],
+            'longitude': row['centre_longitude'],
+            # Same string format as the serialized prices
+            'min_price': f"{row['min_price']:.2f}",
+            'max_price': f"{row['max_price']:.2f}",
+            # Single-listing cells can be drawn as the listing itself
+            'listing_id': row['listing_id'] if row['count'] == 1 else None,
+        }
+        for row in rows
+    ]
+
+
+def offline_geocoder(address, city, country):
+    """Geocoder working without network access: the centre of known cities"""
+    return CITY_CENTRES.get(city.strip().lower())
+
+
+def geocode(address, city, country):
+    """(latitude, longitude) of an address from the LISTINGS_GEOCODER callable, None when unknown"""
+    geocoder = getattr(settings, 'LISTINGS_GEOCODER', 'listings.geo.offline_geocoder')
+    if not geocoder:
+        return None
+    return import_string(geocoder)(address, city, country)
+
+
+def locate(listing):
+    """Fill in missing coordinates with the geocoder and refresh the geohash of a listing"""
+    if listing.latitude is None or listing.longitude is None:
+        point = geocode(listing.address, listing.city, listing.country)
+        if point is not None:
+            listing.latitude, listing.longitude = point
+    if listing.latitude is None or listing.longitude is None:
+        listing.geohash = ''
+    else:
+        listing.geohash = encode_geohash(listing.latitude, listing.longitude)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .cache import invalidate
+from .models import BookedNight, Booking
+from .tasks import notify_bookings
+
+
+def expired_holds(now=None):
+    """Pending bookings created more than LISTINGS_PENDING_HOLD_HOURS ago, oldest first"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=getattr(settings, 'LISTINGS_PENDING_HOLD_HOURS', 24))
+    # Served by the (status, created_at) index
+    return Booking.objects.filter(status='pending', created_at__lt=cutoff).order_by('created_at', 'pk')
+
+
+def finished_stays(today=None):
+    """Confirmed bookings whose check-out date has come, earliest first"""
+    today = today or timezone.localdate()
+    # Served by the (status, check_out_date) index
+    return Booking.objects.filter(status='confirmed', check_out_date__lte=today).order_by('check_out_date', 'pk')
+
+
+def transition_in_batches(bookings, target, batch_size, event=None):
+    """Move the bookings of a queryset to `target` with one UPDATE per batch, yielding the batch sizes.
+
+    Each batch is its own short transaction that also frees the booked
+    nights. The selected rows stay locked until the UPDATE, and the queryset
+    no longer matches them afterwards, so every batch picks up where the
+    previous one ended. Rows locked by a request changing them concurrently
+    are skipped on databases that support it, and left for the next run.
+    """
+    using = router.db_for_write(Booking)
+    skip_locked = connections[using].features.has_select_for_update_skip_locked
+    while True:
+        with transaction.atomic(using=using):
+            batch = bookings.using(using).select_for_update(skip_locked=skip_locked)
+            ids = list(batch.values_list('pk', flat=True)[:batch_size])
+            if ids:
+                Booking.objects.using(using).filter(pk__in=ids).update(status=target, updated_at=timezone.now())
+                BookedNight.objects.using(using).filter(booking_id__in=ids).delete()
+                invalidate('bookings')
+                if event is not None:
+                    notify_bookings([(pk, event) for pk in ids])
+        yield len(ids)
+        if len(ids) < batch_size:
+            return
+
+
+def expire_holds(batch_size, now=None):
+    """Cancel the pending bookings past their hold, freeing their nights; yields the batch sizes"""
+    return transition_in_batches(expired_holds(now), 'cancelled', batch_size, event='expired')
+
+
+def complete_stays(batch_size, today=None):
+    """Mark the confirmed bookings whose check-out date has come as completed; yields the batch sizes"""
+    return transition_in_batches(finished_stays(today), 'completed', batch_size)
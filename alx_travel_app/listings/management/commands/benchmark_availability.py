@@ -0,0 +1,101 @@
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from listings.availability import filter_available
+from listings.management.commands.benchmark_read_path import asgi_get, load
+from listings.models import Booking, Listing
+
+
+def timed(total, function):
+    """Median duration of `total` calls of a function"""
+    durations = []
+    for _ in range(total):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+# Days from today to the check-in of the searched stays; the seeded stays start 30 days ago
+STAY_OFFSETS = [7, 30, 180]
+
+
+class Command(BaseCommand):
+    help = ('Reports the latency of the date-range availability search (?check_in=&check_out=&guests=) '
+            'on /api/listings/, seeding bookings up to --bookings first')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bookings',
+            default=100000,
+            type=int,
+            help='Number of bookings to search against, the missing ones are seeded'
+        )
+        parser.add_argument(
+            '--nights',
+            default=5,
+            type=int,
+            help='Length of the searched stays'
+        )
+        parser.add_argument(
+            '--guests',
+            default=2,
+            type=int,
+            help='Number of guests of the searched stays'
+        )
+        parser.add_argument(
+            '--requests',
+            default=50,
+            type=int,
+            help='Number of requests per searched stay'
+        )
+
+    def handle(self, *args, **options):
+        if not Listing.objects.exists():
+            raise CommandError('No listings to search, run the seed command first')
+        missing = options['bookings'] - Booking.objects.count()
+        if missing > 0:
+            self.stdout.write(f'Seeding {missing} bookings')
+            call_command('seed', users=0, listings=0, bookings=missing, reviews=0, seed=0, stdout=self.stdout)
+        total = max(1, options['requests'])
+        nights, guests = max(1, options['nights']), max(1, options['guests'])
+        today = date.today()
+        cases = [('no dates', None, None)] + [
+            (f'in {offset} days', today + timedelta(days=offset), today + timedelta(days=offset + nights))
+            for offset in STAY_OFFSETS
+        ]
+        application = get_asgi_application()
+
+        self.stdout.write(
+            f'{Booking.objects.count()} bookings, {Listing.objects.count()} listings, '
+            f'{nights} night stays for {guests} guests, {total} requests per stay'
+        )
+        self.stdout.write(
+            f"{'stay':<14}{'free':>8}{'page ms':>9}{'count ms':>10}{'page req ms':>13}{'cursor req ms':>15}{'errors':>8}"
+        )
+        with override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None):
+            for label, check_in, check_out in cases:
+                listings = Listing.objects.filter(max_guests__gte=guests)
+                query_string = f'guests={guests}'
+                if check_in:
+                    listings = filter_available(listings, check_in, check_out)
+                    query_string += f'&check_in={check_in.isoformat()}&check_out={check_out.isoformat()}'
+                # The search query alone: the first page, then the count page-number pagination adds
+                page = timed(total, lambda: list(listings.order_by('-created_at', '-pk').values_list('pk', flat=True)[:10]))
+                count = timed(total, listings.count)
+                requests, errors = [], 0
+                for extra in ['', '&pagination=cursor']:
+                    # One warm-up request compiles the URL resolver and opens the connection
+                    asyncio.run(asgi_get(application, '/api/listings/', query_string + extra))
+                    latencies, _, failed = asyncio.run(load(application, '/api/listings/', query_string + extra, total, 1))
+                    requests.append(statistics.median(latencies))
+                    errors += failed
+                self.stdout.write(
+                    f'{label:<14}{listings.count():>8}{page * 1000:>9.1f}{count * 1000:>10.1f}'
+                    f'{requests[0] * 1000:>13.1f}{requests[1] * 1000:>15.1f}{errors:>8}'
+                )
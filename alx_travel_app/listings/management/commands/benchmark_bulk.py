@@ -0,0 +1,109 @@
+import time
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+from listings.bulk import MAX_ITEMS
+from listings.models import Listing
+
+# Far enough ahead to be free on every listing
+CHECK_IN = date(2100, 1, 1)
+
+
+class Command(BaseCommand):
+    help = ('Compares the throughput of the bulk booking endpoints with one request per booking, '
+            'for creations and updates; every write is rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items',
+            default=500,
+            type=int,
+            help='Number of bookings created, then updated, by each path'
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=100,
+            type=int,
+            help=f'Bookings per bulk request, at most LISTINGS_BULK_MAX_ITEMS ({MAX_ITEMS})'
+        )
+
+    def handle(self, *args, **options):
+        self.guest = User.objects.filter(is_staff=False).order_by('pk').first()
+        if self.guest is None:
+            raise CommandError('No guest to book with, run the seed command first')
+        count = max(1, options['items'])
+        listings = list(
+            Listing.objects.exclude(host=self.guest).filter(max_guests__gte=2).order_by('pk').values_list('pk', flat=True)[:count]
+        )
+        if len(listings) < count:
+            raise CommandError(f'{count} bookings need {count} listings, run the seed command first')
+        batch_size = min(max(1, options['batch_size']), MAX_ITEMS)
+        # One stay per listing, so that no item conflicts with another
+        self.items = [
+            {'listing_id': pk, 'check_in_date': CHECK_IN.isoformat(),
+             'check_out_date': (CHECK_IN + timedelta(days=3)).isoformat(), 'guests_count': 2}
+            for pk in listings
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+        self.stdout.write(f'{count} bookings, {batch_size} per bulk request')
+        self.stdout.write(f"{'operation':<11}{'path':<8}{'requests':>10}{'seconds':>10}{'items/s':>10}{'failed':>8}")
+        with override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None):
+            for path, create, update in [
+                ('single', self.create_single, self.update_single),
+                ('bulk', self.create_bulk, self.update_bulk),
+            ]:
+                with transaction.atomic():
+                    ids = self.run('create', path, lambda: create(batch_size))
+                    self.run('update', path, lambda: update(ids, batch_size))
+                    transaction.set_rollback(True)
+
+    def run(self, operation, path, function):
+        """Time a function returning (request count, created or updated ids, failed item count)"""
+        start = time.perf_counter()
+        requests, ids, failed = function()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{operation:<11}{path:<8}{requests:>10}{elapsed:>10.2f}{len(self.items) / elapsed:>10.1f}{failed:>8}'
+        )
+        return ids
+
+    def create_single(self, batch_size):
+        ids = []
+        for item in self.items:
+            response = self.client.post('/api/bookings/', item, format='json')
+            if response.status_code == 201:
+                ids.append(response.data['id'])
+        return len(self.items), ids, len(self.items) - len(ids)
+
+    def create_bulk(self, batch_size):
+        requests, ids = 0, []
+        for start in range(0, len(self.items), batch_size):
+            response = self.client.post('/api/bookings/bulk/', self.items[start:start + batch_size], format='json')
+            requests += 1
+            ids += [item['id'] for item in response.data['results'] if item['status'] != 'failed']
+        return requests, ids, len(self.items) - len(ids)
+
+    def updates(self, ids):
+        """The items with one guest less, sent whole since the single-item path validates every field"""
+        return [dict(item, id=pk, guests_count=1) for pk, item in zip(ids, self.items)]
+
+    def update_single(self, ids, batch_size):
+        failed = 0
+        for item in self.updates(ids):
+            response = self.client.put(f"/api/bookings/{item['id']}/", item, format='json')
+            failed += response.status_code != 200
+        return len(ids), ids, failed
+
+    def update_bulk(self, ids, batch_size):
+        requests, failed, updates = 0, 0, self.updates(ids)
+        for start in range(0, len(updates), batch_size):
+            items = updates[start:start + batch_size]
+            response = self.client.patch('/api/bookings/bulk/', items, format='json')
+            requests += 1
+            failed += response.data['failed']
+        return requests, ids, failed
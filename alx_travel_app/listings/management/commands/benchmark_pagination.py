@@ -0,0 +1,87 @@
+import asyncio
+import statistics
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from listings.management.commands.benchmark_read_path import asgi_get, load, percentile
+from listings.models import Listing, Review
+from listings.pagination import KeysetPagination
+
+ENDPOINTS = {
+    'listings': ('/api/listings/', Listing),
+    'reviews': ('/api/reviews/', Review),
+}
+
+
+def deep_cursor_query(queryset, path, offset):
+    """Query string of the keyset page starting after `offset` rows, as its `next` link would hold it"""
+    paginator = KeysetPagination()
+    paginator.base_url = f'http://localhost{path}?pagination=cursor'
+    paginator.field, paginator.descending = paginator.get_ordering(queryset)
+    paginator.pk_column = queryset.model._meta.pk.attname
+    ordering = ('-' if paginator.descending else '') + paginator.field
+    pk_ordering = '-pk' if paginator.descending else 'pk'
+    row = queryset.order_by(ordering, pk_ordering).values(paginator.field, paginator.pk_column)[offset - 1]
+    return paginator.encode_cursor(row, reverse=False).partition('?')[2]
+
+
+class Command(BaseCommand):
+    help = ('Compares the latency of the first and of a deep page (10,000 by default) '
+            'under page-number and cursor pagination')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint',
+            default='listings',
+            choices=sorted(ENDPOINTS),
+            help='List endpoint to page through'
+        )
+        parser.add_argument(
+            '--page',
+            default=10000,
+            type=int,
+            help='Deep page number compared with the first page'
+        )
+        parser.add_argument(
+            '--page-size',
+            default=10,
+            type=int,
+            help='Rows per page'
+        )
+        parser.add_argument(
+            '--requests',
+            default=50,
+            type=int,
+            help='Number of requests per page and pagination mode'
+        )
+
+    def handle(self, *args, **options):
+        path, model = ENDPOINTS[options['endpoint']]
+        page, page_size = max(2, options['page']), max(1, options['page_size'])
+        offset = (page - 1) * page_size
+        if model.objects.count() <= offset:
+            raise CommandError(
+                f'Page {page} of {page_size} rows needs more than {offset} {options["endpoint"]}, '
+                f'run the seed command first'
+            )
+        total = max(1, options['requests'])
+        size = f'page_size={page_size}'
+        cases = [
+            ('page', 'first', size),
+            ('page', f'page {page}', f'{size}&page={page}'),
+            ('cursor', 'first', f'{size}&pagination=cursor'),
+            ('cursor', f'page {page}', f'{size}&{deep_cursor_query(model.objects.all(), path, offset)}'),
+        ]
+        application = get_asgi_application()
+
+        self.stdout.write(f'{path}, {page_size} rows per page, {total} requests per case')
+        self.stdout.write(f"{'pagination':<12}{'page':<12}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'errors':>8}")
+        with override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None):
+            for mode, label, query_string in cases:
+                # One warm-up request compiles the URL resolver and opens the connection
+                asyncio.run(asgi_get(application, path, query_string))
+                latencies, _, errors = asyncio.run(load(application, path, query_string, total, 1))
+                self.stdout.write(
+                    f'{mode:<12}{label:<12}{statistics.median(latencies) * 1000:>9.1f}'
+                    f'{percentile(latencies, 0.95) * 1000:>9.1f}{max(latencies) * 1000:>9.1f}{errors:>8}'
+                )
@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from listings.fastpath import CompiledSerializer
+from listings.management.commands.benchmark_availability import timed
+from listings.management.commands.benchmark_read_path import asgi_get, load
+from listings.models import Listing
+from listings.serializers import ListingSerializer
+from listings.views import ListingViewSet
+
+VARIANTS = [
+    # Every field, host and reviews included, as list pages were before the summary serializer
+    ('full', 'fields=' + ','.join(ListingSerializer.Meta.fields)),
+    ('summary', ''),
+    ('card', 'fields=id,title,price_per_night,image'),
+]
+
+
+def list_view(query_string):
+    """ListingViewSet set up for a list request with the given query string"""
+    view = ListingViewSet(action_map={'get': 'list'}, args=(), kwargs={}, format_kwarg=None)
+    view.request = view.initialize_request(APIRequestFactory().get(f'/api/listings/?{query_string}'))
+    return view
+
+
+class Command(BaseCommand):
+    help = ('Reports the payload size and serialization time of a /api/listings/ page '
+            'for the full, summary and sparse representations')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            default=10,
+            type=int,
+            help='Rows per page'
+        )
+        parser.add_argument(
+            '--ordering',
+            default='-review_count',
+            help='Ordering of the page, the most reviewed listings by default'
+        )
+        parser.add_argument(
+            '--requests',
+            default=50,
+            type=int,
+            help='Number of requests and serializations per representation'
+        )
+
+    def handle(self, *args, **options):
+        if not Listing.objects.exists():
+            raise CommandError('No listings to serialize, run the seed command first')
+        page_size = max(1, options['page_size'])
+        total = max(1, options['requests'])
+        renderer = JSONRenderer()
+        application = get_asgi_application()
+
+        self.stdout.write(f"/api/listings/?ordering={options['ordering']}, {page_size} rows per page, {total} runs each")
+        self.stdout.write(
+            f"{'representation':<16}{'bytes':>9}{'serializer ms':>15}{'compiled ms':>13}{'request ms':>12}{'errors':>8}"
+        )
+        with override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None):
+            for label, fields in VARIANTS:
+                query_string = f"ordering={options['ordering']}&page_size={page_size}"
+                if fields:
+                    query_string += f'&{fields}'
+                view = list_view(query_string)
+                queryset = view.filter_queryset(view.get_queryset())
+                # ModelSerializer and JSONRenderer over the page with its prefetches already fetched
+                page = list(queryset[:page_size])
+                serializer = timed(total, lambda: renderer.render(view.get_serializer(page, many=True).data))
+                # The fast path, including its batched queries of the nested relations
+                compiled = CompiledSerializer(view.get_serializer())
+                rows = list(compiled.fetch(queryset.prefetch_related(None).select_related(None))[:page_size])
+                fast = timed(total, lambda: renderer.render(compiled.to_representation(rows)))
+
+                # One warm-up request compiles the URL resolver and opens the connection
+                _, body = asyncio.run(asgi_get(application, '/api/listings/', query_string))
+                latencies, _, errors = asyncio.run(load(application, '/api/listings/', query_string, total, 1))
+                self.stdout.write(
+                    f'{label:<16}{len(body):>9}{serializer * 1000:>15.2f}{fast * 1000:>13.2f}'
+                    f'{statistics.median(latencies) * 1000:>12.1f}{errors:>8}'
+                )
@@ -0,0 +1,113 @@
+import asyncio
+import statistics
+import time
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from listings.models import Listing, Review
+
+
+async def asgi_get(application, path, query_string=''):
+    """Status and body of a GET request sent straight to the ASGI application"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(),
+        'headers': [(b'host', b'localhost'), (b'accept', b'application/json')],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+    }
+    response = {'status': None, 'body': []}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+
+    await application(scope, receive, send)
+    return response['status'], b''.join(response['body'])
+
+
+async def load(application, path, query_string, total, concurrency):
+    """Latencies of `total` requests sent by `concurrency` concurrent clients, wall time and error count"""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def client():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            status, _ = await asgi_get(application, path, query_string)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start, errors
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = ('Load-tests the sync and async read endpoints through the ASGI application, '
+            'reporting requests per second and tail latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            default=1000,
+            type=int,
+            help='Number of requests sent to each endpoint'
+        )
+        parser.add_argument(
+            '--concurrency',
+            default=50,
+            type=int,
+            help='Number of concurrent clients'
+        )
+        parser.add_argument(
+            '--query',
+            default='',
+            help='Query string added to the list requests, e.g. page_size=50'
+        )
+        parser.add_argument(
+            '--cache',
+            action='store_true',
+            help='Keep the response cache enabled (by default every request is computed)'
+        )
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.order_by('-review_count').values_list('pk', flat=True).first()
+        review = Review.objects.values_list('pk', flat=True).first()
+        if listing is None or review is None:
+            raise CommandError('No listings or reviews to read, run the seed command first')
+        pairs = [
+            ('listing list', '/api/listings/', '/api/async/listings/', options['query']),
+            ('listing detail', f'/api/listings/{listing}/', f'/api/async/listings/{listing}/', ''),
+            ('review list', '/api/reviews/', '/api/async/reviews/', options['query']),
+            ('review detail', f'/api/reviews/{review}/', f'/api/async/reviews/{review}/', ''),
+        ]
+        total = max(1, options['requests'])
+        concurrency = max(1, options['concurrency'])
+        application = get_asgi_application()
+
+        self.stdout.write(f'{total} requests per endpoint, {concurrency} concurrent clients')
+        self.stdout.write(f"{'endpoint':<16}{'path':<7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        with override_settings(LISTINGS_CACHE_ENABLED=options['cache'], LISTINGS_SLOW_REQUEST_MS=None):
+            for name, sync_path, async_path, query_string in pairs:
+                for label, path in [('sync', sync_path), ('async', async_path)]:
+                    # One warm-up request compiles the URL resolver and opens the connections
+                    asyncio.run(asgi_get(application, path, query_string))
+                    latencies, elapsed, errors = asyncio.run(load(application, path, query_string, total, concurrency))
+                    self.stdout.write(
+                        f'{name:<16}{label:<7}{total / elapsed:>9.1f}'
+                        f'{statistics.median(latencies) * 1000:>9.1f}'
+                        f'{percentile(latencies, 0.95) * 1000:>9.1f}'
+                        f'{percentile(latencies, 0.99) * 1000:>9.1f}{errors:>8}'
+                    )
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import statistics
+from urllib.parse import urlencode
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from listings.management.commands.benchmark_read_path import asgi_get, load, percentile
+from listings.models import Listing
+from listings.search import BACKENDS
+
+# A frequent word, two words, a city, a word prefix and a word of no listing, on seeded data
+QUERIES = ['work', 'work ball', 'boston', 'respons', 'zzyzx']
+
+
+class Command(BaseCommand):
+    help = ('Compares ?search= on /api/listings/ answered by the full-text index with '
+            "DRF's SearchFilter (LISTINGS_FULL_TEXT_SEARCH = False)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query',
+            action='append',
+            help='Search query, repeat for several (defaults to a set of queries matching the seeded data)'
+        )
+        parser.add_argument(
+            '--requests',
+            default=20,
+            type=int,
+            help='Number of requests per query and engine'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in BACKENDS:
+            raise CommandError(f'No full-text index on {connection.vendor}, nothing to compare')
+        if not Listing.objects.exists():
+            raise CommandError('No listings to search, run the seed command first')
+        queries = options['query'] or QUERIES
+        total = max(1, options['requests'])
+        application = get_asgi_application()
+
+        self.stdout.write(f'{Listing.objects.count()} listings, {total} requests per query and engine')
+        self.stdout.write(f"{'query':<16}{'engine':<14}{'matches':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for query in queries:
+            query_string = urlencode({'search': query})
+            for engine, full_text in [('full-text', True), ('SearchFilter', False)]:
+                with override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None,
+                                       LISTINGS_FULL_TEXT_SEARCH=full_text):
+                    # One warm-up request compiles the URL resolver and opens the connection
+                    status, body = asyncio.run(asgi_get(application, '/api/listings/', query_string))
+                    matches = json.loads(body)['count'] if status == 200 else '-'
+                    latencies, _, errors = asyncio.run(load(application, '/api/listings/', query_string, total, 1))
+                self.stdout.write(
+                    f'{query:<16}{engine:<14}{matches:>9}{statistics.median(latencies) * 1000:>9.1f}'
+                    f'{percentile(latencies, 0.95) * 1000:>9.1f}{errors:>8}'
+                )
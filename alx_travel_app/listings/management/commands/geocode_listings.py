@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from listings.geo import locate
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Fills in missing listing coordinates with the LISTINGS_GEOCODER and refreshes the geohashes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=500,
+            type=int,
+            help='Number of listings updated per query'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        missing = Listing.objects.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+        ids = list(missing.values_list('pk', flat=True))
+        located = 0
+        for start in range(0, len(ids), batch_size):
+            listings = Listing.objects.filter(pk__in=ids[start:start + batch_size])
+            listings = list(listings.only('pk', 'address', 'city', 'country', 'latitude', 'longitude'))
+            for listing in listings:
+                locate(listing)
+            listings = [listing for listing in listings if listing.geohash]
+            if listings:
+                Listing.objects.bulk_update(listings, ['latitude', 'longitude', 'geohash'])
+            located += len(listings)
+        # Listings that already had coordinates but no geohash, e.g. written with raw SQL
+        Listing.objects.filter(latitude__isnull=False, longitude__isnull=False, geohash='').refresh_geohashes()
+        self.stdout.write(self.style.SUCCESS(f'Geocoded {located} of {len(ids)} listings without coordinates'))
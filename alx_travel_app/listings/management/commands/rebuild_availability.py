@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from listings.availability import ACTIVE_STATUSES, rebuild_booked_nights
+from listings.models import BookedNight, Booking
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the booked nights table from the active bookings'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        BookedNight.objects.all().delete()
+        bookings = Booking.objects.filter(status__in=ACTIVE_STATUSES).order_by('created_at', 'pk')
+        # Bookings loaded from the database would delete their (already removed) nights first
+        conflicts = rebuild_booked_nights(bookings)
+
+        for booking in conflicts:
+            self.stdout.write(self.style.WARNING(
+                f'Booking {booking.pk} overlaps an earlier booking of listing {booking.listing_id}'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {BookedNight.objects.count()} booked nights ({len(conflicts)} conflicting bookings skipped)'
+        ))
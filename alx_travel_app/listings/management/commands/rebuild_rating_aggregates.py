@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, Q, Sum
+from listings.cache import invalidate
+from listings.models import Listing, RATING_VALUES
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized listing rating aggregates from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report listings whose stored aggregates drifted, without fixing them'
+        )
+
+    def handle(self, *args, **options):
+        drifted = self.find_drifted_listings()
+        self.stdout.write(f'Found {len(drifted)} listings with drifted rating aggregates')
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f'Rating aggregates drifted for listings: {", ".join(map(str, drifted))}')
+            return
+
+        updated = Listing.objects.all().refresh_rating_aggregates()
+        invalidate('catalogue')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} listings'))
+
+    def find_drifted_listings(self):
+        """Compare the stored aggregates with the values computed from the reviews"""
+        computed = {
+            'actual_count': Count('reviews'),
+            'actual_sum': Sum('reviews__rating'),
+            'actual_average': Avg('reviews__rating'),
+        }
+        for rating in RATING_VALUES:
+            computed[f'actual_{rating}'] = Count('reviews', filter=Q(reviews__rating=rating))
+
+        drifted = []
+        for listing in Listing.objects.order_by('pk').annotate(**computed).iterator():
+            expected = [listing.actual_count, listing.actual_sum or 0]
+            stored = [listing.review_count, listing.rating_sum]
+            for rating in RATING_VALUES:
+                expected.append(getattr(listing, f'actual_{rating}'))
+                stored.append(getattr(listing, f'rating_{rating}_count'))
+            average_drifted = (listing.actual_average is None) != (listing.average_rating is None) or (
+                listing.actual_average is not None and abs(listing.actual_average - listing.average_rating) > 1e-9
+            )
+            if expected != stored or average_drifted:
+                drifted.append(listing.pk)
+        return drifted
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from listings.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the listings full-text index from the listing table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database to rebuild the index of'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_backend(using)
+        if backend is None:
+            raise CommandError(f'No full-text backend for the {connections[using].vendor} database engine')
+        with transaction.atomic(using=using):
+            backend.rebuild(connections[using])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the listings full-text index ({connections[using].vendor})'))
@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from listings.taskqueue import Worker
+
+
+class Command(BaseCommand):
+    help = ('Runs the background tasks of the database task backend (LISTINGS_TASK_BACKEND = "database"), '
+            'reporting throughput periodically')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=100,
+            type=int,
+            help='Number of tasks claimed at once'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            default=1.0,
+            type=float,
+            help='Seconds to wait when no task is due'
+        )
+        parser.add_argument(
+            '--report-interval',
+            default=60.0,
+            type=float,
+            help='Seconds between two throughput reports'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no task is due instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(batch_size=max(1, options['batch_size']))
+        started = reported_at = time.monotonic()
+        reported = 0
+        try:
+            while True:
+                ran = worker.run_batch()
+                # Drop connections broken or past CONN_MAX_AGE, as the request cycle does
+                close_old_connections()
+                now = time.monotonic()
+                if now - reported_at >= options['report_interval']:
+                    self.report(worker.processed - reported, worker.failed, now - reported_at)
+                    reported, reported_at = worker.processed, now
+                if not ran:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.report(worker.processed, worker.failed, time.monotonic() - started, total=True)
+
+    def report(self, processed, failed, elapsed, total=False):
+        rate = processed / elapsed if elapsed else 0.0
+        label = 'Total' if total else 'Last interval'
+        self.stdout.write(f'{label}: {processed} tasks in {elapsed:.1f}s ({rate:.1f}/s), {failed} failures so far')
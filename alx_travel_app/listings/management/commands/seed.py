@@ -1,12 +1,80 @@
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.db import transaction
-from listings.models import Listing, Booking, Review
+from django.db.models import Max
+from listings.availability import ACTIVE_STATUSES, stay_nights
+from listings.geo import CITY_CENTRES
+from listings.models import Listing, Booking, Review, BookedNight
 from faker import Faker
 
-fake = Faker()
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Miami', 'San Francisco', 'Seattle', 'Boston', 'Austin']
+COUNTRIES = ['United States']
+AMENITY_FIELDS = ['has_wifi', 'has_kitchen', 'has_air_conditioning', 'has_heating', 'has_tv', 'has_parking', 'has_pool']
+
+
+def chunk_faker(seed, kind, index):
+    """Faker instance for one chunk, seeded so output does not depend on the worker count"""
+    fake = Faker()
+    fake.seed_instance(f'{seed}-{kind}-{index}')
+    return fake, random.Random(f'{seed}-{kind}-{index}')
+
+
+def generate_users(task):
+    """Generate user rows for one chunk (runs in worker processes)"""
+    seed, index, first_number, count = task
+    fake, _ = chunk_faker(seed, 'users', index)
+    return [
+        {
+            # The numeric suffix keeps usernames unique without probing the database
+            'username': f'{fake.user_name()}_{first_number + offset}',
+            'email': fake.email(),
+            'first_name': fake.first_name(),
+            'last_name': fake.last_name(),
+        }
+        for offset in range(count)
+    ]
+
+
+def generate_listings(task):
+    """Generate listing rows for one chunk (runs in worker processes)"""
+    seed, index, count = task
+    fake, rng = chunk_faker(seed, 'listings', index)
+    property_types = [choice[0] for choice in Listing.PROPERTY_TYPES]
+    rows = []
+    for _ in range(count):
+        city = rng.choice(CITIES)
+        latitude, longitude = CITY_CENTRES[city.lower()]
+        row = {
+            'title': fake.sentence(nb_words=6)[:-1],  # Remove period
+            'description': fake.paragraph(nb_sentences=5),
+            'address': fake.street_address(),
+            'city': city,
+            # Spread the listings over the metropolitan area
+            'latitude': round(latitude + rng.uniform(-0.2, 0.2), 6),
+            'longitude': round(longitude + rng.uniform(-0.2, 0.2), 6),
+            'country': rng.choice(COUNTRIES),
+            'price_per_night': rng.randint(50, 500),
+            'property_type': rng.choice(property_types),
+            'max_guests': rng.randint(1, 10),
+            'bedrooms': rng.randint(1, 5),
+            'bathrooms': rng.randint(1, 3),
+        }
+        for field in AMENITY_FIELDS:
+            row[field] = rng.choice([True, False])
+        rows.append(row)
+    return rows
+
+
+def generate_comments(task):
+    """Generate review comments for one chunk (runs in worker processes)"""
+    seed, index, count = task
+    fake, rng = chunk_faker(seed, 'reviews', index)
+    return [(rng.randint(1, 5), fake.paragraph(nb_sentences=3)) for _ in range(count)]
 
 
 class Command(BaseCommand):
@@ -37,6 +105,23 @@ class Command(BaseCommand):
             type=int,
             help='Number of reviews to create'
         )
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Number of rows inserted per bulk_create batch'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Random seed for reproducible data'
+        )
+        parser.add_argument(
+            '--workers',
+            default=1,
+            type=int,
+            help='Number of processes generating fake data'
+        )
 
     def handle(self, *args, **options):
         # Get the number of records to create
@@ -44,154 +129,167 @@ class Command(BaseCommand):
         num_listings = options['listings']
         num_bookings = options['bookings']
         num_reviews = options['reviews']
+        self.batch_size = max(1, options['batch_size'])
+        self.seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.random = random.Random(self.seed)
+        self.pool = ProcessPoolExecutor(options['workers']) if options['workers'] > 1 else None
 
-        self.stdout.write(self.style.SUCCESS(f'Starting to seed database with {num_users} users, {num_listings} listings, {num_bookings} bookings, and {num_reviews} reviews'))
+        self.stdout.write(self.style.SUCCESS(f'Starting to seed database with {num_users} users, {num_listings} listings, {num_bookings} bookings, and {num_reviews} reviews (seed {self.seed})'))
 
         # Create admin user if it doesn't exist
         if not User.objects.filter(username='admin').exists():
             User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
             self.stdout.write(self.style.SUCCESS('Admin user created'))
 
-        # Create users
-        self.create_users(num_users)
-        self.stdout.write(self.style.SUCCESS(f'Created {num_users} users'))
+        try:
+            # Create users
+            self.create_users(num_users)
+            self.stdout.write(self.style.SUCCESS(f'Created {num_users} users'))
 
-        # Create listings
-        self.create_listings(num_listings)
-        self.stdout.write(self.style.SUCCESS(f'Created {num_listings} listings'))
+            # Create listings
+            self.create_listings(num_listings)
+            self.stdout.write(self.style.SUCCESS(f'Created {num_listings} listings'))
 
-        # Create bookings
-        self.create_bookings(num_bookings)
-        self.stdout.write(self.style.SUCCESS(f'Created {num_bookings} bookings'))
+            # Create bookings
+            self.create_bookings(num_bookings)
+            self.stdout.write(self.style.SUCCESS(f'Created {num_bookings} bookings'))
 
-        # Create reviews
-        self.create_reviews(num_reviews)
-        self.stdout.write(self.style.SUCCESS(f'Created {num_reviews} reviews'))
+            # Create reviews
+            created = self.create_reviews(num_reviews)
+            self.stdout.write(self.style.SUCCESS(f'Created {created} reviews'))
+        finally:
+            if self.pool:
+                self.pool.shutdown()
 
         self.stdout.write(self.style.SUCCESS('Database seeding completed successfully!'))
 
-    @transaction.atomic
+    def chunks(self, count):
+        """Split a row count into (chunk index, chunk size) pairs of at most batch_size"""
+        return [(index, min(self.batch_size, count - start))
+                for index, start in enumerate(range(0, count, self.batch_size))]
+
+    def generate(self, function, tasks):
+        """Run generator tasks in order, in the process pool when enabled"""
+        if self.pool:
+            return self.pool.map(function, tasks)
+        return map(function, tasks)
+
+    def report(self, label, done, total, started):
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(f'  {label}: {done}/{total} rows ({rate:.0f} rows/s)')
+
     def create_users(self, count):
         """Create sample users"""
-        for _ in range(count):
-            username = fake.user_name()
-            while User.objects.filter(username=username).exists():
-                username = fake.user_name()
-
-            User.objects.create_user(
-                username=username,
-                email=fake.email(),
-                password='password123',
-                first_name=fake.first_name(),
-                last_name=fake.last_name()
-            )
-
-    @transaction.atomic
+        # Hash the shared password once instead of once per user
+        password = make_password('password123')
+        first_number = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        tasks = []
+        for index, size in self.chunks(count):
+            tasks.append((self.seed, index, first_number, size))
+            first_number += size
+
+        started, done = time.monotonic(), 0
+        for rows in self.generate(generate_users, tasks):
+            with transaction.atomic():
+                User.objects.bulk_create([User(password=password, **row) for row in rows])
+            done += len(rows)
+            self.report('users', done, count, started)
+
     def create_listings(self, count):
         """Create sample listings"""
-        users = list(User.objects.all())
-        property_types = [choice[0] for choice in Listing.PROPERTY_TYPES]
-        cities = ['New York', 'Los Angeles', 'Chicago', 'Miami', 'San Francisco', 'Seattle', 'Boston', 'Austin']
-        countries = ['United States']
-
-        for _ in range(count):
-            host = random.choice(users)
-            city = random.choice(cities)
-            property_type = random.choice(property_types)
-            bedrooms = random.randint(1, 5)
-            bathrooms = random.randint(1, 3)
-
-            Listing.objects.create(
-                title=fake.sentence(nb_words=6)[:-1],  # Remove period
-                description=fake.paragraph(nb_sentences=5),
-                address=fake.street_address(),
-                city=city,
-                country=random.choice(countries),
-                price_per_night=random.randint(50, 500),
-                property_type=property_type,
-                max_guests=random.randint(1, 10),
-                bedrooms=bedrooms,
-                bathrooms=bathrooms,
-                has_wifi=random.choice([True, False]),
-                has_kitchen=random.choice([True, False]),
-                has_air_conditioning=random.choice([True, False]),
-                has_heating=random.choice([True, False]),
-                has_tv=random.choice([True, False]),
-                has_parking=random.choice([True, False]),
-                has_pool=random.choice([True, False]),
-                host=host
-            )
-
-    @transaction.atomic
+        hosts = list(User.objects.values_list('pk', flat=True))
+        tasks = [(self.seed, index, size) for index, size in self.chunks(count)]
+
+        started, done = time.monotonic(), 0
+        for rows in self.generate(generate_listings, tasks):
+            with transaction.atomic():
+                Listing.objects.bulk_create([Listing(host_id=self.random.choice(hosts), **row) for row in rows])
+            done += len(rows)
+            self.report('listings', done, count, started)
+
     def create_bookings(self, count):
         """Create sample bookings"""
-        users = list(User.objects.all())
-        listings = list(Listing.objects.all())
+        users = list(User.objects.values_list('pk', flat=True))
+        listings = list(Listing.objects.values_list('pk', 'host_id', 'price_per_night', 'max_guests'))
+        if not listings:
+            return
         statuses = [choice[0] for choice in Booking.STATUS_CHOICES]
+        today = datetime.now().date()
+
+        # Start each listing after its last stay so new bookings never overlap existing ones
+        next_free = {
+            listing_id: last or today - timedelta(days=30)
+            for listing_id, last in Listing.objects.annotate(last=Max('bookings__check_out_date')).values_list('pk', 'last')
+        }
+
+        started, done = time.monotonic(), 0
+        for _, size in self.chunks(count):
+            bookings = []
+            for _ in range(size):
+                listing_id, host_id, price, max_guests = self.random.choice(listings)
+                guest_id = self.random.choice(users)
+
+                # Ensure guest is not the host
+                while guest_id == host_id and len(users) > 1:
+                    guest_id = self.random.choice(users)
+
+                # Place the stay after the listing's previous one
+                start_date = next_free[listing_id] + timedelta(days=self.random.randint(0, 5))
+                duration = self.random.randint(1, 14)  # 1 to 14 nights
+                end_date = start_date + timedelta(days=duration)
+                next_free[listing_id] = end_date
+
+                bookings.append(Booking(
+                    listing_id=listing_id,
+                    guest_id=guest_id,
+                    check_in_date=start_date,
+                    check_out_date=end_date,
+                    guests_count=self.random.randint(1, max_guests),
+                    total_price=price * duration,
+                    status=self.random.choice(statuses)
+                ))
+
+            with transaction.atomic():
+                Booking.objects.bulk_create(bookings)
+                BookedNight.objects.bulk_create(
+                    [
+                        BookedNight(listing_id=booking.listing_id, booking_id=booking.pk, date=date)
+                        for booking in bookings if booking.status in ACTIVE_STATUSES
+                        for date in stay_nights(booking.check_in_date, booking.check_out_date)
+                    ],
+                    batch_size=self.batch_size
+                )
+            done += len(bookings)
+            self.report('bookings', done, count, started)
 
-        for _ in range(count):
-            listing = random.choice(listings)
-            guest = random.choice(users)
-            
-            # Ensure guest is not the host
-            while guest == listing.host:
-                guest = random.choice(users)
-
-            # Generate random dates
-            start_date = datetime.now().date() + timedelta(days=random.randint(-30, 60))
-            duration = random.randint(1, 14)  # 1 to 14 nights
-            end_date = start_date + timedelta(days=duration)
-
-            # Calculate total price
-            total_price = listing.price_per_night * duration
-
-            Booking.objects.create(
-                listing=listing,
-                guest=guest,
-                check_in_date=start_date,
-                check_out_date=end_date,
-                guests_count=random.randint(1, listing.max_guests),
-                total_price=total_price,
-                status=random.choice(statuses)
-            )
-
-    @transaction.atomic
     def create_reviews(self, count):
         """Create sample reviews"""
         # Get completed bookings without reviews
-        completed_bookings = Booking.objects.filter(
-            status='completed'
-        ).exclude(
-            id__in=Review.objects.values_list('booking_id', flat=True)
-        )
+        unreviewed = Booking.objects.filter(review__isnull=True).order_by('pk')
+        missing = count - unreviewed.filter(status='completed').count()
+
+        # If there are not enough completed bookings, mark some as completed in one update
+        if missing > 0:
+            with transaction.atomic():
+                ids = list(unreviewed.filter(status__in=['confirmed', 'pending']).values_list('pk', flat=True)[:missing])
+                Booking.objects.filter(pk__in=ids).update(status='completed')
+                BookedNight.objects.filter(booking_id__in=ids).delete()
+
+        # One review per completed booking, written by its guest
+        bookings = unreviewed.filter(status='completed').values_list('pk', 'listing_id', 'guest_id')[:count]
+        bookings = list(bookings.iterator(chunk_size=self.batch_size))
+        tasks = [(self.seed, index, size) for index, size in self.chunks(len(bookings))]
 
-        # If there are not enough completed bookings, mark some as completed
-        if completed_bookings.count() < count:
-            bookings_to_update = Booking.objects.filter(
-                status__in=['confirmed', 'pending']
-            ).exclude(
-                id__in=Review.objects.values_list('booking_id', flat=True)
-            )[:count - completed_bookings.count()]
-            
-            for booking in bookings_to_update:
-                booking.status = 'completed'
-                booking.save()
-            
-            # Refresh the completed bookings queryset
-            completed_bookings = Booking.objects.filter(
-                status='completed'
-            ).exclude(
-                id__in=Review.objects.values_list('booking_id', flat=True)
-            )
-
-        # Create reviews for completed bookings
-        bookings_for_review = list(completed_bookings[:count])
-        
-        for booking in bookings_for_review:
-            Review.objects.create(
-                listing=booking.listing,
-                reviewer=booking.guest,
-                booking=booking,
-                rating=random.randint(1, 5),
-                comment=fake.paragraph(nb_sentences=3)
-            )
\ No newline at end of file
+        started, done = time.monotonic(), 0
+        for comments in self.generate(generate_comments, tasks):
+            batch = bookings[done:done + len(comments)]
+            with transaction.atomic():
+                Review.objects.bulk_create([
+                    Review(listing_id=listing_id, reviewer_id=guest_id, booking_id=booking_id,
+                           rating=rating, comment=comment)
+                    for (booking_id, listing_id, guest_id), (rating, comment) in zip(batch, comments)
+                ])
+            done += len(batch)
+            self.report('reviews', done, len(bookings), started)
+        return done
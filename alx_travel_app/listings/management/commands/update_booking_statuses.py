@@ -0,0 +1,67 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from listings.db import routing_scope
+from listings.lifecycle import complete_stays, expire_holds, expired_holds, finished_stays
+
+
+class Command(BaseCommand):
+    help = ('Cancels the pending bookings past their hold (LISTINGS_PENDING_HOLD_HOURS) and completes the '
+            'confirmed bookings whose check-out date has come, in batches of bulk UPDATEs')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=getattr(settings, 'LISTINGS_LIFECYCLE_BATCH_SIZE', 1000),
+            type=int,
+            help='Number of bookings updated per transaction'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the bookings that would be updated'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            default=300.0,
+            type=float,
+            help='Seconds between two runs with --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # A run's writes keep its own reads on the primary, not those of the next --loop run
+            with routing_scope():
+                if options['dry_run']:
+                    self.stdout.write(
+                        f'Would expire {expired_holds().count()} pending holds '
+                        f'and complete {finished_stays().count()} stays'
+                    )
+                else:
+                    batch_size = max(1, options['batch_size'])
+                    self.run('Expired', 'pending holds', expire_holds(batch_size))
+                    self.run('Completed', 'stays', complete_stays(batch_size))
+            if not options['loop']:
+                break
+            # Drop connections broken or past CONN_MAX_AGE, as the request cycle does
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def run(self, verb, noun, batches):
+        started = time.monotonic()
+        done = count = 0
+        for size in batches:
+            if size:
+                done += size
+                count += 1
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {done} {noun} in {count} batches, {elapsed:.2f}s ({rate:.0f} bookings/s)'
+        ))
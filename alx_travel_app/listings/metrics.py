@@ -0,0 +1,304 @@
+import bisect
+import contextvars
+import logging
+import random
+import secrets
+import threading
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, +Inf is implied
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUERY_BUCKETS = [1, 2, 3, 5, 10, 20, 50, 100, 200, 500]
+BYTES_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+_current = contextvars.ContextVar('listings_request_metrics', default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with one series per label set"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def exposition(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            label_text = format_labels(zip(label_names, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+def format_labels(pairs):
+    """Prometheus label list, values escaped"""
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+
+
+class MetricsRegistry:
+    """Per-process request metrics of the API, labelled by view, action and method"""
+    label_names = ['view', 'action', 'method']
+
+    def __init__(self):
+        self.duration = Histogram('listings_request_duration_seconds', 'Wall time of the requests', SECONDS_BUCKETS)
+        self.queries = Histogram('listings_request_queries', 'Database queries per request', QUERY_BUCKETS)
+        self.db_time = Histogram('listings_request_db_seconds', 'Time spent in database queries', SECONDS_BUCKETS)
+        self.serializer_time = Histogram(
+            'listings_request_serializer_seconds', 'Time spent serializing, including lazy relation queries',
+            SECONDS_BUCKETS
+        )
+        self.response_bytes = Histogram('listings_response_bytes', 'Size of the response bodies', BYTES_BUCKETS)
+        self.task_duration = Histogram('listings_task_duration_seconds', 'Run time of the background tasks', SECONDS_BUCKETS)
+        self.lock = threading.Lock()
+        self.statuses = {}
+        self.task_outcomes = {}
+
+    def record(self, labels, status_code, metrics, duration, size):
+        self.duration.observe(labels, duration)
+        self.queries.observe(labels, metrics.query_count)
+        self.db_time.observe(labels, metrics.query_time)
+        self.serializer_time.observe(labels, metrics.serializer_time)
+        if size is not None:
+            self.response_bytes.observe(labels, size)
+        with self.lock:
+            key = labels + (status_code,)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def record_task(self, name, outcome, duration):
+        self.task_duration.observe((name,), duration)
+        with self.lock:
+            key = (name, outcome)
+            self.task_outcomes[key] = self.task_outcomes.get(key, 0) + 1
+
+    def exposition(self):
+        """Metrics in the Prometheus text format, with the response cache counters and task queue depth"""
+        from .cache import listing_cache
+        from .taskqueue import get_backend
+
+        lines = ['# HELP listings_requests_total Sampled requests', '# TYPE listings_requests_total counter']
+        with self.lock:
+            statuses = dict(self.statuses)
+        for key, count in sorted(statuses.items()):
+            lines.append(f"listings_requests_total{{{format_labels(zip(self.label_names + ['status'], key))}}} {count}")
+        for histogram in [self.duration, self.queries, self.db_time, self.serializer_time, self.response_bytes]:
+            lines.extend(histogram.exposition(self.label_names))
+        for name, value in sorted(listing_cache.stats().items()):
+            lines.append(f'# TYPE listings_cache_{name}_total counter')
+            lines.append(f'listings_cache_{name}_total {value}')
+        lines += ['# HELP listings_tasks_total Background task runs', '# TYPE listings_tasks_total counter']
+        with self.lock:
+            task_outcomes = dict(self.task_outcomes)
+        for key, count in sorted(task_outcomes.items()):
+            lines.append(f"listings_tasks_total{{{format_labels(zip(['task', 'outcome'], key))}}} {count}")
+        lines.extend(self.task_duration.exposition(['task']))
+        lines += ['# HELP listings_task_queue Background tasks by state', '# TYPE listings_task_queue gauge']
+        for state, count in sorted(get_backend().stats().items()):
+            lines.append(f'listings_task_queue{{state="{state}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """Counters of the request being handled, shared through a context variable"""
+
+    def __init__(self, keep_sql):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.queries = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper recording the count and time of the queries"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if self.queries is not None:
+                self.queries.append((elapsed, sql))
+
+
+def timed_serialization(func, *args):
+    """Call func, adding its time to the serializer time of the current request once, not per nesting level"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        return func(*args)
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializing = False
+
+
+async def atimed_serialization(func, *args):
+    """timed_serialization for coroutine functions"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        return await func(*args)
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        return await func(*args)
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializing = False
+
+
+def view_labels(request):
+    """(view, action, method) of a resolved request; ViewSet routes report their action name"""
+    match = getattr(request, 'resolver_match', None)
+    method = request.method
+    if match is None:
+        return 'unmatched', '', method
+    func = match.func
+    cls = getattr(func, 'cls', None)
+    actions = getattr(func, 'actions', None) or {}
+    view = cls.__name__ if cls is not None else (match.view_name or func.__name__)
+    return view, actions.get(method.lower(), ''), method
+
+
+class MetricsMiddleware:
+    """Record wall time, query count and time, serializer time and response size of sampled requests.
+
+    LISTINGS_METRICS_SAMPLE_RATE is the share of requests recorded, so it can
+    stay on in production; requests slower than LISTINGS_SLOW_REQUEST_MS are
+    logged with their SQL. Works in both sync and async middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        if not getattr(settings, 'LISTINGS_METRICS_ENABLED', True):
+            return False
+        return random.random() < getattr(settings, 'LISTINGS_METRICS_SAMPLE_RATE', 1.0)
+
+    def install(self, stack, metrics):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        metrics = RequestMetrics(keep_sql=getattr(settings, 'LISTINGS_SLOW_REQUEST_MS', 500) is not None)
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self.install(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        metrics = RequestMetrics(keep_sql=getattr(settings, 'LISTINGS_SLOW_REQUEST_MS', 500) is not None)
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        stack = ExitStack()
+        try:
+            # Database connections are per thread: the ORM calls of the request run in
+            # its thread-sensitive executor thread, so the wrappers are installed there
+            await sync_to_async(self.install)(stack, metrics)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, duration):
+        labels = view_labels(request)
+        if response.streaming:
+            # Rows of a stream are fetched and counted after the response leaves the middleware
+            size = None
+            if response.is_async:
+                response.streaming_content = self.acount_stream(response.streaming_content, labels)
+            else:
+                response.streaming_content = self.count_stream(response.streaming_content, labels)
+        else:
+            size = len(response.content)
+        registry.record(labels, response.status_code, metrics, duration, size)
+        slow_ms = getattr(settings, 'LISTINGS_SLOW_REQUEST_MS', 500)
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+            self.log_slow_request(request, response, metrics, duration)
+        return response
+
+    def count_stream(self, content, labels):
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        registry.response_bytes.observe(labels, size)
+
+    async def acount_stream(self, content, labels):
+        size = 0
+        async for chunk in content:
+            size += len(chunk)
+            yield chunk
+        registry.response_bytes.observe(labels, size)
+
+    def log_slow_request(self, request, response, metrics, duration):
+        max_queries = getattr(settings, 'LISTINGS_SLOW_REQUEST_MAX_QUERIES', 20)
+        slowest = sorted(metrics.queries, key=lambda query: query[0], reverse=True)[:max_queries]
+        logger.warning(
+            "Slow request %s %s: %d in %.0f ms, %d queries in %.0f ms, serializer %.0f ms\n%s",
+            request.method, request.get_full_path(), response.status_code, duration * 1000,
+            metrics.query_count, metrics.query_time * 1000, metrics.serializer_time * 1000,
+            '\n'.join(f'  {elapsed * 1000:.1f} ms  {sql}' for elapsed, sql in slowest),
+        )
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires `Authorization: Bearer <LISTINGS_METRICS_TOKEN>`, open only under DEBUG without a token"""
+    token = getattr(settings, 'LISTINGS_METRICS_TOKEN', None)
+    if not token:
+        # SQL timings and per-view traffic are not public data
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not secrets.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
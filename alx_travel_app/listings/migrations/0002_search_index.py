@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import migrations
+
+# Indexed columns of the listing table, as listings.search weighs them
+SEARCH_FIELDS = ['title', 'city', 'country', 'address', 'description']
+POSTGRES_WEIGHTS = ['A', 'B', 'C', 'C', 'D']
+
+COLUMNS = ', '.join(SEARCH_FIELDS)
+NEW_VALUES = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+OLD_VALUES = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+
+# FTS5 external-content table kept in sync by triggers, including for bulk_create and queryset updates.
+# IF NOT EXISTS: databases migrated before this migration got the index from a post_migrate handler
+SQLITE_INDEX = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS listings_listing_fts USING fts5({COLUMNS}, "
+    f"content='listings_listing', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS listings_listing_fts_insert AFTER INSERT ON listings_listing BEGIN "
+    f"INSERT INTO listings_listing_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS listings_listing_fts_delete AFTER DELETE ON listings_listing BEGIN "
+    f"INSERT INTO listings_listing_fts(listings_listing_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); END",
+    # Only text changes touch the index, not price or rating updates
+    f"CREATE TRIGGER IF NOT EXISTS listings_listing_fts_update AFTER UPDATE OF {COLUMNS} ON listings_listing BEGIN "
+    f"INSERT INTO listings_listing_fts(listings_listing_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); "
+    f"INSERT INTO listings_listing_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES}); END",
+    # Index the listings already in the table
+    "INSERT INTO listings_listing_fts(listings_listing_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS listings_listing_fts_update',
+    'DROP TRIGGER IF EXISTS listings_listing_fts_delete',
+    'DROP TRIGGER IF EXISTS listings_listing_fts_insert',
+    'DROP TABLE IF EXISTS listings_listing_fts',
+]
+
+SEARCH_CONFIG = getattr(settings, 'LISTINGS_SEARCH_CONFIG', 'simple')
+VECTOR = ' || '.join(
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({field}, '')), '{weight}')"
+    for field, weight in zip(SEARCH_FIELDS, POSTGRES_WEIGHTS)
+)
+# Stored generated column, filled for the existing rows and maintained by PostgreSQL itself
+POSTGRES_INDEX = [
+    f"ALTER TABLE listings_listing ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({VECTOR}) STORED",
+    'CREATE INDEX IF NOT EXISTS listing_search_vector_idx ON listings_listing USING GIN (search_vector)',
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS listing_search_vector_idx',
+    'ALTER TABLE listings_listing DROP COLUMN IF EXISTS search_vector',
+]
+
+
+class RunSQLOn(migrations.RunSQL):
+    """RunSQL applied only to the databases of one engine vendor"""
+
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f'Raw SQL operation on {self.vendor}'
+
+
+class Migration(migrations.Migration):
+    """Full-text index of the listing text columns, outside the model state.
+
+    On SQLite, a later migration that remakes the listing table (most
+    AlterField operations do) drops the triggers with the old table: it
+    has to run SQLITE_DROP and SQLITE_INDEX again after its own.
+    """
+
+    dependencies = [
+        ('listings', '0001_initial'),
+    ]
+
+    operations = [
+        RunSQLOn('sqlite', SQLITE_INDEX, SQLITE_DROP),
+        RunSQLOn('postgresql', POSTGRES_INDEX, POSTGRES_DROP),
+    ]
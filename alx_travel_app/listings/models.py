@@ -1,6 +1,109 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .cache import invalidate, listing_tag
+from .amenities import amenities_expression, amenity_bit, amenity_names, pack_amenities
+from .geo import encode_geohash, locate
+
+RATING_VALUES = range(1, 6)
+
+# Average computed from the stored aggregate columns of the row being updated
+AVERAGE_RATING_EXPRESSION = Case(
+    When(review_count=0, then=Value(None)),
+    default=Cast('rating_sum', FloatField()) / F('review_count'),
+    output_field=FloatField(),
+)
+
+
+class ListingQuerySet(models.QuerySet):
+    """QuerySet maintaining the denormalized amenity mask, geohash and rating aggregates of listings"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        for obj in objs:
+            obj.amenities = pack_amenities(obj)
+            locate(obj)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if any(field.startswith('has_') for field in fields):
+            for obj in objs:
+                obj.amenities = pack_amenities(obj)
+            fields.append('amenities')
+        if {'latitude', 'longitude', 'address', 'city', 'country'} & set(fields):
+            for obj in objs:
+                locate(obj)
+            fields += [field for field in ['latitude', 'longitude', 'geohash'] if field not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if 'amenities' not in kwargs and any(field.startswith('has_') for field in kwargs):
+            kwargs['amenities'] = amenities_expression(kwargs)
+        relocated = None
+        # The rows read around the update come from the primary, not from a replica that may lag behind
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            if 'geohash' not in kwargs and {'latitude', 'longitude'} & set(kwargs):
+                # Geohashes are computed in Python, refresh them for the rows about to move
+                relocated = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            if relocated:
+                self.model.objects.filter(pk__in=relocated).refresh_geohashes()
+        # Queryset updates send no signals, so drop every cached listing response
+        invalidate('catalogue')
+        return rows
+
+    def refresh_geohashes(self):
+        """Recompute the stored geohash of the listings from their coordinates"""
+        listings = list(self.only('pk', 'latitude', 'longitude'))
+        for listing in listings:
+            located = listing.latitude is not None and listing.longitude is not None
+            listing.geohash = encode_geohash(listing.latitude, listing.longitude) if located else ''
+        return super().bulk_update(listings, ['geohash'])
+
+    def with_amenities(self, mask):
+        """Listings offering every amenity of the mask, as a single bitwise predicate"""
+        return self.alias(amenity_match=F('amenities').bitand(mask)).filter(amenity_match=mask)
+
+    def without_amenities(self, mask):
+        """Listings offering none of the amenities of the mask"""
+        return self.alias(amenity_match=F('amenities').bitand(mask)).filter(amenity_match=0)
+
+    def apply_rating_delta(self, rating, delta):
+        """Add (delta=1) or remove (delta=-1) a single rating from the stored aggregates"""
+        bucket = f'rating_{rating}_count'
+        # Writes go to the primary even when reads of this queryset are routed to a replica
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            # Callers invalidate the cached listings, so skip the catalogue-wide invalidation of update()
+            super().update(**{
+                'review_count': F('review_count') + delta,
+                'rating_sum': F('rating_sum') + delta * rating,
+                bucket: F(bucket) + delta,
+                'updated_at': timezone.now(),
+            })
+            return super().update(average_rating=AVERAGE_RATING_EXPRESSION)
+
+    def touch(self):
+        """Bump updated_at, e.g. when an embedded review changes without affecting the aggregates"""
+        return super().update(updated_at=timezone.now())
+
+    def refresh_rating_aggregates(self):
+        """Recompute the stored rating aggregates from the reviews table"""
+        reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+        aggregates = {
+            'review_count': Coalesce(Subquery(reviews.annotate(value=Count('pk')).values('value')), 0),
+            'rating_sum': Coalesce(Subquery(reviews.annotate(value=Sum('rating')).values('value')), 0),
+            'average_rating': Subquery(reviews.annotate(value=Avg('rating')).values('value')),
+        }
+        for rating in RATING_VALUES:
+            aggregates[f'rating_{rating}_count'] = Coalesce(
+                Subquery(reviews.annotate(value=Count('pk', filter=Q(rating=rating))).values('value')), 0
+            )
+        return super().update(updated_at=timezone.now(), **aggregates)
 
 
 class Listing(models.Model):
@@ -32,15 +135,110 @@ class Listing(models.Model):
     has_tv = models.BooleanField(default=False)
     has_parking = models.BooleanField(default=False)
     has_pool = models.BooleanField(default=False)
+    # Bitmask of all amenities (see listings.amenities), kept in sync with the has_* fields
+    amenities = models.PositiveBigIntegerField(default=0, editable=False)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Geohash of the coordinates (see listings.geo), empty when they are unknown
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     host = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
+    # Rating aggregates maintained from Review changes (see listings.signals)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(null=True, blank=True)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    
+    objects = ListingQuerySet.as_manager()
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        self.amenities = pack_amenities(self)
+        locate(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if any(field.startswith('has_') for field in update_fields):
+                update_fields.add('amenities')
+            if {'latitude', 'longitude', 'address', 'city', 'country'} & update_fields:
+                update_fields |= {'latitude', 'longitude', 'geohash'}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+    
+    @property
+    def amenity_list(self):
+        """Names of the amenities this listing offers"""
+        return amenity_names(pack_amenities(self))
+    
+    def has_amenity(self, name):
+        return bool(pack_amenities(self) & amenity_bit(name))
+    
+    def set_amenity(self, name, value=True):
+        """Set an amenity, through its has_* field when it has one"""
+        field = f'has_{name}'
+        if hasattr(self, field):
+            setattr(self, field, value)
+        elif value:
+            self.amenities |= amenity_bit(name)
+        else:
+            self.amenities &= ~amenity_bit(name)
+    
+    @property
+    def rating_histogram(self):
+        """Number of reviews per rating value"""
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in RATING_VALUES}
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='listing_created_idx'),
+            models.Index(fields=['price_per_night', 'id'], name='listing_price_idx'),
+            models.Index(fields=['review_count', 'id'], name='listing_review_count_idx'),
+            models.Index(fields=['average_rating', 'id'], name='listing_rating_idx'),
+            models.Index(fields=['city', 'property_type', 'price_per_night'], name='listing_city_type_price_idx'),
+            models.Index(fields=['country', '-created_at'], name='listing_country_created_idx'),
+            models.Index(fields=['property_type', 'price_per_night'], name='listing_type_price_idx'),
+            models.Index(fields=['max_guests', 'price_per_night'], name='listing_guests_price_idx'),
+            models.Index(fields=['bedrooms', 'bathrooms'], name='listing_rooms_idx'),
+            # Serves the geohash range scans of the map searches
+            models.Index(fields=['geohash'], name='listing_geohash_idx'),
+            # Covers the bitwise amenity predicates, which no index can seek, without reading the table
+            models.Index(fields=['amenities'], name='listing_amenities_idx'),
+        ]
+
+
+def hosted_listings(user):
+    """Primary keys of the user's listings, read from the host index"""
+    return Listing.objects.filter(host=user).values('pk')
+
+
+class BookingQuerySet(models.QuerySet):
+    """QuerySet scoping bookings to the role of a user"""
+
+    def for_guest(self, user):
+        """Bookings made by the user"""
+        return self.filter(guest=user)
+
+    def for_host(self, user):
+        """Bookings of the user's listings, as a pk IN over the listing index searches.
+
+        A plain listing IN lets SQLite walk the whole created_at index in page
+        order, filtering every row, once a host holds a fair share of the table.
+        """
+        bookings = self.model._default_manager.order_by().values('pk')
+        return self.filter(pk__in=bookings.filter(listing__in=hosted_listings(user)))
+
+    def for_user(self, user):
+        """Bookings the user made or hosts, as a UNION of the two indexed lookups"""
+        bookings = self.model._default_manager.order_by().values('pk')
+        return self.filter(pk__in=bookings.for_guest(user).union(bookings.filter(listing__in=hosted_listings(user))))
 
 
 class Booking(models.Model):
@@ -62,19 +260,83 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookingQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.guest.username}'s booking at {self.listing.title}"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Serves the overlap anti-join of the availability search
+            models.Index(fields=['listing', 'status', 'check_in_date', 'check_out_date'],
+                         name='booking_listing_stay_idx'),
+            models.Index(fields=['-created_at', '-id'], name='booking_created_idx'),
+            models.Index(fields=['guest', '-created_at'], name='booking_guest_created_idx'),
+            models.Index(fields=['listing', '-created_at'], name='booking_listing_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='booking_status_created_idx'),
+            models.Index(fields=['check_in_date', 'id'], name='booking_check_in_idx'),
+            models.Index(fields=['check_out_date', 'id'], name='booking_check_out_idx'),
+            # Serve the pending hold expiry and stay completion of listings.lifecycle
+            models.Index(fields=['status', 'check_out_date'], name='booking_status_check_out_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored stay so save() only re-reserves nights when it changes
+        instance._loaded_stay = instance.stay_key
+        return instance
+    
+    @property
+    def stay_key(self):
+        """Values that determine which nights the booking occupies"""
+        return tuple(self.__dict__.get(name) for name in ('listing_id', 'check_in_date', 'check_out_date', 'status'))
         
     def save(self, *args, **kwargs):
-        # Calculate total price if not provided
+        from .availability import sync_booked_nights
+        from .pricing import stay_total
+        
+        # Price the stay with the listing's rate rules if not provided
         if not self.total_price:
-            # Calculate number of nights
-            nights = (self.check_out_date - self.check_in_date).days
-            self.total_price = self.listing.price_per_night * nights
-        super().save(*args, **kwargs)
+            self.total_price = stay_total(self.listing, self.check_in_date, self.check_out_date)
+        # Save the booking and reserve its nights atomically; a conflict rolls back both
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if getattr(self, '_loaded_stay', None) != self.stay_key:
+                sync_booked_nights(self)
+                self._loaded_stay = self.stay_key
+
+
+class ReviewQuerySet(models.QuerySet):
+    """QuerySet keeping listing rating aggregates in sync on bulk writes"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            listing_ids = {obj.listing_id for obj in objs}
+            Listing.objects.filter(pk__in=listing_ids).refresh_rating_aggregates()
+            invalidate('listings', *map(listing_tag, listing_ids))
+        return objs
+
+    def update(self, **kwargs):
+        # bulk_update() goes through update() as well
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            affected = list(self.values_list('pk', 'listing_id'))
+            rows = super().update(**kwargs)
+            listing_ids = {listing_id for _, listing_id in affected}
+            if 'listing' in kwargs or 'listing_id' in kwargs:
+                moved = Review.objects.filter(pk__in=[pk for pk, _ in affected])
+                listing_ids.update(moved.values_list('listing_id', flat=True))
+            if {'rating', 'listing', 'listing_id'} & set(kwargs):
+                Listing.objects.filter(pk__in=listing_ids).refresh_rating_aggregates()
+            else:
+                Listing.objects.filter(pk__in=listing_ids).touch()
+            # Review comments are embedded in the listing payloads as well
+            invalidate('listings', *map(listing_tag, listing_ids))
+        return rows
 
 
 class Review(models.Model):
@@ -87,9 +349,142 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ReviewQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.reviewer.username}'s review for {self.listing.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so the aggregate signals can apply deltas
+        instance._loaded_rating = (instance.__dict__.get('listing_id'), instance.__dict__.get('rating'))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # Keep the review and the listing aggregates updated by post_save in one transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+    
     class Meta:
         ordering = ['-created_at']
-        unique_together = ['listing', 'reviewer', 'booking']
\ No newline at end of file
+        unique_together = ['listing', 'reviewer', 'booking']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+            models.Index(fields=['listing', '-created_at'], name='review_listing_created_idx'),
+            models.Index(fields=['reviewer', '-created_at'], name='review_reviewer_created_idx'),
+            models.Index(fields=['rating', '-created_at'], name='review_rating_created_idx'),
+            models.Index(fields=['rating', 'id'], name='review_rating_idx'),
+        ]
+
+
+class BookedNight(models.Model):
+    """Night occupied by an active booking, at most one row per listing and date"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='booked_nights')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights')
+    date = models.DateField()
+    
+    def __str__(self):
+        return f"{self.listing_id} booked on {self.date}"
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'date'], name='unique_booked_night'),
+        ]
+
+
+class RateRuleQuerySet(models.QuerySet):
+    """QuerySet dropping the memoized rate plans of the listings its bulk writes touch"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .pricing import invalidate_rate_plans
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidate_rate_plans({obj.listing_id for obj in objs})
+        return objs
+
+    def update(self, **kwargs):
+        # bulk_update() goes through update() as well
+        from .pricing import invalidate_rate_plans
+
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            affected = list(self.values_list('pk', 'listing_id'))
+            rows = super().update(**kwargs)
+            listing_ids = {listing_id for _, listing_id in affected}
+            if 'listing' in kwargs or 'listing_id' in kwargs:
+                moved = RateRule.objects.filter(pk__in=[pk for pk, _ in affected])
+                listing_ids.update(moved.values_list('listing_id', flat=True))
+            invalidate_rate_plans(listing_ids)
+        return rows
+
+
+class RateRule(models.Model):
+    """Pricing rule of a listing, expanded into per-night prices by listings.pricing"""
+    KIND_CHOICES = [
+        ('price', 'Nightly price'),
+        ('adjustment', 'Nightly adjustment'),
+        ('stay_discount', 'Length of stay discount'),
+        ('fee', 'Fee per stay'),
+    ]
+    
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='rate_rules')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    name = models.CharField(max_length=100, blank=True, default='')
+    # Nights (check-in date for stay discounts and fees) the rule applies to, end excluded; open when null
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    # Bitmask of the weekdays (Monday = bit 0) of the nights the rule applies to, 0 for every day
+    weekdays = models.PositiveSmallIntegerField(default=0)
+    # Nightly price replacing price_per_night, or fee per stay
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Change of the nightly price (e.g. 20 or -10), or discount of a long stay
+    percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    # Stay length from which a stay discount applies
+    min_nights = models.PositiveIntegerField(default=1)
+    # The price rule with the highest priority wins when several cover a night
+    priority = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = RateRuleQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} of listing {self.listing_id}"
+    
+    class Meta:
+        ordering = ['listing', '-priority', 'id']
+        indexes = [
+            models.Index(fields=['listing', 'kind'], name='rate_rule_listing_kind_idx'),
+        ]
+
+
+class OutboxTask(models.Model):
+    """Background task call of the durable queue, written in the transaction that requested it"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)} #{self.pk}"
+    
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Serves the claim query of the workers
+            models.Index(fields=['status', 'run_at'], name='outbox_status_run_at_idx'),
+        ]
@@ -0,0 +1,261 @@
+import asyncio
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.paginator import Page
+from django.db.models import F, Func, IntegerField, Q, Subquery
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+MAX_PAGE_SIZE = getattr(settings, 'LISTINGS_MAX_PAGE_SIZE', 100)
+
+
+def keyset_range(field, value, pk, op):
+    """(field, pk) strictly past (value, pk) with `op`, as a bounded range the index can search.
+
+    `field <= value AND (field < value OR pk < pk)` rather than the equivalent
+    `field < value OR (field = value AND pk < pk)`, which SQLite answers with a
+    full index scan.
+    """
+    return Q(**{f'{field}__{op}e': value}) & (Q(**{f'{field}__{op}': value}) | Q(**{f'pk__{op}': pk}))
+
+
+def keyset_after(field, value, pk, descending, nullable=True):
+    """Rows strictly after (value, pk) when ordering by field then pk, NULL values last"""
+    op = 'lt' if descending else 'gt'
+    if value is None:
+        return Q(**{f'{field}__isnull': True, f'pk__{op}': pk})
+    condition = keyset_range(field, value, pk, op)
+    if nullable:
+        # Left out for NOT NULL columns, the extra OR branch also turns the range search into a scan
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+def keyset_before(field, value, pk, descending):
+    """Rows strictly before (value, pk) in the same ordering"""
+    op = 'gt' if descending else 'lt'
+    if value is None:
+        return Q(**{f'{field}__isnull': False}) | Q(**{f'{field}__isnull': True, f'pk__{op}': pk})
+    return keyset_range(field, value, pk, op)
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination over (ordering field, pk) with opaque cursors.
+
+    Pages are fetched with an indexed range condition instead of COUNT(*) and
+    OFFSET, so deep pages cost the same as the first one and stay stable when
+    rows are inserted concurrently. The ordering field is the first term of
+    the queryset ordering (OrderingFilter or Meta.ordering); the primary key
+    breaks ties.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    relevance_ordering_message = 'Results ordered by relevance cannot be paged with a cursor, use page numbers or ?ordering='
+
+    def __init__(self):
+        self.page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+        self.max_page_size = MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """(field, descending) of the first ordering term"""
+        if queryset.query.extra_order_by:
+            # Full-text search ranks are extra() selects, which cannot be compared in a keyset condition
+            raise ValidationError({'pagination': [self.relevance_ordering_message]})
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['pk']
+        term = ordering[0]
+        if not isinstance(term, str):
+            term = ('-' if term.descending else '') + term.expression.name
+        field = term.lstrip('-')
+        if field == 'pk':
+            field = queryset.model._meta.pk.name
+        return field, term.startswith('-')
+
+    def ordering_field(self, queryset):
+        if self.field in queryset.query.annotations:
+            # Computed ordering such as the distance of a map search
+            return queryset.query.annotations[self.field].output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def encode_cursor(self, row, reverse):
+        # Rows are model instances, or values() dicts on the fast serialization path
+        if isinstance(row, dict):
+            value, pk = row[self.field], row[self.pk_column]
+        else:
+            value, pk = getattr(row, self.field), row.pk
+        position = {
+            'o': ('-' if self.descending else '') + self.field,
+            'v': None if value is None else str(value.isoformat() if hasattr(value, 'isoformat') else value),
+            'pk': pk,
+            'r': reverse,
+        }
+        cursor = base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if position['o'] != ('-' if self.descending else '') + self.field:
+                raise ValueError('Cursor ordering does not match the requested ordering')
+            value = None if position['v'] is None else self.ordering_field(queryset).to_python(position['v'])
+            return value, int(position['pk']), bool(position['r'])
+        except (TypeError, ValueError, KeyError, FieldDoesNotExist, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def page_queryset(self, queryset, request):
+        """Queryset of the requested page plus one row telling whether there is another page"""
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(queryset)
+        self.pk_column = queryset.model._meta.pk.attname
+        self.requested_page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, queryset)
+        reverse = bool(self.cursor and self.cursor[2])
+
+        # NULL values sort last going forwards, hence first when walking backwards
+        if self.descending != reverse:
+            order = [F(self.field).desc(nulls_first=reverse, nulls_last=not reverse), '-pk']
+        else:
+            order = [F(self.field).asc(nulls_first=reverse, nulls_last=not reverse), 'pk']
+        queryset = queryset.order_by(*order)
+        if queryset._fields and self.field not in queryset._fields:
+            # values() rows need the ordering column to build cursors
+            queryset = queryset.values(*queryset._fields, self.field)
+        if self.cursor:
+            value, pk, _ = self.cursor
+            if reverse:
+                condition = keyset_before(self.field, value, pk, self.descending)
+            else:
+                nullable = self.field in queryset.query.annotations or self.ordering_field(queryset).null
+                condition = keyset_after(self.field, value, pk, self.descending, nullable)
+            queryset = queryset.filter(condition)
+        return queryset[:self.requested_page_size + 1]
+
+    def paginate_rows(self, rows):
+        """Page of the rows fetched from page_queryset()"""
+        reverse = bool(self.cursor and self.cursor[2])
+        has_more = len(rows) > self.requested_page_size
+        rows = rows[:self.requested_page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.first_row = rows[0] if rows else None
+        self.last_row = rows[-1] if rows else None
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.page_queryset(queryset, request)))
+
+    def page_state(self, queryset, request):
+        """Rows of the requested page and the next one, identifying the page with one query"""
+        return list(self.page_queryset(queryset, request))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_row is None:
+            return None
+        return self.encode_cursor(self.last_row, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first_row is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.first_row, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class StandardPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+    def page_bounds(self, request):
+        """Page number, page size and offset of the rows of the requested page"""
+        page_size = self.get_page_size(request)
+        try:
+            number = int(request.query_params.get(self.page_query_param) or 1)
+        except ValueError:
+            number = 0
+        if number < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=number, message='Invalid page.'))
+        return number, page_size, (number - 1) * page_size
+
+    def page_state(self, queryset, request):
+        """Rows of the requested page, each carrying the row count, fetched with one query.
+
+        The count is an uncorrelated COUNT(*) subquery, evaluated once, so the
+        page and the number of pages are both covered by the same query.
+        """
+        _, page_size, offset = self.page_bounds(request)
+        if queryset.query.extra:
+            # Raw where clauses name the outer tables, which the subquery's aliases would not match
+            count = queryset.count()
+            return [dict(row, page_row_count=count) for row in queryset[offset:offset + page_size]]
+        count = queryset.order_by().values(rows=Func(template='COUNT(*)', output_field=IntegerField()))
+        return list(queryset.annotate(page_row_count=Subquery(count))[offset:offset + page_size])
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset with the async ORM, counting and fetching the page concurrently"""
+        number, page_size, offset = self.page_bounds(request)
+
+        async def fetch():
+            return [row async for row in queryset[offset:offset + page_size]]
+
+        count, rows = await asyncio.gather(queryset.acount(), fetch())
+        if not rows and number > 1:
+            raise NotFound(self.invalid_page_message.format(page_number=number, message='That page contains no results'))
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Already counted, Paginator.count is a cached property
+        paginator.count = count
+        self.page = Page(rows, number, paginator)
+        self.request = request
+        return rows
+
+
+class HybridPagination(BasePagination):
+    """Page-number pagination by default, keyset pagination with ?pagination=cursor or a cursor"""
+    pagination_query_param = 'pagination'
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.pagination_query_param) == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = KeysetPagination() if self.use_keyset(request) else StandardPageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views"""
+        if self.use_keyset(request):
+            self.paginator = KeysetPagination()
+            return self.paginator.paginate_rows([row async for row in self.paginator.page_queryset(queryset, request)])
+        self.paginator = StandardPageNumberPagination()
+        return await self.paginator.apaginate_queryset(queryset, request, view)
+
+    def page_state(self, queryset, request):
+        """Rows identifying the page a request is served, see the page_state() of both paginators"""
+        paginator = KeysetPagination() if self.use_keyset(request) else StandardPageNumberPagination()
+        return paginator.page_state(queryset, request)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
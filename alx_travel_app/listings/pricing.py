@@ -0,0 +1,194 @@
+from bisect import bisect_left, bisect_right
+from decimal import ROUND_HALF_UP, Decimal
+from django.conf import settings
+from django.db.models import Q
+from .cache import LocalLRUCache, invalidate, listing_cache
+from .models import BookedNight, RateRule
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal(100)
+# Open ends of the rule windows, as date ordinals
+FIRST_DAY, LAST_DAY = float('-inf'), float('inf')
+ALL_WEEKDAYS = 0b1111111
+
+
+def money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def rates_tag(pk):
+    return f'rates:{pk}'
+
+
+def invalidate_rate_plans(listing_ids):
+    """Drop the memoized rate plans of listings once the current transaction commits"""
+    if listing_ids:
+        invalidate(*map(rates_tag, listing_ids))
+
+
+def window(rule):
+    start = rule.start_date.toordinal() if rule.start_date else FIRST_DAY
+    end = rule.end_date.toordinal() if rule.end_date else LAST_DAY
+    return start, end
+
+
+class RatePlan:
+    """Rate rules of a listing compiled for pricing date ranges.
+
+    Rule windows split the calendar into segments in which the same rules
+    apply; the prices of the seven weekdays of a segment are computed once
+    and repeated over the nights of a range, so pricing a stay costs one
+    step per segment it crosses rather than a rule scan per night.
+    """
+
+    def __init__(self, base_price, rules):
+        self.base_price = Decimal(str(base_price))
+        self.nightly_rules = []
+        self.stay_discounts = []
+        self.fees = []
+        for rule in rules:
+            start, end = window(rule)
+            weekdays = rule.weekdays or ALL_WEEKDAYS
+            # (start, end, weekdays, kind, rank among the price rules, price or factor)
+            if rule.kind == 'price':
+                self.nightly_rules.append((start, end, weekdays, 'price', (rule.priority, rule.pk), rule.amount))
+            elif rule.kind == 'adjustment':
+                self.nightly_rules.append((start, end, weekdays, 'adjustment', None, 1 + rule.percent / HUNDRED))
+            elif rule.kind == 'stay_discount':
+                self.stay_discounts.append((start, end, rule.min_nights, rule.percent))
+            elif rule.kind == 'fee':
+                self.fees.append((start, end, rule.amount))
+        self.bounds = sorted({
+            bound for start, end, *_ in self.nightly_rules for bound in (start, end) if bound not in (FIRST_DAY, LAST_DAY)
+        })
+        self.weeks = {}
+
+    def week(self, ordinal):
+        """Prices of the nights from Monday to Sunday in the segment holding the date ordinal"""
+        segment = bisect_right(self.bounds, ordinal)
+        week = self.weeks.get(segment)
+        if week is None:
+            active = [rule for rule in self.nightly_rules if rule[0] <= ordinal < rule[1]]
+            week = []
+            for weekday in range(7):
+                bit = 1 << weekday
+                matching = [rule for rule in active if rule[2] & bit]
+                prices = [rule for rule in matching if rule[3] == 'price']
+                price = max(prices, key=lambda rule: rule[4])[5] if prices else self.base_price
+                for rule in matching:
+                    if rule[3] == 'adjustment':
+                        price *= rule[5]
+                week.append(money(price))
+            self.weeks[segment] = week
+        return week
+
+    def nightly_prices(self, check_in, check_out):
+        """Price of each night from check-in (included) to check-out (excluded)"""
+        first, last = check_in.toordinal(), check_out.toordinal()
+        cuts = [first, *self.bounds[bisect_right(self.bounds, first):bisect_left(self.bounds, last)], last]
+        prices = []
+        for start, end in zip(cuts, cuts[1:]):
+            week = self.week(start)
+            # Ordinal 1 (0001-01-01) is a Monday
+            weekday = (start - 1) % 7
+            rotated = week[weekday:] + week[:weekday]
+            weeks, rest = divmod(end - start, 7)
+            prices += rotated * weeks + rotated[:rest]
+        return prices
+
+    def quote(self, check_in, check_out):
+        """Nightly prices, subtotal, length of stay discount, fees and total of a stay"""
+        nightly = self.nightly_prices(check_in, check_out)
+        nights = len(nightly)
+        arrival = check_in.toordinal()
+        subtotal = sum(nightly, Decimal(0))
+        percent = max(
+            (percent for start, end, min_nights, percent in self.stay_discounts
+             if start <= arrival < end and nights >= min_nights),
+            default=Decimal(0),
+        )
+        discount = money(subtotal * percent / HUNDRED)
+        fees = sum((amount for start, end, amount in self.fees if start <= arrival < end), Decimal(0))
+        return {
+            'nights': nights,
+            'nightly': nightly,
+            'subtotal': subtotal,
+            'discount': discount,
+            'fees': fees,
+            'total': subtotal - discount + fees,
+        }
+
+
+plan_cache = LocalLRUCache(getattr(settings, 'LISTINGS_RATE_PLAN_CACHE_SIZE', 4096))
+
+
+def rate_plans(listings):
+    """Compiled rate plan of each listing, by primary key.
+
+    Plans are memoized per process under the version of the listing's
+    rates tag and its price_per_night; the rules of the listings without
+    one are loaded with a single query.
+    """
+    listings = list(listings)
+    versions = listing_cache.versions([rates_tag(listing.pk) for listing in listings]) if listings else []
+    plans, missing = {}, {}
+    for listing, version in zip(listings, versions):
+        key = (listing.pk, listing.price_per_night, version)
+        plan = plan_cache.get(key)
+        if plan is None:
+            missing[listing.pk] = (key, listing.price_per_night)
+        else:
+            plans[listing.pk] = plan
+    if missing:
+        rules = {}
+        for rule in RateRule.objects.filter(listing_id__in=list(missing)).order_by('pk'):
+            rules.setdefault(rule.listing_id, []).append(rule)
+        timeout = getattr(settings, 'LISTINGS_RATE_PLAN_TIMEOUT', 3600)
+        for pk, (key, base_price) in missing.items():
+            plans[pk] = RatePlan(base_price, rules.get(pk, []))
+            plan_cache.set(key, plans[pk], timeout)
+    return plans
+
+
+def stay_total(listing, check_in, check_out):
+    """Total price of a stay at a listing under its rate rules"""
+    return rate_plans([listing])[listing.pk].quote(check_in, check_out)['total']
+
+
+def quote_stays(listings, stays):
+    """Quote and availability of each stay whose listing is in `listings` (by primary key).
+
+    All the stays are priced from the plans of their listings and checked
+    against the booked nights with a single query.
+    """
+    stays = [stay for stay in stays if stay['listing'] in listings]
+    plans = rate_plans(listings.values())
+    spans = {}
+    for stay in stays:
+        low, high = spans.get(stay['listing'], (stay['check_in'], stay['check_out']))
+        spans[stay['listing']] = (min(low, stay['check_in']), max(high, stay['check_out']))
+    booked = {}
+    if spans:
+        condition = Q()
+        for listing_id, (low, high) in spans.items():
+            condition |= Q(listing_id=listing_id, date__gte=low, date__lt=high)
+        for listing_id, date in BookedNight.objects.filter(condition).values_list('listing_id', 'date'):
+            booked.setdefault(listing_id, set()).add(date)
+
+    quotes = []
+    for stay in stays:
+        quote = plans[stay['listing']].quote(stay['check_in'], stay['check_out'])
+        taken = booked.get(stay['listing'], ())
+        quotes.append({
+            'listing': stay['listing'],
+            'check_in': stay['check_in'].isoformat(),
+            'check_out': stay['check_out'].isoformat(),
+            'available': not any(stay['check_in'] <= date < stay['check_out'] for date in taken),
+            'nights': quote['nights'],
+            'nightly': ['{:f}'.format(price) for price in quote['nightly']],
+            'subtotal': '{:f}'.format(money(quote['subtotal'])),
+            'discount': '{:f}'.format(money(quote['discount'])),
+            'fees': '{:f}'.format(money(quote['fees'])),
+            'total': '{:f}'.format(money(quote['total'])),
+        })
+    return quotes
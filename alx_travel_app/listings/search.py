@@ -0,0 +1,135 @@
+import re
+from django.conf import settings
+from django.db import connections
+from rest_framework import filters
+from .models import Listing
+
+# Indexed columns (created by migration 0002_search_index) and their relevance weights, highest first
+SEARCH_FIELDS = ['title', 'city', 'country', 'address', 'description']
+FIELD_WEIGHTS = [10.0, 5.0, 3.0, 2.0, 1.0]
+
+MAX_TERMS = 10
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+
+def search_terms(query):
+    """Words of a search query; punctuation never reaches the full-text syntax"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+class SQLiteSearchBackend:
+    """FTS5 external-content table mirroring the listing text columns.
+
+    Triggers keep it in sync with every write to the listing table,
+    including bulk_create and queryset updates that send no signals;
+    migration 0002_search_index creates both.
+    """
+    table = Listing._meta.db_table + '_fts'
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def match(self, terms):
+        # Every term must match, as a prefix of an indexed word
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, terms):
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+        listing_table = Listing._meta.db_table
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {listing_table}.id', f'{self.table} MATCH %s'],
+            params=[self.match(terms)],
+            # bm25() is lower for better matches
+            select={'search_rank': f'bm25({self.table}, {weights})'},
+            order_by=['search_rank', f'{listing_table}.id'],
+        )
+
+    def highlight(self, queryset, terms):
+        title = SEARCH_FIELDS.index('title')
+        description = SEARCH_FIELDS.index('description')
+        return queryset.extra(select={
+            'search_title': f"highlight({self.table}, {title}, %s, %s)",
+            'search_snippet': f"snippet({self.table}, {description}, %s, %s, '…', 16)",
+        }, select_params=[HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END])
+
+
+class PostgresSearchBackend:
+    """Stored generated tsvector column with a GIN index, maintained by PostgreSQL itself (see 0002_search_index)"""
+    column = 'search_vector'
+    index = 'listing_search_vector_idx'
+
+    @property
+    def config(self):
+        return getattr(settings, 'LISTINGS_SEARCH_CONFIG', 'simple')
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {self.index}")
+
+    def match(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, queryset, terms):
+        listing_table = Listing._meta.db_table
+        query = f"to_tsquery('{self.config}', %s)"
+        return queryset.extra(
+            where=[f'{listing_table}.{self.column} @@ {query}'],
+            params=[self.match(terms)],
+            select={'search_rank': f'ts_rank({listing_table}.{self.column}, {query})'},
+            select_params=[self.match(terms)],
+            order_by=['-search_rank', f'{listing_table}.id'],
+        )
+
+    def highlight(self, queryset, terms):
+        query = f"to_tsquery('{self.config}', %s)"
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}'
+        return queryset.extra(select={
+            'search_title': f"ts_headline('{self.config}', title, {query}, %s)",
+            'search_snippet': f"ts_headline('{self.config}', description, {query}, %s)",
+        }, select_params=[
+            self.match(terms), f'{options}, HighlightAll=true',
+            self.match(terms), f'{options}, MaxWords=16, MinWords=8',
+        ])
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend(using='default'):
+    """Full-text backend of a database, None when its engine has none"""
+    if not getattr(settings, 'LISTINGS_FULL_TEXT_SEARCH', True):
+        return None
+    return BACKENDS.get(connections[using].vendor)
+
+
+def search(queryset, query):
+    """Listings matching every word of a query (as word prefixes), best matches first"""
+    backend = get_backend(queryset.db)
+    if backend is None:
+        return queryset
+    terms = search_terms(query)
+    if not terms:
+        # Only punctuation, which no indexed word contains
+        return queryset.none()
+    return backend.search(queryset, terms)
+
+
+def highlight(queryset, query):
+    """Add `search_title` and `search_snippet`, matches marked, to a queryset filtered by search()"""
+    return get_backend(queryset.db).highlight(queryset, search_terms(query))
+
+
+class ListingSearchFilter(filters.SearchFilter):
+    """SearchFilter answering ?search= from the full-text index when the database has one"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or get_backend(queryset.db) is None:
+            return super().filter_queryset(request, queryset, view)
+        return search(queryset, ' '.join(terms))
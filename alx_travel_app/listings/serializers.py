@@ -1,8 +1,48 @@
+from datetime import date, timedelta
+from django.conf import settings
 from rest_framework import serializers
-from .models import Listing, Booking, Review
+from .availability import ACTIVE_STATUSES, BookingConflict, is_available
+from .metrics import timed_serialization
+from .models import Listing, Booking, Review, RateRule
+from .pricing import stay_total
 from django.contrib.auth.models import User
 
 
+class DynamicFieldsMixin:
+    """Serializer mixin restricting the output to the fields a client asked for.
+
+    `fields` replaces the default field set, `expand` adds fields to it and
+    `omit` removes fields from it. Meta.default_fields, when present, is the
+    default field set; otherwise every field is included.
+    """
+    def __init__(self, *args, fields=None, omit=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields or omit or expand:
+            selected = set(self.select_fields(fields, omit, expand))
+        elif hasattr(self.Meta, 'default_fields'):
+            selected = set(self.Meta.default_fields)
+        else:
+            return
+        for name in list(self.fields):
+            if name not in selected and not self.fields[name].write_only:
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        return timed_serialization(super().to_representation, instance)
+
+    @classmethod
+    def select_fields(cls, fields=None, omit=None, expand=None):
+        """Names of the output fields selected by the given parameters, in Meta.fields order"""
+        available = cls.Meta.fields
+        if fields:
+            selected = set(fields)
+        else:
+            selected = set(getattr(cls.Meta, 'default_fields', available))
+        selected |= set(expand or [])
+        selected -= set(omit or [])
+        return [name for name in available if name in selected]
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User model"""
     class Meta:
@@ -10,7 +50,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Review model"""
     reviewer = UserSerializer(read_only=True)
     
@@ -20,11 +60,10 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Listing model"""
     host = UserSerializer(read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
-    average_rating = serializers.SerializerMethodField()
     
     class Meta:
         model = Listing
@@ -32,20 +71,22 @@ class ListingSerializer(serializers.ModelSerializer):
             'id', 'title', 'description', 'address', 'city', 'country',
             'price_per_night', 'property_type', 'max_guests', 'bedrooms',
             'bathrooms', 'image', 'has_wifi', 'has_kitchen', 'has_air_conditioning',
-            'has_heating', 'has_tv', 'has_parking', 'has_pool', 'created_at',
-            'host', 'reviews', 'average_rating'
+            'has_heating', 'has_tv', 'has_parking', 'has_pool', 'latitude', 'longitude',
+            'created_at', 'host', 'reviews', 'average_rating'
         ]
-        read_only_fields = ['id', 'created_at', 'host']
-    
-    def get_average_rating(self, obj):
-        """Calculate average rating for a listing"""
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            return sum(review.rating for review in reviews) / reviews.count()
-        return None
+        read_only_fields = ['id', 'created_at', 'host', 'average_rating']
+
 
+class ListingSummarySerializer(ListingSerializer):
+    """Compact Listing representation used by list pages"""
+    class Meta(ListingSerializer.Meta):
+        default_fields = [
+            'id', 'title', 'city', 'country', 'price_per_night', 'property_type',
+            'max_guests', 'image', 'average_rating', 'latitude', 'longitude'
+        ]
 
-class BookingSerializer(serializers.ModelSerializer):
+
+class BookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Booking model"""
     guest = UserSerializer(read_only=True)
     listing = ListingSerializer(read_only=True)
@@ -74,35 +115,186 @@ class BookingSerializer(serializers.ModelSerializer):
         if data['guests_count'] > data['listing'].max_guests:
             raise serializers.ValidationError(f"This listing can only accommodate {data['listing'].max_guests} guests")
         
-        # Check for booking conflicts
-        listing = data['listing']
-        check_in = data['check_in_date']
-        check_out = data['check_out_date']
-        
-        # Exclude current booking when updating
-        existing_bookings = Booking.objects.filter(
-            listing=listing,
-            status__in=['pending', 'confirmed'],
-        )
-        
-        if self.instance:
-            existing_bookings = existing_bookings.exclude(pk=self.instance.pk)
-        
-        for booking in existing_bookings:
-            if (check_in <= booking.check_out_date and check_out >= booking.check_in_date):
-                raise serializers.ValidationError("This listing is already booked for the selected dates")
+        # Check for booking conflicts with one indexed lookup on the booked nights
+        status = data.get('status', self.instance.status if self.instance else 'pending')
+        if status in ACTIVE_STATUSES and not is_available(
+            data['listing'], data['check_in_date'], data['check_out_date'], exclude_booking=self.instance
+        ):
+            raise serializers.ValidationError("This listing is already booked for the selected dates")
         
         return data
     
     def create(self, validated_data):
-        """Create a new booking and calculate total price"""
-        # Calculate number of nights
-        nights = (validated_data['check_out_date'] - validated_data['check_in_date']).days
-        
-        # Calculate total price
-        validated_data['total_price'] = validated_data['listing'].price_per_night * nights
+        """Create a new booking priced by the listing's rate rules"""
+        # Price the stay with the listing's rate rules
+        validated_data['total_price'] = stay_total(
+            validated_data['listing'], validated_data['check_in_date'], validated_data['check_out_date']
+        )
         
         # Set the guest to the current user
         validated_data['guest'] = self.context['request'].user
         
-        return super().create(validated_data)
\ No newline at end of file
+        # The nights are reserved on save, which fails if a concurrent booking took them first
+        try:
+            return super().create(validated_data)
+        except BookingConflict as exc:
+            raise serializers.ValidationError(str(exc))
+    
+    def update(self, instance, validated_data):
+        """Update a booking, re-reserving its nights when the stay changes"""
+        try:
+            return super().update(instance, validated_data)
+        except BookingConflict as exc:
+            raise serializers.ValidationError(str(exc))
+
+
+class ListingBookingSerializer(serializers.ModelSerializer):
+    """Compact Booking representation nested under a listing, without the listing itself"""
+    guest = UserSerializer(read_only=True)
+    
+    class Meta:
+        model = Booking
+        fields = [
+            'id', 'guest', 'check_in_date', 'check_out_date', 'guests_count',
+            'total_price', 'status', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class ListingReviewSerializer(serializers.ModelSerializer):
+    """Compact Review representation nested under a listing"""
+    reviewer = UserSerializer(read_only=True)
+    
+    class Meta:
+        model = Review
+        fields = ['id', 'reviewer', 'booking', 'rating', 'comment', 'created_at']
+        read_only_fields = fields
+
+
+class BookingExportSerializer(serializers.ModelSerializer):
+    """Flat Booking row of the exports, related objects as ids"""
+    class Meta:
+        model = Booking
+        fields = [
+            'id', 'listing', 'guest', 'check_in_date', 'check_out_date', 'guests_count',
+            'total_price', 'status', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class ReviewExportSerializer(serializers.ModelSerializer):
+    """Flat Review row of the exports, related objects as ids"""
+    class Meta:
+        model = Review
+        fields = ['id', 'listing', 'reviewer', 'booking', 'rating', 'comment', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+def listing_ids(value):
+    """Listing ids of a comma-separated ?ids= parameter, at most LISTINGS_CALENDAR_MAX_LISTINGS"""
+    try:
+        ids = [int(pk) for pk in value.split(',') if pk.strip()]
+    except ValueError:
+        raise serializers.ValidationError("Expected comma-separated listing ids")
+    max_listings = getattr(settings, 'LISTINGS_CALENDAR_MAX_LISTINGS', 50)
+    if len(ids) > max_listings:
+        raise serializers.ValidationError(f"At most {max_listings} listings per request")
+    return ids
+
+
+def validate_stay(check_in, check_out):
+    if check_in >= check_out:
+        raise serializers.ValidationError("Check-out date must be after check-in date")
+    max_days = getattr(settings, 'LISTINGS_CALENDAR_MAX_DAYS', 366)
+    if (check_out - check_in).days > max_days:
+        raise serializers.ValidationError(f"A stay lasts at most {max_days} nights")
+
+
+class CalendarQuerySerializer(serializers.Serializer):
+    """Date window of the availability calendar, 30 nights from today by default"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    ids = serializers.CharField(required=False)
+    
+    def validate_ids(self, value):
+        return listing_ids(value)
+    
+    def validate(self, data):
+        start = data.setdefault('start', date.today())
+        end = data.setdefault('end', start + timedelta(days=30))
+        if start >= end:
+            raise serializers.ValidationError("The end date must be after the start date")
+        max_days = getattr(settings, 'LISTINGS_CALENDAR_MAX_DAYS', 366)
+        if (end - start).days > max_days:
+            raise serializers.ValidationError(f"The calendar covers at most {max_days} nights")
+        return data
+
+
+class QuoteQuerySerializer(serializers.Serializer):
+    """Listings (?ids=) priced over the same stay, e.g. for a page of search results"""
+    ids = serializers.CharField()
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    
+    def validate_ids(self, value):
+        return listing_ids(value)
+    
+    def validate(self, data):
+        validate_stay(data['check_in'], data['check_out'])
+        return data
+
+
+class StaySerializer(serializers.Serializer):
+    """Stay of a listing to price"""
+    listing = serializers.IntegerField()
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    
+    def validate(self, data):
+        validate_stay(data['check_in'], data['check_out'])
+        return data
+
+
+class QuoteRequestSerializer(serializers.Serializer):
+    """Body of a quote request pricing several stays, of one or several listings"""
+    stays = StaySerializer(many=True, allow_empty=False)
+    
+    def validate_stays(self, value):
+        max_stays = getattr(settings, 'LISTINGS_QUOTE_MAX_STAYS', 100)
+        if len(value) > max_stays:
+            raise serializers.ValidationError(f"At most {max_stays} stays per request")
+        return value
+
+
+class RateRuleSerializer(serializers.ModelSerializer):
+    """Serializer for the rate rules of a listing"""
+    
+    class Meta:
+        model = RateRule
+        fields = [
+            'id', 'kind', 'name', 'start_date', 'end_date', 'weekdays', 'amount', 'percent',
+            'min_nights', 'priority'
+        ]
+        read_only_fields = ['id']
+    
+    def validate_weekdays(self, value):
+        if value > 0b1111111:
+            raise serializers.ValidationError("Weekdays is a bitmask of seven days, Monday being 1")
+        return value
+    
+    def validate(self, data):
+        """Check that the rule has the values its kind needs"""
+        kind = data['kind']
+        if kind in ['price', 'fee'] and data.get('amount') is None:
+            raise serializers.ValidationError({'amount': ["This field is required for this kind of rule."]})
+        if kind in ['adjustment', 'stay_discount'] and data.get('percent') is None:
+            raise serializers.ValidationError({'percent': ["This field is required for this kind of rule."]})
+        if data.get('amount') is not None and data['amount'] < 0:
+            raise serializers.ValidationError({'amount': ["Ensure this value is greater than or equal to 0."]})
+        if kind == 'adjustment' and data['percent'] <= -100:
+            raise serializers.ValidationError({'percent': ["An adjustment cannot lower prices by 100% or more."]})
+        if kind == 'stay_discount' and not 0 <= data['percent'] <= 100:
+            raise serializers.ValidationError({'percent': ["A discount is between 0 and 100%."]})
+        if data.get('start_date') and data.get('end_date') and data['start_date'] >= data['end_date']:
+            raise serializers.ValidationError({'end_date': ["End date must be after start date."]})
+        return data
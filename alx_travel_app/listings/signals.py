@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate, listing_tag
+from .models import Booking, Listing, RateRule, Review
+from .pricing import invalidate_rate_plans
+from .serializers import UserSerializer
+from .tasks import notify_bookings, refresh_rating_aggregates
+
+
+@receiver(post_save, sender=Review)
+def update_listing_on_review_save(sender, instance, created, raw=False, **kwargs):
+    """Apply a created or edited review to its listing's rating aggregates and cached payloads"""
+    if raw:
+        # Fixture loading; run rebuild_rating_aggregates afterwards
+        return
+    previous = getattr(instance, '_loaded_rating', None)
+    current = (instance.listing_id, instance.rating)
+    listing_ids = {instance.listing_id}
+    if previous and previous[0] is not None:
+        listing_ids.add(previous[0])
+    listings = Listing.objects.using(kwargs.get('using'))
+    if created:
+        listings.filter(pk=instance.listing_id).apply_rating_delta(instance.rating, 1)
+    elif previous is None or None in previous:
+        # Original values unknown (e.g. deferred fields), recompute both sides in the background
+        listings.filter(pk__in=listing_ids).touch()
+        refresh_rating_aggregates.delay(sorted(listing_ids))
+    elif previous != current:
+        listings.filter(pk=previous[0]).apply_rating_delta(previous[1], -1)
+        listings.filter(pk=instance.listing_id).apply_rating_delta(instance.rating, 1)
+    else:
+        # Only the comment changed; the listing payload embeds it
+        listings.filter(pk=instance.listing_id).touch()
+    instance._loaded_rating = current
+    # Reviews are embedded in their listing's payload
+    invalidate('listings', *map(listing_tag, listing_ids))
+
+
+@receiver(post_delete, sender=Review)
+def update_listing_on_review_delete(sender, instance, **kwargs):
+    """Remove a deleted review from its listing's rating aggregates and cached payloads"""
+    previous = getattr(instance, '_loaded_rating', None)
+    listing_id, rating = previous if previous and None not in previous else (instance.listing_id, instance.rating)
+    Listing.objects.using(kwargs.get('using')).filter(pk=listing_id).apply_rating_delta(rating, -1)
+    invalidate('listings', listing_tag(listing_id))
+
+
+@receiver([post_save, post_delete], sender=Listing)
+def invalidate_listing_cache(sender, instance, **kwargs):
+    """Drop cached list pages and the listing's detail response"""
+    invalidate('listings', listing_tag(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_listings(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Drop the cached payloads of the listings embedding the user as their host or a reviewer"""
+    if created or raw or (update_fields is not None and not set(UserSerializer.Meta.fields) & set(update_fields)):
+        # New users are in no listing yet; logins only save last_login
+        return
+    listings = Listing.objects.using(kwargs.get('using'))
+    listing_ids = set(listings.filter(host=instance).values_list('pk', flat=True))
+    listing_ids.update(listings.filter(reviews__reviewer=instance).values_list('pk', flat=True))
+    if listing_ids:
+        # New validators too, so clients holding an ETag get the new payload
+        listings.filter(pk__in=listing_ids).touch()
+        invalidate('listings', *map(listing_tag, listing_ids))
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def invalidate_availability_cache(sender, instance, **kwargs):
+    """Bookings only change the results of date-range searches"""
+    invalidate('bookings')
+
+
+@receiver(post_save, sender=Booking)
+def notify_booking_change(sender, instance, created, raw=False, **kwargs):
+    """Email the guest and the host in the background when a booking is created or changes status"""
+    if raw:
+        return
+    # Booking.save() updates the stored stay after the signal
+    previous = getattr(instance, '_loaded_stay', None)
+    if created:
+        notify_bookings([(instance.pk, 'created')])
+    elif previous is not None and previous[3] != instance.status:
+        notify_bookings([(instance.pk, instance.status)])
+
+
+@receiver([post_save, post_delete], sender=RateRule)
+def invalidate_rate_plan(sender, instance, **kwargs):
+    """Drop the memoized rate plan of the rule's listing"""
+    invalidate_rate_plans({instance.listing_id})
@@ -0,0 +1,76 @@
+import csv
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from .renderers import FastJSONRenderer
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+CSV_CONTENT_TYPE = 'text/csv'
+# Not ?format=, which DRF reserves for renderer selection
+STREAM_QUERY_PARAM = 'stream'
+STREAM_FORMATS = ['ndjson', 'csv']
+
+
+def stream_format(request, default=None):
+    """Streaming format asked for with ?stream=ndjson or ?stream=csv, default when absent"""
+    value = request.query_params.get(STREAM_QUERY_PARAM) or default
+    if value is not None and value not in STREAM_FORMATS:
+        raise ValidationError({STREAM_QUERY_PARAM: [f"Must be one of: {', '.join(STREAM_FORMATS)}"]})
+    return value
+
+
+def batches(rows, size):
+    """Lists of at most size rows read from an iterator"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def serialized_batches(compiled, queryset):
+    """Representations of every row of a queryset, fetched with a server-side iterator, batch by batch"""
+    size = getattr(settings, 'LISTINGS_STREAM_CHUNK_SIZE', 2000)
+    for batch in batches(compiled.fetch(queryset).iterator(chunk_size=size), size):
+        # Nested serializers cost one query per relation and batch
+        yield compiled.to_representation(batch)
+
+
+def ndjson_lines(compiled, queryset):
+    """One JSON document per row"""
+    renderer = FastJSONRenderer()
+    for items in serialized_batches(compiled, queryset):
+        yield b''.join(renderer.render(item) + b'\n' for item in items)
+
+
+class LineBuffer:
+    """File-like object handing back what csv.writer writes instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(compiled, queryset):
+    """Header line then one CSV line per row; nested objects are written as JSON"""
+    writer = csv.writer(LineBuffer())
+    renderer = FastJSONRenderer()
+    yield writer.writerow(compiled.field_names)
+    for items in serialized_batches(compiled, queryset):
+        yield ''.join(writer.writerow([
+            renderer.render(value).decode() if isinstance(value, (dict, list)) else value
+            for value in item.values()
+        ]) for item in items)
+
+
+def stream_response(compiled, queryset, output_format, filename=None):
+    """Streaming NDJSON or CSV response of every row of a queryset, in constant memory"""
+    if output_format == 'csv':
+        response = StreamingHttpResponse(csv_lines(compiled, queryset), content_type=CSV_CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(ndjson_lines(compiled, queryset), content_type=NDJSON_CONTENT_TYPE)
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{output_format}"'
+    return response
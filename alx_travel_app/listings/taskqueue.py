@@ -0,0 +1,233 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .db import routing_scope
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(name=None, max_attempts=None):
+    """Register a function as a background task.
+
+    The function gets `delay(*args)` and `delay_many(argument_lists)` to
+    enqueue calls; arguments must be JSON serializable. Calls are enqueued
+    with the current transaction and only run once it commits.
+    """
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.delay = lambda *args: enqueue(task_name, *args)
+        func.delay_many = lambda argument_lists: enqueue_many(task_name, argument_lists)
+        _tasks[task_name] = func
+        return func
+    return register
+
+
+def get_task(name):
+    return _tasks[name]
+
+
+def max_attempts(name):
+    func = _tasks.get(name)
+    if func is not None and func.max_attempts is not None:
+        return func.max_attempts
+    return getattr(settings, 'LISTINGS_TASK_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempt):
+    """Seconds before retrying a call that failed `attempt` times: exponential backoff with jitter"""
+    base = getattr(settings, 'LISTINGS_TASK_RETRY_DELAY', 5)
+    ceiling = getattr(settings, 'LISTINGS_TASK_MAX_RETRY_DELAY', 600)
+    return min(ceiling, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+def run_task(name, args):
+    """Run one call of a registered task, recording its outcome and duration; exceptions propagate"""
+    start = time.perf_counter()
+    outcome = 'failed'
+    try:
+        # Each call routes its reads on its own, whatever the calls before it wrote
+        with routing_scope():
+            get_task(name)(*args)
+        outcome = 'succeeded'
+    finally:
+        registry.record_task(name, outcome, time.perf_counter() - start)
+
+
+class LocalBackend:
+    """In-process thread pool; queued calls and pending retries are lost when the process exits"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+        self.queued = 0
+        self.retrying = 0
+
+    def executor(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'LISTINGS_TASK_WORKERS', 4), thread_name_prefix='listings-task'
+                )
+            return self.pool
+
+    def enqueue(self, name, argument_lists):
+        transaction.on_commit(lambda: [self.submit(name, args, 1) for args in argument_lists])
+
+    def submit(self, name, args, attempt):
+        with self.lock:
+            self.queued += 1
+        self.executor().submit(self.run, name, args, attempt)
+
+    def run(self, name, args, attempt):
+        with self.lock:
+            self.queued -= 1
+        try:
+            run_task(name, args)
+        except Exception:
+            if attempt >= max_attempts(name):
+                logger.exception("Task %s%r failed after %d attempts", name, tuple(args), attempt)
+                return
+            logger.warning("Task %s%r failed, retrying", name, tuple(args), exc_info=True)
+            with self.lock:
+                self.retrying += 1
+            timer = threading.Timer(retry_delay(attempt), self.retry, (name, args, attempt + 1))
+            timer.daemon = True
+            timer.start()
+        finally:
+            # Pool threads keep their own database connections
+            close_old_connections()
+
+    def retry(self, name, args, attempt):
+        with self.lock:
+            self.retrying -= 1
+        self.submit(name, args, attempt)
+
+    def stats(self):
+        with self.lock:
+            return {'queued': self.queued, 'retrying': self.retrying}
+
+    def shutdown(self):
+        """Wait for the queued calls (not the pending retries) to finish"""
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+class DatabaseBackend:
+    """Durable outbox: calls are OutboxTask rows written in the caller's transaction.
+
+    Nothing runs in the web process; `manage.py run_tasks` workers claim
+    and run the due rows.
+    """
+
+    def enqueue(self, name, argument_lists):
+        from .models import OutboxTask
+
+        attempts = max_attempts(name)
+        OutboxTask.objects.bulk_create([
+            OutboxTask(name=name, args=list(args), max_attempts=attempts) for args in argument_lists
+        ])
+
+    def stats(self):
+        from .models import OutboxTask
+
+        counts = dict(OutboxTask.objects.order_by().values_list('status').annotate(count=Count('pk')))
+        return {status: counts.get(status, 0) for status, _ in OutboxTask.STATUS_CHOICES}
+
+
+BACKENDS = {
+    'local': LocalBackend(),
+    'database': DatabaseBackend(),
+}
+
+
+def get_backend():
+    return BACKENDS[getattr(settings, 'LISTINGS_TASK_BACKEND', 'local')]
+
+
+def enqueue(name, *args):
+    enqueue_many(name, [args])
+
+
+def enqueue_many(name, argument_lists):
+    """Enqueue one call of a task per argument list"""
+    if name not in _tasks:
+        raise KeyError(f'Unknown task {name}')
+    argument_lists = [list(args) for args in argument_lists]
+    if argument_lists:
+        get_backend().enqueue(name, argument_lists)
+
+
+class Worker:
+    """Claims due OutboxTask rows in batches and runs them, rescheduling failures with backoff.
+
+    Rows are claimed under a lease of LISTINGS_TASK_LEASE_SECONDS: rows of
+    a worker that died are claimed again once their lease expires. Several
+    workers can run side by side.
+    """
+
+    def __init__(self, batch_size=100):
+        self.batch_size = batch_size
+        self.token = uuid.uuid4().hex
+        self.processed = 0
+        self.failed = 0
+
+    def claim(self):
+        from .models import OutboxTask
+
+        now = timezone.now()
+        lease = timedelta(seconds=getattr(settings, 'LISTINGS_TASK_LEASE_SECONDS', 300))
+        using = router.db_for_write(OutboxTask)
+        with transaction.atomic(using=using):
+            due = OutboxTask.objects.using(using).filter(
+                Q(status='pending', run_at__lte=now) | Q(status='running', locked_at__lt=now - lease)
+            ).order_by('run_at', 'pk')
+            if connections[using].features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('pk', flat=True)[:self.batch_size])
+            # The status condition keeps a row claimed by a concurrent worker on databases without row locks
+            OutboxTask.objects.using(using).filter(
+                Q(status='pending') | Q(status='running', locked_at__lt=now - lease), pk__in=ids
+            ).update(status='running', locked_at=now, locked_by=self.token, attempts=F('attempts') + 1)
+        return list(OutboxTask.objects.using(using).filter(pk__in=ids, status='running', locked_by=self.token))
+
+    def run(self, outbox_task):
+        claimed = type(outbox_task).objects.filter(pk=outbox_task.pk, locked_by=self.token)
+        try:
+            run_task(outbox_task.name, outbox_task.args)
+        except Exception as exc:
+            self.failed += 1
+            error = f'{type(exc).__name__}: {exc}'
+            if outbox_task.attempts >= outbox_task.max_attempts:
+                logger.exception("Task %s failed after %d attempts", outbox_task, outbox_task.attempts)
+                claimed.update(status='failed', last_error=error, locked_by='', locked_at=None)
+            else:
+                logger.warning("Task %s failed, retrying", outbox_task, exc_info=True)
+                claimed.update(
+                    status='pending', last_error=error, locked_by='', locked_at=None,
+                    run_at=timezone.now() + timedelta(seconds=retry_delay(outbox_task.attempts)),
+                )
+        else:
+            claimed.delete()
+        self.processed += 1
+
+    def run_batch(self):
+        """Claim and run one batch, returning the number of tasks run"""
+        batch = self.claim()
+        for outbox_task in batch:
+            self.run(outbox_task)
+        return len(batch)
@@ -0,0 +1,40 @@
+from django.core.mail import send_mail
+from .cache import invalidate, listing_tag
+from .models import Booking, Listing
+from .taskqueue import task
+
+# Booking events the guest and the host are emailed about; expired holds are cancelled bookings
+NOTIFIED_EVENTS = ['created', 'confirmed', 'cancelled', 'expired']
+
+
+@task()
+def send_booking_notification(booking_id, event):
+    """Email the guest and the host of a booking that was created, confirmed, cancelled or expired"""
+    booking = Booking.objects.select_related('listing__host', 'guest').filter(pk=booking_id).first()
+    if booking is None:
+        # Deleted since
+        return
+    listing = booking.listing
+    subject = f"Booking {event}: {listing.title}, {booking.check_in_date} to {booking.check_out_date}"
+    message = (
+        f"Booking #{booking.pk} of {listing.title} ({listing.city}, {listing.country}) by {booking.guest.username} "
+        f"for {booking.guests_count} guest(s) from {booking.check_in_date} to {booking.check_out_date} "
+        f"is {booking.status}. Total price: {booking.total_price}."
+    )
+    recipients = [email for email in (booking.guest.email, listing.host.email) if email]
+    if recipients:
+        send_mail(subject, message, None, recipients)
+
+
+def notify_bookings(events):
+    """Enqueue the notifications of (booking id, event) pairs, skipping events nobody is emailed about"""
+    send_booking_notification.delay_many([
+        (booking_id, event) for booking_id, event in events if event in NOTIFIED_EVENTS
+    ])
+
+
+@task()
+def refresh_rating_aggregates(listing_ids):
+    """Recompute the rating aggregates of listings from their reviews"""
+    Listing.objects.filter(pk__in=listing_ids).refresh_rating_aggregates()
+    invalidate('listings', *map(listing_tag, listing_ids))
@@ -0,0 +1,12 @@
+from listings.models import Listing
+
+
+def create_listing(host, **fields):
+    """Listing of `host` with valid defaults for the required fields"""
+    values = {
+        'title': 'Loft', 'description': 'A loft', 'address': '1 Main St', 'city': 'Boston',
+        'country': 'United States', 'price_per_night': 100, 'property_type': 'apartment',
+        'max_guests': 4, 'bedrooms': 1, 'bathrooms': 1,
+    }
+    values.update(fields)
+    return Listing.objects.create(host=host, **values)
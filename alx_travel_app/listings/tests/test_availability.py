@@ -0,0 +1,101 @@
+import threading
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from listings.availability import stay_nights
+from listings.models import BookedNight, Booking
+from listings.tests.factories import create_listing
+
+THREADS = 8
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database')
+class ConcurrentBookingTest(TransactionTestCase):
+    """Of several overlapping bookings posted at once, exactly one reserves the nights"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Concurrent writers need a file-backed test database')
+        host = User.objects.create_user('host')
+        self.listing = create_listing(host)
+        self.guests = [User.objects.create_user(f'guest{index}') for index in range(THREADS)]
+
+    def post_bookings(self):
+        """Status codes of one booking request per guest, all sent at the same time"""
+        barrier = threading.Barrier(THREADS)
+        statuses = [None] * THREADS
+
+        def book(index):
+            client = APIClient()
+            client.force_authenticate(self.guests[index])
+            # Every stay overlaps every other one: the latest check-in is before the earliest check-out
+            check_in = date(2030, 3, 1) + timedelta(days=index % 3)
+            payload = {
+                'listing_id': self.listing.pk, 'check_in_date': check_in.isoformat(),
+                'check_out_date': (check_in + timedelta(days=4)).isoformat(), 'guests_count': 2,
+            }
+            try:
+                barrier.wait()
+                statuses[index] = client.post('/api/bookings/', payload, format='json').status_code
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=book, args=(index,)) for index in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_exactly_one_overlapping_booking_succeeds(self):
+        statuses = self.post_bookings()
+        self.assertEqual(statuses.count(201), 1, statuses)
+        self.assertEqual(statuses.count(400), THREADS - 1, statuses)
+        booking = Booking.objects.get()
+        self.assertEqual(
+            set(BookedNight.objects.values_list('booking', 'listing', 'date')),
+            {(booking.pk, self.listing.pk, night) for night in stay_nights(booking.check_in_date, booking.check_out_date)},
+        )
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database', LISTINGS_CACHE_ENABLED=False)
+class BackToBackBookingTest(TestCase):
+    """Stays are half-open: the check-out day of a booking is free for the next check-in"""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        cls.guest = User.objects.create_user('guest')
+        cls.listing = create_listing(host)
+        # Nights of March 1 to 4
+        Booking.objects.create(listing=cls.listing, guest=User.objects.create_user('other'), guests_count=2,
+                               check_in_date=date(2030, 3, 1), check_out_date=date(2030, 3, 5), total_price='400.00')
+
+    def book(self, check_in, check_out):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        return client.post('/api/bookings/', {
+            'listing_id': self.listing.pk, 'check_in_date': check_in.isoformat(),
+            'check_out_date': check_out.isoformat(), 'guests_count': 2,
+        }, format='json')
+
+    def test_check_in_on_check_out_day_is_accepted(self):
+        response = self.book(date(2030, 3, 5), date(2030, 3, 8))
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_check_out_on_check_in_day_is_accepted(self):
+        response = self.book(date(2030, 2, 26), date(2030, 3, 1))
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_shared_night_is_refused(self):
+        for check_in, check_out in [(date(2030, 3, 4), date(2030, 3, 8)), (date(2030, 2, 26), date(2030, 3, 2))]:
+            with self.subTest(check_in=check_in, check_out=check_out):
+                self.assertEqual(self.book(check_in, check_out).status_code, 400)
+
+    def test_search_finds_the_listing_from_the_check_out_day(self):
+        response = APIClient().get('/api/listings/', {'check_in': '2030-03-05', 'check_out': '2030-03-08'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.listing.pk])
+        response = APIClient().get('/api/listings/', {'check_in': '2030-03-04', 'check_out': '2030-03-08'})
+        self.assertEqual(response.data['results'], [])
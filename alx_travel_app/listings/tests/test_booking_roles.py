@@ -0,0 +1,113 @@
+import json
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from listings.models import Booking
+from listings.tests.factories import create_listing
+
+HOST_BOOKINGS = 3000
+# Bookings of other hosts' listings: the host's bookings are a minority of the table, as in production
+OTHER_BOOKINGS = 20000
+
+# Queries of a /api/bookings/ page per role: validators, count, page and the embedded relations
+ROLE_QUERIES = {None: 8, 'guest': 8, 'host': 8}
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class BookingRoleTest(TestCase):
+    """A non-staff host with thousands of bookings gets their own bookings through index searches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host')
+        cls.other_host = User.objects.create_user('other_host')
+        cls.guests = [User.objects.create_user(f'guest{index}') for index in range(30)]
+        listings = [create_listing(cls.host, title=f'Loft {index}') for index in range(20)]
+        other_listings = [create_listing(cls.other_host, title=f'Cabin {index}') for index in range(20)]
+        bookings = [
+            cls.booking(listings[index % len(listings)], cls.guests[index % len(cls.guests)], index)
+            for index in range(HOST_BOOKINGS)
+        ]
+        # Stays of the host as a guest, and bookings of someone else's listings
+        bookings += [cls.booking(other_listings[index], cls.host, index) for index in range(len(other_listings))]
+        bookings += [
+            cls.booking(other_listings[index % len(other_listings)], cls.guests[index % len(cls.guests)], 1000 + index)
+            for index in range(OTHER_BOOKINGS)
+        ]
+        Booking.objects.bulk_create(bookings, batch_size=2000)
+        if connection.vendor == 'sqlite':
+            # Planner statistics, as a production database would have
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    @staticmethod
+    def booking(listing, guest, index):
+        check_in = date(2030, 1, 1) + timedelta(days=2 * (index // 20))
+        return Booking(listing=listing, guest=guest, check_in_date=check_in, check_out_date=check_in + timedelta(days=1),
+                       guests_count=1, total_price='100.00', status='confirmed')
+
+    def plan(self, sql, params):
+        """Steps of SQLite's EXPLAIN QUERY PLAN of a statement"""
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexSearches(self, sql, params):
+        """The booking table is searched through an index, and no table or index is scanned whole"""
+        steps = self.plan(sql, params)
+        self.assertEqual([step for step in steps if step.startswith('SCAN ')], [], steps)
+        self.assertTrue(any(step.startswith('SEARCH') and 'INDEX' in step for step in steps), steps)
+
+    def test_querysets_match_the_or_filter(self):
+        for user in [self.host, self.other_host, self.guests[0]]:
+            with self.subTest(user=user.username):
+                bookings = Booking.objects.order_by()
+                self.assertEqual(set(bookings.for_guest(user)), set(bookings.filter(guest=user)))
+                self.assertEqual(set(bookings.for_host(user)), set(bookings.filter(listing__host=user)))
+                self.assertEqual(set(bookings.for_user(user)),
+                                 set(bookings.filter(Q(guest=user) | Q(listing__host=user))))
+        self.assertEqual(Booking.objects.for_host(self.host).count(), HOST_BOOKINGS)
+        self.assertEqual(Booking.objects.for_user(self.host).count(), HOST_BOOKINGS + 20)
+
+    def test_queryset_plans(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plans are read from SQLite EXPLAIN QUERY PLAN')
+        for name in ['for_guest', 'for_host', 'for_user']:
+            with self.subTest(scope=name):
+                queryset = getattr(Booking.objects, name)(self.host).order_by('-created_at', '-pk')[:20]
+                self.assertIndexSearches(*queryset.query.sql_with_params())
+
+    def test_list_by_role(self):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        client = APIClient()
+        client.force_authenticate(self.host)
+        for role, total in [(None, HOST_BOOKINGS + 20), ('guest', 20), ('host', HOST_BOOKINGS)]:
+            with self.subTest(role=role):
+                query = {'page_size': 100} if role is None else {'role': role, 'page_size': 100}
+                statements.clear()
+                with self.assertNumQueries(ROLE_QUERIES[role]), connection.execute_wrapper(record):
+                    response = client.get('/api/bookings/', query)
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.content)
+                self.assertEqual(data['count'], total)
+                self.assertEqual(len(data['results']), min(total, 100))
+                if connection.vendor == 'sqlite':
+                    scoped = [(sql, params) for sql, params in statements if '"listings_booking"' in sql]
+                    self.assertTrue(scoped)
+                    for sql, params in scoped:
+                        steps = self.plan(sql, params)
+                        self.assertFalse([step for step in steps if step.startswith('SCAN listings_booking')], steps)
+
+    def test_unknown_role_is_refused(self):
+        client = APIClient()
+        client.force_authenticate(self.host)
+        self.assertEqual(client.get('/api/bookings/', {'role': 'admin'}).status_code, 400)
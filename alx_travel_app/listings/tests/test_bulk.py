@@ -0,0 +1,135 @@
+from datetime import date
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from listings.models import BookedNight, Booking, OutboxTask
+from listings.tests.factories import create_listing
+
+OVERLAP_ERROR = {'non_field_errors': ['This listing is already booked for the selected dates']}
+
+
+def stay(listing, check_in, check_out, guests_count=2):
+    return {'listing_id': listing.pk, 'check_in_date': check_in.isoformat(),
+            'check_out_date': check_out.isoformat(), 'guests_count': guests_count}
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database', LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class BulkBookingTest(TestCase):
+    """Bulk booking batches are checked as a whole and report a result per item"""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        cls.guest = User.objects.create_user('guest')
+        cls.loft = create_listing(host, title='Loft', max_guests=4)
+        cls.cabin = create_listing(host, title='Cabin', max_guests=4)
+        # Nights of March 1 to 4 on the loft
+        cls.booked = Booking.objects.create(listing=cls.loft, guest=User.objects.create_user('other'), guests_count=2,
+                                            check_in_date=date(2030, 3, 1), check_out_date=date(2030, 3, 5),
+                                            total_price='400.00', status='confirmed')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def post(self, items, atomic=False):
+        return self.client.post('/api/bookings/bulk/' + ('?atomic=true' if atomic else ''), items, format='json')
+
+    def statuses(self, response):
+        return [item['status'] for item in response.data['results']]
+
+    def assertNights(self, booking_id, check_in, check_out):
+        """The booking holds exactly the nights of its stay"""
+        nights = BookedNight.objects.filter(booking=booking_id).order_by('date').values_list('date', flat=True)
+        self.assertEqual(list(nights), [date.fromordinal(day) for day in range(check_in.toordinal(), check_out.toordinal())])
+
+    def test_mixed_batch_is_a_partial_success(self):
+        response = self.post([
+            stay(self.cabin, date(2030, 5, 1), date(2030, 5, 4)),
+            stay(self.cabin, date(2030, 6, 1), date(2030, 6, 3), guests_count=9),
+            dict(stay(self.cabin, date(2030, 7, 1), date(2030, 7, 3)), listing_id=999999),
+            stay(self.cabin, date(2030, 8, 3), date(2030, 8, 1)),
+            {'listing_id': self.cabin.pk},
+        ])
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (1, 4))
+        self.assertEqual(self.statuses(response), ['created', 'failed', 'failed', 'failed', 'failed'])
+        self.assertEqual([item['index'] for item in response.data['results']], [0, 1, 2, 3, 4])
+        self.assertIn('listing_id', response.data['results'][2]['errors'])
+        self.assertIn('check_in_date', response.data['results'][4]['errors'])
+        created = Booking.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual((created.guest, created.status, created.total_price), (self.guest, 'pending', 300))
+        self.assertNights(created.pk, date(2030, 5, 1), date(2030, 5, 4))
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_overlap_inside_the_batch(self):
+        response = self.post([
+            stay(self.cabin, date(2030, 5, 1), date(2030, 5, 5)),
+            stay(self.cabin, date(2030, 5, 4), date(2030, 5, 8)),
+            # Starts on the first stay's check-out day
+            stay(self.cabin, date(2030, 5, 5), date(2030, 5, 7)),
+        ])
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual(self.statuses(response), ['created', 'failed', 'created'])
+        self.assertEqual(response.data['results'][1]['errors'], OVERLAP_ERROR)
+        self.assertEqual(BookedNight.objects.filter(listing=self.cabin).count(), 6)
+
+    def test_overlap_with_existing_bookings(self):
+        response = self.post([
+            stay(self.loft, date(2030, 3, 3), date(2030, 3, 7)),
+            stay(self.loft, date(2030, 2, 27), date(2030, 3, 2)),
+            stay(self.loft, date(2030, 3, 5), date(2030, 3, 7)),
+        ])
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual(self.statuses(response), ['failed', 'failed', 'created'])
+        self.assertEqual(response.data['results'][0]['errors'], OVERLAP_ERROR)
+        self.assertNights(self.booked.pk, date(2030, 3, 1), date(2030, 3, 5))
+
+    def test_all_failed_is_400(self):
+        response = self.post([stay(self.loft, date(2030, 3, 2), date(2030, 3, 4)), {'guests_count': 2}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['succeeded'], 0)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_atomic_batch_writes_nothing_when_an_item_fails(self):
+        tasks = OutboxTask.objects.count()
+        response = self.post([
+            stay(self.cabin, date(2030, 5, 1), date(2030, 5, 4)),
+            stay(self.loft, date(2030, 3, 3), date(2030, 3, 7)),
+        ], atomic=True)
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (0, 1))
+        self.assertEqual(self.statuses(response), ['skipped', 'failed'])
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertFalse(BookedNight.objects.filter(listing=self.cabin).exists())
+        # Nor are the guest and host emailed about the rolled back booking
+        self.assertEqual(OutboxTask.objects.count(), tasks)
+
+    def test_atomic_batch_without_failures(self):
+        response = self.post([
+            stay(self.cabin, date(2030, 5, 1), date(2030, 5, 4)),
+            stay(self.loft, date(2030, 3, 5), date(2030, 3, 7)),
+        ], atomic=True)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.statuses(response), ['created', 'created'])
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_atomic_update_and_transition(self):
+        mine = Booking.objects.create(listing=self.cabin, guest=self.guest, guests_count=2, total_price='200.00',
+                                      check_in_date=date(2030, 5, 1), check_out_date=date(2030, 5, 3))
+        response = self.client.patch('/api/bookings/bulk/?atomic=true', [
+            {'id': mine.pk, 'check_in_date': '2030-05-02', 'check_out_date': '2030-05-04'},
+            # Someone else's booking
+            {'id': self.booked.pk, 'guests_count': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertEqual(self.statuses(response), ['skipped', 'failed'])
+        self.assertNights(mine.pk, date(2030, 5, 1), date(2030, 5, 3))
+
+        response = self.client.post('/api/bookings/bulk-status/?atomic=true', [
+            {'id': mine.pk, 'status': 'cancelled'}, {'id': mine.pk + 1000, 'status': 'cancelled'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400, response.data)
+        mine.refresh_from_db()
+        self.assertEqual(mine.status, 'pending')
+        self.assertNights(mine.pk, date(2030, 5, 1), date(2030, 5, 3))
@@ -0,0 +1,97 @@
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from listings.cache import listing_cache, listing_tag
+from listings.models import Booking, Listing, Review
+from listings.tests.factories import create_listing
+
+STAY = {'check_in': '2030-01-10', 'check_out': '2030-01-15'}
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=True, LISTINGS_TASK_BACKEND='database', LISTINGS_SLOW_REQUEST_MS=None)
+class CacheInvalidationTest(TestCase):
+    """Writes bump the cache tags of the responses they change, once committed, and no others"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', first_name='Ada')
+        cls.guest = User.objects.create_user('guest', first_name='Grace')
+        cls.listing = create_listing(cls.host, title='Loft')
+        Review.objects.create(listing=cls.listing, reviewer=cls.guest, rating=5, comment='Lovely')
+
+    def setUp(self):
+        caches['default'].clear()
+        listing_cache.local.clear()
+        self.client = APIClient()
+        self.detail = f'/api/listings/{self.listing.pk}/'
+
+    def get(self, path, query=None):
+        response = self.client.get(path, query or {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assertCached(self, path, query=None):
+        """A cache hit runs no query"""
+        with self.assertNumQueries(0):
+            return self.get(path, query)
+
+    def titles(self, query=None):
+        return [item['title'] for item in self.get('/api/listings/', query)['results']]
+
+    def test_save_bumps_on_commit(self):
+        self.get(self.detail)
+        version = listing_cache.versions([listing_tag(self.listing.pk)])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.listing.title = 'Harbour loft'
+            self.listing.save()
+            # A reader before the commit still gets the committed payload
+            self.assertEqual(listing_cache.versions([listing_tag(self.listing.pk)]), version)
+            self.assertEqual(self.assertCached(self.detail)['title'], 'Loft')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get(self.detail)['title'], 'Harbour loft')
+        self.assertEqual(self.titles(), ['Harbour loft'])
+
+    def test_queryset_update_bumps_every_page(self):
+        self.assertEqual(self.titles(), ['Loft'])
+        self.get(self.detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            # Sends no signal: the catalogue tag covers it
+            Listing.objects.filter(pk=self.listing.pk).update(title='Harbour loft')
+        self.assertEqual(self.titles(), ['Harbour loft'])
+        self.assertEqual(self.get(self.detail)['title'], 'Harbour loft')
+
+    def test_booking_bumps_date_searches_only(self):
+        self.assertEqual(self.titles(STAY), ['Loft'])
+        self.assertEqual(self.titles(), ['Loft'])
+        self.get(self.detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(listing=self.listing, guest=self.guest, check_in_date=date(2030, 1, 12),
+                                   check_out_date=date(2030, 1, 14), guests_count=2, total_price='200.00')
+        self.assertEqual(self.titles(STAY), [])
+        self.assertCached('/api/listings/')
+        self.assertCached(self.detail)
+
+    def test_user_save_bumps_the_listings_embedding_them(self):
+        self.get(self.detail)
+        other = create_listing(User.objects.create_user('other'), title='Cabin')
+        other_detail = f'/api/listings/{other.pk}/'
+        self.get(other_detail)
+        for user, embedded in [(self.host, lambda data: data['host']),
+                               (self.guest, lambda data: data['reviews'][0]['reviewer'])]:
+            with self.subTest(user=user.username):
+                with self.captureOnCommitCallbacks(execute=True):
+                    user.first_name = user.first_name + ' L.'
+                    user.save()
+                self.assertEqual(embedded(self.get(self.detail))['first_name'], user.first_name)
+                self.assertCached(other_detail)
+
+    def test_login_keeps_the_cache(self):
+        self.get(self.detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.host.last_login = timezone.now()
+            self.host.save(update_fields=['last_login'])
+        self.assertCached(self.detail)
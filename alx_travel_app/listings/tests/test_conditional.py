@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from listings.cache import listing_cache
+from listings.models import Booking
+from listings.tests.factories import create_listing
+
+
+class ConditionalListTest(TestCase):
+    """A 304 on a list costs at most one light query, and the ETag follows the page served"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host')
+        cls.guest = User.objects.create_user('guest')
+        cls.listings = [create_listing(cls.host, title=f'Listing {index}') for index in range(12)]
+        Booking.objects.bulk_create([
+            Booking(listing=listing, guest=cls.guest, check_in_date=date(2030, 1, 1) + timedelta(days=index),
+                    check_out_date=date(2030, 1, 3) + timedelta(days=index), guests_count=2, total_price='200.00')
+            for index, listing in enumerate(cls.listings)
+        ])
+
+    def setUp(self):
+        caches['default'].clear()
+        listing_cache.local.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def etag(self, path, query=None):
+        response = self.client.get(path, query or {})
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def revalidate(self, path, query, etag):
+        return self.client.get(path, query or {}, HTTP_IF_NONE_MATCH=etag)
+
+    def test_cached_listing_list_answers_304_without_query(self):
+        etag = self.etag('/api/listings/')
+        with self.assertNumQueries(0):
+            response = self.revalidate('/api/listings/', {}, etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(LISTINGS_CACHE_ENABLED=False)
+    def test_uncached_lists_answer_304_with_one_query(self):
+        for path in ['/api/listings/', '/api/bookings/', '/api/reviews/']:
+            for query in [{}, {'page': 2}, {'pagination': 'cursor'}]:
+                if path == '/api/reviews/' and query.get('page'):
+                    # No reviews, hence no second page
+                    continue
+                with self.subTest(path=path, query=query):
+                    etag = self.etag(path, query)
+                    with self.assertNumQueries(1):
+                        response = self.revalidate(path, query, etag)
+                    self.assertEqual(response.status_code, 304)
+
+    @override_settings(LISTINGS_CACHE_ENABLED=False)
+    def test_search_and_map_lists_answer_304(self):
+        for query in [{'search': 'listing'}, {'near': '42.36,-71.06', 'radius_km': 10, 'ordering': 'distance_km'}]:
+            with self.subTest(query=query):
+                etag = self.etag('/api/listings/', query)
+                self.assertEqual(self.revalidate('/api/listings/', query, etag).status_code, 304)
+
+    def test_etag_changes_when_a_row_of_the_page_changes(self):
+        newest = Booking.objects.order_by('-created_at', '-pk').first()
+        for query in [{}, {'pagination': 'cursor'}]:
+            with self.subTest(query=query):
+                etag = self.etag('/api/bookings/', query)
+                Booking.objects.filter(pk=newest.pk).update(updated_at=timezone.now() + timedelta(seconds=len(query)))
+                self.assertEqual(self.revalidate('/api/bookings/', query, etag).status_code, 200)
+
+    def test_page_number_etag_changes_with_the_row_count(self):
+        # The oldest booking is on page 2: page 1 keeps its rows but not its count
+        etag = self.etag('/api/bookings/')
+        Booking.objects.order_by('created_at', 'pk').first().delete()
+        response = self.revalidate('/api/bookings/', {}, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 11)
+
+    def test_cached_etag_changes_after_a_write(self):
+        etag = self.etag('/api/listings/')
+        listing = self.listings[-1]
+        listing.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        response = self.revalidate('/api/listings/', {}, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,110 @@
+import os
+import tracemalloc
+from datetime import date
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings, tag
+from rest_framework.test import APIClient
+from listings.models import Booking
+from listings.tests.factories import create_listing
+
+# The export must run in constant memory whatever the number of rows
+EXPORT_ROWS = int(os.environ.get('LISTINGS_EXPORT_TEST_ROWS', 1000000))
+MEMORY_CEILING = 32 * 1024 * 1024
+
+
+@tag('slow')
+@override_settings(LISTINGS_SLOW_REQUEST_MS=None)
+class BookingExportMemoryTest(TestCase):
+    """GET /api/bookings/export/ streams EXPORT_ROWS bookings under MEMORY_CEILING"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        host = User.objects.create_user('host')
+        guest = User.objects.create_user('guest')
+        listing = create_listing(host)
+        Booking.objects.bulk_create([
+            Booking(listing=listing, guest=guest, check_in_date=date(2020, 1, 1), check_out_date=date(2020, 1, 3),
+                    guests_count=2, total_price='200.00', status='completed'),
+        ])
+        # Double the table with INSERT ... SELECT until it holds EXPORT_ROWS bookings, without
+        # building a million model instances; the export does not look at the booked nights
+        table = connection.ops.quote_name(Booking._meta.db_table)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in Booking._meta.concrete_fields if not field.primary_key
+        )
+        with connection.cursor() as cursor:
+            count = 1
+            while count < EXPORT_ROWS:
+                batch = min(count, EXPORT_ROWS - count)
+                cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {table} LIMIT %s', [batch])
+                count += batch
+
+    def export(self, query):
+        """Line count, and peak memory allocated while the response is consumed"""
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        tracemalloc.start()
+        try:
+            response = client.get('/api/bookings/export/', query)
+            self.assertEqual(response.status_code, 200)
+            lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return lines, peak
+
+    def test_ndjson_export_memory(self):
+        lines, peak = self.export({})
+        self.assertEqual(lines, EXPORT_ROWS)
+        self.assertLess(peak, MEMORY_CEILING)
+
+    def test_csv_export_memory(self):
+        lines, peak = self.export({'stream': 'csv'})
+        # Header line included
+        self.assertEqual(lines, EXPORT_ROWS + 1)
+        self.assertLess(peak, MEMORY_CEILING)
+
+
+class NestedBookingPermissionTest(TestCase):
+    """Only the host of a listing or an admin reads or streams its bookings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host')
+        cls.guest = User.objects.create_user('guest')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.listing = create_listing(cls.host)
+        Booking.objects.bulk_create([
+            Booking(listing=cls.listing, guest=cls.guest, check_in_date=date(2030, 1, 1),
+                    check_out_date=date(2030, 1, 3), guests_count=2, total_price='200.00'),
+        ])
+        cls.url = f'/api/listings/{cls.listing.pk}/bookings/'
+
+    def get(self, user, query=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.get(self.url, query)
+
+    def test_anonymous_is_refused(self):
+        for query in [None, {'pagination': 'cursor'}, {'stream': 'ndjson'}]:
+            with self.subTest(query=query):
+                self.assertIn(self.get(None, query).status_code, (401, 403))
+
+    def test_other_user_is_refused(self):
+        # Even the guest of the booking: the list exposes every guest of the listing
+        for query in [None, {'pagination': 'cursor'}, {'stream': 'ndjson'}]:
+            with self.subTest(query=query):
+                self.assertEqual(self.get(self.guest, query).status_code, 403)
+
+    def test_host_and_admin_read_and_stream(self):
+        for user in (self.host, self.admin):
+            with self.subTest(user=user.username):
+                response = self.get(user)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['results'][0]['guest']['username'], 'guest')
+                response = self.get(user, {'stream': 'ndjson'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b''.join(response.streaming_content).count(b'\n'), 1)
@@ -0,0 +1,91 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from listings.models import Booking, Listing, Review
+from listings.serializers import ListingBookingSerializer, ListingReviewSerializer
+from listings.tests.factories import create_listing
+
+SPARSE_FIELDSETS = [
+    {}, {'fields': 'id,title,price_per_night,created_at'}, {'fields': 'id,host,reviews,average_rating'},
+    {'fields': 'id,latitude,longitude,image'}, {'expand': 'description,host'}, {'omit': 'image,average_rating'},
+]
+BOOKING_FIELDSETS = [
+    {}, {'fields': 'id,total_price,created_at'}, {'fields': 'id,listing,review'}, {'omit': 'listing'},
+]
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class FastPathParityTest(TestCase):
+    """The compiled list path writes the same bytes as the ModelSerializer and JSONRenderer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_superuser('host', email='host@example.com')
+        guest = User.objects.create_user('guest', first_name='Zoë', last_name='')
+        # Decimals with and without cents, missing coordinates and image, no reviews, JavaScript line terminators
+        cls.listing = create_listing(cls.host, title='Harbour loft', price_per_night=Decimal('99.90'),
+                                     latitude=42.3601, longitude=-71.0589, description='Sea view\u2028"Harbour" side')
+        create_listing(cls.host, title='Quiet cabin', price_per_night=Decimal('100'), city='Zürich')
+        bookings = Booking.objects.bulk_create([
+            Booking(listing=cls.listing, guest=guest, check_in_date=date(2030, 1, 1) + timedelta(days=4 * index),
+                    check_out_date=date(2030, 1, 3) + timedelta(days=4 * index), guests_count=2,
+                    total_price=Decimal('199.80'), status='completed')
+            for index in range(3)
+        ])
+        Review.objects.create(listing=cls.listing, reviewer=guest, booking=bookings[0], rating=4, comment='Lovely')
+        # Datetimes with and without microseconds
+        Listing.objects.filter(pk=cls.listing.pk).update(
+            created_at=datetime(2024, 5, 1, 12, 30, 0, 0, tzinfo=dt_timezone.utc)
+        )
+        Booking.objects.filter(pk=bookings[1].pk).update(
+            created_at=datetime(2024, 5, 2, 8, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def assertSameBytes(self, path, query):
+        """The fast path's response body against the ModelSerializer path's data rendered by JSONRenderer"""
+        fast = self.client.get(path, query)
+        with override_settings(LISTINGS_FAST_SERIALIZATION=False):
+            regular = self.client.get(path, query)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(regular.status_code, 200)
+        self.assertEqual(fast.content, JSONRenderer().render(regular.data))
+
+    def test_listing_lists(self):
+        for path in ['/api/listings/', '/api/async/listings/']:
+            for fields in SPARSE_FIELDSETS:
+                for pagination in [{}, {'pagination': 'cursor'}]:
+                    with self.subTest(path=path, query=dict(fields, **pagination)):
+                        self.assertSameBytes(path, dict(fields, **pagination))
+
+    def test_booking_list(self):
+        for fields in BOOKING_FIELDSETS:
+            for pagination in [{}, {'pagination': 'cursor'}]:
+                with self.subTest(query=dict(fields, **pagination)):
+                    self.assertSameBytes('/api/bookings/', dict(fields, **pagination))
+
+    def test_review_list(self):
+        for fields in [{}, {'fields': 'id,rating,created_at'}, {'fields': 'id,reviewer,booking'}]:
+            with self.subTest(query=fields):
+                self.assertSameBytes('/api/async/reviews/', fields)
+
+    def test_nested_lists(self):
+        # Always compiled: compare with the nested serializers over the same rows
+        for action, serializer_class, model in [
+            ('bookings', ListingBookingSerializer, Booking), ('reviews', ListingReviewSerializer, Review)
+        ]:
+            with self.subTest(action=action):
+                response = self.client.get(f'/api/listings/{self.listing.pk}/{action}/')
+                self.assertEqual(response.status_code, 200)
+                rows = model.objects.in_bulk([item['id'] for item in response.data['results']])
+                data = serializer_class(
+                    [rows[item['id']] for item in response.data['results']], many=True,
+                    context={'request': response.renderer_context['request']},
+                ).data
+                self.assertEqual(response.content, JSONRenderer().render(dict(response.data, results=data)))
@@ -0,0 +1,144 @@
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from listings.lifecycle import expire_holds
+from listings.models import BookedNight, Booking, OutboxTask
+from listings.tests.factories import create_listing
+
+
+def create_booking(listing, guest, check_in, nights, status, hours_old=0):
+    """Booking holding its nights, created `hours_old` hours ago"""
+    booking = Booking.objects.create(listing=listing, guest=guest, check_in_date=check_in,
+                                     check_out_date=check_in + timedelta(days=nights), guests_count=2,
+                                     total_price='200.00', status=status)
+    if hours_old:
+        Booking.objects.filter(pk=booking.pk).update(created_at=timezone.now() - timedelta(hours=hours_old))
+    return booking
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database', LISTINGS_PENDING_HOLD_HOURS=24)
+class UpdateBookingStatusesTest(TestCase):
+    """update_booking_statuses moves exactly the due bookings and frees their nights"""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        guest = User.objects.create_user('guest')
+        today = timezone.localdate()
+        listings = [create_listing(host, title=f'Loft {index}') for index in range(8)]
+        stay = today + timedelta(days=30)
+        cls.expired = [create_booking(listings[index], guest, stay, 3, 'pending', hours_old=48) for index in range(3)]
+        cls.finished = [
+            create_booking(listings[3], guest, today - timedelta(days=3), 3, 'confirmed'),
+            create_booking(listings[4], guest, today - timedelta(days=10), 2, 'confirmed'),
+        ]
+        cls.untouched = {
+            # Within its hold
+            create_booking(listings[5], guest, stay, 3, 'pending', hours_old=2).pk: 'pending',
+            # Checks out tomorrow
+            create_booking(listings[6], guest, today - timedelta(days=1), 2, 'confirmed').pk: 'confirmed',
+            create_booking(listings[7], guest, stay, 2, 'cancelled', hours_old=48).pk: 'cancelled',
+            create_booking(listings[7], guest, today - timedelta(days=5), 2, 'completed').pk: 'completed',
+        }
+
+    def statuses(self):
+        return dict(Booking.objects.values_list('pk', 'status'))
+
+    def test_due_bookings_change_state_and_free_their_nights(self):
+        tasks = OutboxTask.objects.count()
+        output = StringIO()
+        call_command('update_booking_statuses', batch_size=2, stdout=output)
+        statuses = self.statuses()
+        self.assertEqual({pk: statuses[pk] for pk in self.untouched}, self.untouched)
+        self.assertEqual({statuses[booking.pk] for booking in self.expired}, {'cancelled'})
+        self.assertEqual({statuses[booking.pk] for booking in self.finished}, {'completed'})
+        moved = self.expired + self.finished
+        self.assertFalse(BookedNight.objects.filter(booking__in=moved).exists())
+        # Active bookings keep theirs
+        self.assertEqual(BookedNight.objects.filter(booking__status__in=['pending', 'confirmed']).count(), 5)
+        self.assertIn('Expired 3 pending holds in 2 batches', output.getvalue())
+        self.assertIn('Completed 2 stays in 1 batches', output.getvalue())
+        # Guests and hosts of the expired holds are emailed, in the background
+        self.assertEqual(OutboxTask.objects.count() - tasks, 3)
+
+        # A second run finds nothing left to do
+        statuses, nights = self.statuses(), BookedNight.objects.count()
+        call_command('update_booking_statuses', stdout=StringIO())
+        self.assertEqual(self.statuses(), statuses)
+        self.assertEqual(BookedNight.objects.count(), nights)
+
+    def test_dry_run_writes_nothing(self):
+        statuses, nights, tasks = self.statuses(), BookedNight.objects.count(), OutboxTask.objects.count()
+        output = StringIO()
+        with self.captureOnCommitCallbacks() as callbacks:
+            call_command('update_booking_statuses', dry_run=True, stdout=output)
+        self.assertEqual(output.getvalue().strip(), 'Would expire 3 pending holds and complete 2 stays')
+        self.assertEqual(self.statuses(), statuses)
+        self.assertEqual(BookedNight.objects.count(), nights)
+        self.assertEqual(OutboxTask.objects.count(), tasks)
+        self.assertEqual(callbacks, [])
+
+    def test_batches_lock_rows_with_skip_locked_where_supported(self):
+        calls = []
+        select_for_update = QuerySet.select_for_update
+
+        def record(queryset, *args, **kwargs):
+            calls.append(kwargs)
+            return select_for_update(queryset, *args, **kwargs)
+
+        for supported in [True, False]:
+            calls.clear()
+            with self.subTest(supported=supported), \
+                    mock.patch.object(connection.features, 'has_select_for_update_skip_locked', supported), \
+                    mock.patch.object(QuerySet, 'select_for_update', record):
+                list(expire_holds(batch_size=100))
+            self.assertEqual(calls, [{'skip_locked': supported}] * len(calls))
+            self.assertTrue(calls)
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database', LISTINGS_PENDING_HOLD_HOURS=24)
+class SkipLockedTest(TransactionTestCase):
+    """Holds a request is changing at the same time are left for the next run, without waiting for its lock"""
+
+    def setUp(self):
+        if not connection.features.has_select_for_update_skip_locked:
+            self.skipTest('The database has no SELECT ... FOR UPDATE SKIP LOCKED')
+        host, guest = User.objects.create_user('host'), User.objects.create_user('guest')
+        listing = create_listing(host)
+        self.locked, self.free = [
+            create_booking(listing, guest, date(2030, 1, 1) + timedelta(days=5 * index), 3, 'pending', hours_old=48)
+            for index in range(2)
+        ]
+
+    def test_locked_rows_are_skipped(self):
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Booking.objects.select_for_update().filter(pk=self.locked.pk).get()
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual(sum(expire_holds(batch_size=100)), 1)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(Booking.objects.get(pk=self.locked.pk).status, 'pending')
+        self.assertEqual(Booking.objects.get(pk=self.free.pk).status, 'cancelled')
+        # Picked up by the next run
+        self.assertEqual(sum(expire_holds(batch_size=100)), 1)
+        self.assertEqual(Booking.objects.get(pk=self.locked.pk).status, 'cancelled')
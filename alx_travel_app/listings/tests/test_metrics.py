@@ -0,0 +1,26 @@
+from django.test import TestCase, override_settings
+
+
+class MetricsAccessTest(TestCase):
+    """/metrics is only scraped with the configured bearer token, or openly under DEBUG without one"""
+
+    def scrape(self, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.get('/metrics', **headers)
+
+    @override_settings(LISTINGS_METRICS_TOKEN=None, DEBUG=False)
+    def test_refused_without_a_token(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape('anything').status_code, 403)
+
+    @override_settings(LISTINGS_METRICS_TOKEN=None, DEBUG=True)
+    def test_open_under_debug_without_a_token(self):
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
+
+    @override_settings(LISTINGS_METRICS_TOKEN='s3cret', DEBUG=True)
+    def test_token_required_when_set(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape('wrong').status_code, 403)
+        self.assertEqual(self.scrape('s3cret').status_code, 200)
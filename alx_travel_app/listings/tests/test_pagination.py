@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from listings.search import get_backend
+from listings.tests.factories import create_listing
+
+
+class KeysetPaginationTest(TestCase):
+    """?pagination=cursor walks every row once, and refuses relevance-ordered results"""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        for index in range(25):
+            title = 'Harbour loft' if index % 3 == 0 else 'Quiet cabin'
+            create_listing(host, title=f'{title} {index}', price_per_night=50 + index % 7)
+
+    def walk(self, query, link='next'):
+        """Ids of the pages followed through `link`, and the response of the last page"""
+        client = APIClient()
+        response = client.get('/api/listings/', dict(query, pagination='cursor', page_size=4))
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            if not response.data[link]:
+                return ids, response
+            response = client.get(response.data[link])
+
+    def test_walks_every_row_once(self):
+        for ordering in ['-created_at', 'price_per_night', '-price_per_night', '-average_rating']:
+            with self.subTest(ordering=ordering):
+                ids, last = self.walk({'ordering': ordering})
+                self.assertEqual(ids, list(dict.fromkeys(ids)))
+                self.assertEqual(len(ids), 25)
+                # Walking back from the last page lists the same rows in the same order
+                client, response, back = APIClient(), last, []
+                while True:
+                    back = [item['id'] for item in response.data['results']] + back
+                    if not response.data['previous']:
+                        break
+                    response = client.get(response.data['previous'])
+                self.assertEqual(back, ids)
+
+    def test_relevance_ordering_is_refused(self):
+        if get_backend() is None:
+            self.skipTest('No full-text index on this database')
+        response = APIClient().get('/api/listings/', {'search': 'harbour', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pagination', response.data)
+
+    def test_search_with_explicit_ordering(self):
+        ids, _ = self.walk({'search': 'harbour', 'ordering': 'price_per_night'})
+        self.assertEqual(len(ids), 9)
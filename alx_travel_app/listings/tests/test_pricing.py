@@ -0,0 +1,226 @@
+import json
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from listings.cache import listing_cache
+from listings.models import Booking, RateRule
+from listings.pricing import RatePlan, money, plan_cache, rate_plans
+from listings.tests.factories import create_listing
+
+FRIDAY_AND_SATURDAY = 0b0110000
+
+
+def reference_quote(base_price, rules, check_in, check_out):
+    """Quote of a stay computed night by night, straight from the RateRule field definitions"""
+
+    def applies(rule, day):
+        return ((rule.start_date is None or rule.start_date <= day)
+                and (rule.end_date is None or day < rule.end_date))
+
+    nightly = []
+    day = check_in
+    while day < check_out:
+        matching = [rule for rule in rules if applies(rule, day)
+                    and (not rule.weekdays or rule.weekdays & (1 << day.weekday()))]
+        prices = [rule for rule in matching if rule.kind == 'price']
+        price = Decimal(str(base_price))
+        if prices:
+            price = max(prices, key=lambda rule: (rule.priority, rule.pk)).amount
+        for rule in matching:
+            if rule.kind == 'adjustment':
+                price *= 1 + rule.percent / 100
+        nightly.append(money(price))
+        day += timedelta(days=1)
+    subtotal = sum(nightly, Decimal(0))
+    percent = max([rule.percent for rule in rules if rule.kind == 'stay_discount' and applies(rule, check_in)
+                   and len(nightly) >= rule.min_nights], default=Decimal(0))
+    discount = money(subtotal * percent / 100)
+    fees = sum((rule.amount for rule in rules if rule.kind == 'fee' and applies(rule, check_in)), Decimal(0))
+    return {'nights': len(nightly), 'nightly': nightly, 'subtotal': subtotal, 'discount': discount,
+            'fees': fees, 'total': subtotal - discount + fees}
+
+
+def random_rule(generator, pk=None, **fields):
+    """Unsaved rule of any kind over a random window of 2030, open ended at random"""
+    start = date(2030, 1, 1) + timedelta(days=generator.randrange(365))
+    end = start + timedelta(days=generator.randrange(1, 60))
+    kind = generator.choice(['price', 'price', 'adjustment', 'adjustment', 'stay_discount', 'fee'])
+    return RateRule(
+        pk=pk, kind=kind,
+        start_date=None if generator.random() < 0.15 else start,
+        end_date=None if generator.random() < 0.15 else end,
+        weekdays=generator.choice([0, 0, FRIDAY_AND_SATURDAY, 0b0011111, generator.randrange(1, 128)]),
+        amount=Decimal(generator.randrange(4000, 40000)) / 100 if kind in ['price', 'fee'] else None,
+        percent=Decimal(generator.randrange(-3000, 5000)) / 100 if kind in ['adjustment', 'stay_discount'] else None,
+        min_nights=generator.randrange(1, 15),
+        priority=generator.randrange(3),
+        **fields
+    )
+
+
+class RatePlanTest(TestCase):
+    """Compiled rate plans price every night as the per-night reference does"""
+
+    def rule(self, kind, pk, **fields):
+        return RateRule(pk=pk, kind=kind, **fields)
+
+    def assertQuote(self, base_price, rules, check_in, check_out):
+        quote = RatePlan(base_price, rules).quote(check_in, check_out)
+        self.assertEqual(quote, reference_quote(base_price, rules, check_in, check_out))
+        return quote
+
+    def test_overlapping_price_rules(self):
+        rules = [
+            self.rule('price', 1, amount=Decimal('150.00'), start_date=date(2030, 7, 1), end_date=date(2030, 9, 1)),
+            # Same priority, created later: wins where both apply
+            self.rule('price', 2, amount=Decimal('180.00'), start_date=date(2030, 8, 1), end_date=date(2030, 8, 15)),
+            # Higher priority wins over a later rule
+            self.rule('price', 3, amount=Decimal('300.00'), priority=1,
+                      start_date=date(2030, 8, 10), end_date=date(2030, 8, 12)),
+        ]
+        quote = self.assertQuote(100, rules, date(2030, 7, 30), date(2030, 8, 16))
+        self.assertEqual(quote['nightly'][:2], [Decimal('150.00')] * 2)
+        self.assertEqual(quote['nightly'][2:11], [Decimal('180.00')] * 9)
+        self.assertEqual(quote['nightly'][11:13], [Decimal('300.00')] * 2)
+        self.assertEqual(quote['nightly'][13:], [Decimal('180.00')] * 3 + [Decimal('150.00')])
+
+    def test_weekend_adjustment_on_top_of_a_season(self):
+        rules = [
+            self.rule('price', 1, amount=Decimal('120.00'), start_date=date(2030, 6, 1), end_date=date(2030, 9, 1)),
+            self.rule('adjustment', 2, percent=Decimal('25'), weekdays=FRIDAY_AND_SATURDAY),
+            self.rule('adjustment', 3, percent=Decimal('-10'), start_date=date(2030, 8, 30)),
+        ]
+        # Thursday, August 29 to Tuesday, September 3
+        quote = self.assertQuote(99.99, rules, date(2030, 8, 29), date(2030, 9, 3))
+        self.assertEqual(quote['nightly'], [Decimal(price) for price in
+                                            ['120.00', '135.00', '135.00', '89.99', '89.99']])
+
+    def test_length_of_stay_discount_and_fees(self):
+        rules = [
+            self.rule('stay_discount', 1, percent=Decimal('10'), min_nights=7),
+            self.rule('stay_discount', 2, percent=Decimal('15'), min_nights=14, start_date=date(2030, 1, 1)),
+            self.rule('fee', 3, amount=Decimal('40.00')),
+            # Arrivals from July only
+            self.rule('fee', 4, amount=Decimal('15.50'), start_date=date(2030, 7, 1)),
+        ]
+        for check_in, nights, discount, fees in [
+            (date(2029, 6, 1), 6, '0.00', '40.00'),
+            (date(2029, 6, 1), 7, '70.00', '40.00'),
+            (date(2029, 6, 1), 20, '200.00', '40.00'),
+            (date(2030, 6, 1), 14, '210.00', '40.00'),
+            (date(2030, 7, 1), 3, '0.00', '55.50'),
+        ]:
+            with self.subTest(check_in=check_in, nights=nights):
+                quote = self.assertQuote(100, rules, check_in, check_in + timedelta(days=nights))
+                self.assertEqual((quote['discount'], quote['fees']), (Decimal(discount), Decimal(fees)))
+
+    def test_random_rules_match_the_reference(self):
+        generator = random.Random(2030)
+        for case in range(300):
+            rules = [random_rule(generator, pk) for pk in range(1, generator.randrange(1, 9))]
+            plan = RatePlan(Decimal(generator.randrange(5000, 30000)) / 100, rules)
+            for _ in range(5):
+                check_in = date(2029, 12, 1) + timedelta(days=generator.randrange(420))
+                check_out = check_in + timedelta(days=generator.randrange(1, 40))
+                with self.subTest(case=case, check_in=check_in, check_out=check_out):
+                    self.assertEqual(plan.quote(check_in, check_out),
+                                     reference_quote(plan.base_price, rules, check_in, check_out))
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None, LISTINGS_TASK_BACKEND='database')
+class QuoteEndpointTest(TestCase):
+    """/api/listings/quote/ prices a page of stays with the reference's figures in a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        generator = random.Random(25)
+        cls.listings = []
+        for index in range(6):
+            listing = create_listing(host, title=f'Loft {index}', price_per_night=80 + 15 * index)
+            RateRule.objects.bulk_create([random_rule(generator, listing=listing) for _ in range(2 * index)])
+            cls.listings.append(listing)
+        # Two nights of the first listing are taken
+        Booking.objects.create(
+            listing=cls.listings[0], guest=User.objects.create_user('guest'), check_in_date=date(2030, 7, 8),
+            check_out_date=date(2030, 7, 10), guests_count=2, total_price='200.00', status='confirmed',
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        listing_cache.local.clear()
+        plan_cache.clear()
+
+    def expected(self, listing, check_in, check_out, available=True):
+        """Quote item of a stay, from the reference"""
+        quote = reference_quote(listing.price_per_night, list(listing.rate_rules.all()), check_in, check_out)
+        return {
+            'listing': listing.pk, 'check_in': check_in.isoformat(), 'check_out': check_out.isoformat(),
+            'available': available, 'nights': quote['nights'],
+            'nightly': ['{:f}'.format(price) for price in quote['nightly']],
+            'subtotal': '{:f}'.format(money(quote['subtotal'])),
+            'discount': '{:f}'.format(money(quote['discount'])),
+            'fees': '{:f}'.format(money(quote['fees'])),
+            'total': '{:f}'.format(money(quote['total'])),
+        }
+
+    def test_get_prices_one_stay_at_several_listings(self):
+        check_in, check_out = date(2030, 7, 5), date(2030, 7, 19)
+        query = {'ids': ','.join(str(listing.pk) for listing in self.listings),
+                 'check_in': check_in.isoformat(), 'check_out': check_out.isoformat()}
+        # The listings, their rules and the booked nights
+        with self.assertNumQueries(3):
+            response = APIClient().get('/api/listings/quote/', query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'], [
+            self.expected(listing, check_in, check_out, available=index > 0)
+            for index, listing in enumerate(self.listings)
+        ])
+        # Memoized plans: no rule query
+        with self.assertNumQueries(2):
+            self.assertEqual(APIClient().get('/api/listings/quote/', query).content, response.content)
+
+    def test_post_prices_a_batch_of_stays(self):
+        stays = [
+            (self.listings[0], date(2030, 7, 1), date(2030, 7, 8)),
+            (self.listings[0], date(2030, 7, 9), date(2030, 7, 12)),
+            (self.listings[5], date(2030, 2, 20), date(2030, 4, 2)),
+            (self.listings[5], date(2030, 12, 24), date(2031, 1, 3)),
+            (self.listings[3], date(2030, 8, 1), date(2030, 8, 2)),
+        ]
+        body = {'stays': [
+            {'listing': listing.pk, 'check_in': check_in.isoformat(), 'check_out': check_out.isoformat()}
+            for listing, check_in, check_out in stays
+        ]}
+        # Unknown listings are left out
+        body['stays'].append({'listing': 999999, 'check_in': '2030-07-01', 'check_out': '2030-07-03'})
+        with self.assertNumQueries(3):
+            response = APIClient().post('/api/listings/quote/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'], [
+            self.expected(listing, check_in, check_out, available=(index != 1))
+            for index, (listing, check_in, check_out) in enumerate(stays)
+        ])
+
+    def test_rule_changes_reprice_at_once(self):
+        listing = self.listings[1]
+        query = {'ids': listing.pk, 'check_in': '2030-07-05', 'check_out': '2030-07-08'}
+        APIClient().get('/api/listings/quote/', query)
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.rate_rules.all().delete()
+            RateRule.objects.create(listing=listing, kind='price', amount=Decimal('210.00'))
+        result = json.loads(APIClient().get('/api/listings/quote/', query).content)['results'][0]
+        self.assertEqual((result['nightly'], result['total']), (['210.00'] * 3, '630.00'))
+
+    def test_plans_follow_the_stored_rules(self):
+        plans = rate_plans(self.listings)
+        for listing in self.listings:
+            with self.subTest(listing=listing.title):
+                rules = list(listing.rate_rules.all())
+                check_in, check_out = date(2030, 1, 1), date(2030, 12, 31)
+                self.assertEqual(plans[listing.pk].quote(check_in, check_out),
+                                 reference_quote(listing.price_per_night, rules, check_in, check_out))
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from listings.models import Booking, Review
+from listings.tests.factories import create_listing
+
+# Queries of each request (validators, page and prefetches), whatever the number of rows it serves
+ENDPOINTS = {
+    'listing list': ('/api/listings/', 3),
+    'listing detail': ('/api/listings/{pk}/', 3),
+    'nested bookings': ('/api/listings/{pk}/bookings/', 4),
+    'nested reviews': ('/api/listings/{pk}/reviews/', 4),
+    'booking list': ('/api/bookings/', 10),
+    'review list': ('/api/reviews/', 3),
+}
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class QueryCountTest(TestCase):
+    """Read endpoints run a fixed number of queries, with 5 as with 50 reviewed listings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_superuser('host')
+        cls.listing = create_listing(cls.host, title='Reviewed loft')
+
+    def setUp(self):
+        self.listings = [self.listing]
+
+    def grow(self, count):
+        """Add listings, each booked and reviewed once, until there are `count`; the first listing gets as many"""
+        bookings, reviews = [], []
+        for index in range(len(self.listings), count):
+            listing = create_listing(self.host, title=f'Listing {index}')
+            self.listings.append(listing)
+            guest = User.objects.create_user(f'guest{index}')
+            for target in [listing, self.listing]:
+                check_in = date(2030, 1, 1) + timedelta(days=3 * index)
+                bookings.append(Booking(
+                    listing=target, guest=guest, check_in_date=check_in, check_out_date=check_in + timedelta(days=2),
+                    guests_count=2, total_price='200.00', status='completed',
+                ))
+        Booking.objects.bulk_create(bookings)
+        for booking in bookings:
+            reviews.append(Review(listing=booking.listing, reviewer=booking.guest, booking=booking,
+                                  rating=1 + booking.pk % 5, comment=f'Stay {booking.pk}'))
+        Review.objects.bulk_create(reviews)
+
+    def test_query_counts_do_not_grow_with_the_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.host)
+        for count in [5, 50]:
+            self.grow(count)
+            for name, (path, queries) in ENDPOINTS.items():
+                with self.subTest(endpoint=name, listings=count):
+                    with self.assertNumQueries(queries):
+                        response = client.get(path.format(pk=self.listing.pk), {'page_size': 100})
+                    self.assertEqual(response.status_code, 200)
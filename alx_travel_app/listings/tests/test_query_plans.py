@@ -0,0 +1,119 @@
+import json
+import re
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from listings.models import Booking, Listing, Review
+
+# A table read row by row, without an index: "SCAN listings_listing", not "SCAN ... USING INDEX ..."
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+LISTING_FILTERS = [
+    {}, {'city': 'Boston'}, {'country': 'United States'}, {'property_type': 'apartment'},
+    {'city': 'Boston', 'property_type': 'house'},
+    {'min_rating': 3}, {'max_rating': 4}, {'guests': 4}, {'max_guests': 4}, {'bedrooms': 2}, {'bathrooms': 1},
+    {'has_wifi': 'true'}, {'has_kitchen': 'true'}, {'has_air_conditioning': 'true'}, {'has_heating': 'true'},
+    {'has_tv': 'true'}, {'has_parking': 'false'}, {'has_pool': 'false'}, {'amenities': 'wifi,pool'},
+    {'check_in': '2100-01-10', 'check_out': '2100-01-15'}, {'bbox': '-71.3,42.2,-70.9,42.5'},
+    {'near': '42.36,-71.06', 'radius_km': 5}, {'search': 'work'},
+]
+BOOKING_FILTERS = [{}, {'created_after': '2020-01-01T00:00:00Z'}, {'created_before': '2100-01-01T00:00:00Z'}]
+REVIEW_FILTERS = [
+    {}, {'rating': 5}, {'min_rating': 4},
+    {'created_after': '2020-01-01T00:00:00Z'}, {'created_before': '2100-01-01T00:00:00Z'},
+]
+
+
+def booking_filters(booking):
+    """Booking filters that all match the given booking"""
+    check_in, check_out = booking.check_in_date.isoformat(), booking.check_out_date.isoformat()
+    return BOOKING_FILTERS + [
+        {'status': booking.status}, {'status': [booking.status, 'cancelled']},
+        {'start': check_in}, {'end': check_out}, {'start': check_in, 'end': check_out},
+    ]
+
+
+def orderings(fields):
+    return [None] + [prefix + field for field in fields for prefix in ('', '-')]
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class QueryPlanTest(TestCase):
+    """No exposed filter or ordering of the list endpoints reads a whole table on seeded data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed', users=300, listings=400, bookings=2000, reviews=300, seed=1, stdout=StringIO())
+        cls.admin = User.objects.get(username='admin')
+        if connection.vendor == 'sqlite':
+            # Planner statistics, as a production database would have
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plans are read from SQLite EXPLAIN QUERY PLAN')
+
+    def full_scans(self, path, query, user=None):
+        """Tables scanned without an index by the queries of a GET request"""
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with connection.execute_wrapper(record):
+            response = client.get(path, query)
+        self.assertEqual(response.status_code, 200, (path, query, getattr(response, 'data', None)))
+        self.assertTrue(json.loads(response.content)['results'], 'No rows: the plan of an empty result proves nothing')
+        scans = set()
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                for row in cursor.fetchall():
+                    match = FULL_SCAN.match(row[-1])
+                    if match:
+                        scans.add((match.group(1), sql))
+        return scans
+
+    def check(self, path, filters, ordering_fields, user=None):
+        for query in filters:
+            for ordering in orderings(ordering_fields):
+                for pagination in [{}, {'pagination': 'cursor'}]:
+                    if 'search' in query and pagination and not ordering:
+                        # Relevance order has no cursor
+                        continue
+                    params = dict(query, **pagination)
+                    if ordering:
+                        params['ordering'] = ordering
+                    with self.subTest(path=path, params=params):
+                        self.assertEqual(self.full_scans(path, params, user), set())
+
+    def test_listing_list(self):
+        self.check('/api/listings/', LISTING_FILTERS,
+                   ['price_per_night', 'created_at', 'average_rating', 'review_count'])
+
+    def test_booking_list(self):
+        booking = Booking.objects.select_related('listing').order_by('pk').first()
+        self.check('/api/bookings/', booking_filters(booking) + [{'listing': booking.listing_id}, {'guest': booking.guest_id}],
+                   ['check_in_date', 'check_out_date', 'created_at'], self.admin)
+        for user, role in [(booking.guest, 'guest'), (booking.listing.host, 'host')]:
+            self.check('/api/bookings/', [{'role': role}], ['created_at'], user)
+
+    def test_review_list(self):
+        review = Review.objects.order_by('pk').first()
+        self.check('/api/reviews/', REVIEW_FILTERS + [{'listing': review.listing_id}, {'reviewer': review.reviewer_id}],
+                   ['rating', 'created_at'])
+
+    def test_nested_lists(self):
+        review = Review.objects.select_related('booking').order_by('pk').first()
+        self.check(f'/api/listings/{review.listing_id}/bookings/', booking_filters(review.booking), [], self.admin)
+        self.check(f'/api/listings/{review.listing_id}/reviews/',
+                   [{}, {'rating': review.rating}, {'min_rating': review.rating}, {'reviewer': review.reviewer_id}], [])
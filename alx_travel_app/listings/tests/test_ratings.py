@@ -0,0 +1,109 @@
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from listings.models import Listing, RATING_VALUES, Review
+from listings.taskqueue import Worker
+from listings.tests.factories import create_listing
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database')
+class RatingAggregatesTest(TestCase):
+    """The stored rating aggregates of a listing follow every way of writing its reviews"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host')
+        cls.guests = [User.objects.create_user(f'guest{index}') for index in range(4)]
+        cls.listing = create_listing(cls.host, title='Loft')
+        cls.other = create_listing(cls.host, title='Cabin')
+
+    def review(self, rating, guest=0, listing=None):
+        return Review.objects.create(listing=listing or self.listing, reviewer=self.guests[guest],
+                                     rating=rating, comment='Stay')
+
+    def assertAggregates(self, listing, ratings):
+        """The stored aggregates of a listing against those of the given ratings"""
+        listing = Listing.objects.get(pk=listing.pk)
+        self.assertEqual(listing.review_count, len(ratings))
+        self.assertEqual(listing.rating_sum, sum(ratings))
+        if ratings:
+            self.assertAlmostEqual(listing.average_rating, sum(ratings) / len(ratings))
+        else:
+            self.assertIsNone(listing.average_rating)
+        self.assertEqual(listing.rating_histogram, {rating: ratings.count(rating) for rating in RATING_VALUES})
+
+    def test_create(self):
+        self.assertAggregates(self.listing, [])
+        for guest, rating in enumerate([5, 3, 4]):
+            self.review(rating, guest)
+        self.assertAggregates(self.listing, [5, 3, 4])
+
+    def test_update(self):
+        review = self.review(5)
+        self.review(2, guest=1)
+        review.rating = 1
+        review.save()
+        self.assertAggregates(self.listing, [1, 2])
+        # Only the comment: the aggregates are unchanged
+        review.comment = 'Noisy'
+        review.save()
+        self.assertAggregates(self.listing, [1, 2])
+
+    def test_move_to_another_listing(self):
+        review = self.review(4)
+        self.review(2, guest=1)
+        review.listing = self.other
+        review.save()
+        self.assertAggregates(self.listing, [2])
+        self.assertAggregates(self.other, [4])
+
+    def test_update_with_unknown_previous_rating(self):
+        self.review(5)
+        review = Review.objects.only('pk', 'comment', 'listing').get()
+        review.rating = 2
+        review.save()
+        # Recomputed by a background task
+        self.assertEqual(Worker().run_batch(), 1)
+        self.assertAggregates(self.listing, [2])
+
+    def test_delete(self):
+        review = self.review(5)
+        self.review(3, guest=1)
+        review.delete()
+        self.assertAggregates(self.listing, [3])
+        Review.objects.get().delete()
+        self.assertAggregates(self.listing, [])
+
+    def test_queryset_writes(self):
+        reviews = Review.objects.bulk_create([
+            Review(listing=self.listing, reviewer=guest, rating=rating, comment='Stay')
+            for guest, rating in zip(self.guests, [1, 2, 3, 4])
+        ])
+        self.assertAggregates(self.listing, [1, 2, 3, 4])
+        Review.objects.filter(rating__lte=2).update(rating=5)
+        self.assertAggregates(self.listing, [5, 5, 3, 4])
+        reviews[3].rating = 1
+        Review.objects.bulk_update(reviews[3:], ['rating'])
+        self.assertAggregates(self.listing, [5, 5, 3, 1])
+        Review.objects.filter(rating=5).update(listing=self.other)
+        self.assertAggregates(self.listing, [3, 1])
+        self.assertAggregates(self.other, [5, 5])
+        Review.objects.filter(listing=self.other).delete()
+        self.assertAggregates(self.other, [])
+
+    def test_rebuild_command_fixes_drift(self):
+        self.review(5)
+        self.review(3, guest=1)
+        self.review(4, listing=self.other)
+        # Drift, as a raw SQL write or a fixture load would leave it
+        Listing.objects.filter(pk=self.listing.pk).update(review_count=7, rating_sum=1, rating_5_count=0)
+        with self.assertRaisesMessage(CommandError, str(self.listing.pk)):
+            call_command('rebuild_rating_aggregates', check=True, stdout=StringIO())
+
+        output = StringIO()
+        call_command('rebuild_rating_aggregates', stdout=output)
+        self.assertIn('Found 1 listings with drifted rating aggregates', output.getvalue())
+        self.assertAggregates(self.listing, [5, 3])
+        self.assertAggregates(self.other, [4])
+        call_command('rebuild_rating_aggregates', check=True, stdout=StringIO())
@@ -0,0 +1,124 @@
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from listings.db import ReplicaStickinessMiddleware, replica_monitor, routing_scope, routing_state
+from listings.models import Booking, Listing, RateRule
+from listings.taskqueue import run_task
+from listings.tests.factories import create_listing
+
+# A SQLite replica of the test database: a second connection to the same file, as DATABASE_REPLICAS sets them up
+REPLICA = 'replica_test'
+if REPLICA not in connections.settings:
+    connections.settings[REPLICA] = dict(
+        connections.settings['default'], TEST=dict(connections.settings['default']['TEST'], MIRROR='default')
+    )
+
+
+@override_settings(LISTINGS_READ_REPLICAS=[REPLICA], LISTINGS_REPLICA_MAX_LAG_SECONDS=5,
+                   LISTINGS_REPLICA_CHECK_SECONDS=10, LISTINGS_CACHE_ENABLED=False,
+                   LISTINGS_SLOW_REQUEST_MS=None, LISTINGS_TASK_BACKEND='database')
+class PrimaryReplicaRouterTest(TransactionTestCase):
+    """Reads go to a healthy replica until the unit of work that makes them wrote"""
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        replica_monitor.status.clear()
+        self.host = User.objects.create_user('host', password='secret')
+        self.listing = create_listing(self.host, title='Loft')
+
+    def tearDown(self):
+        replica_monitor.status.clear()
+
+    def read(self):
+        """Database the listing is read from"""
+        return Listing.objects.get(pk=self.listing.pk)._state.db
+
+    def replica_queries(self, function, *args):
+        """Statements `function` runs on the replica"""
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with connections[REPLICA].execute_wrapper(record):
+            function(*args)
+        return statements
+
+    def test_reads_of_replicated_models_go_to_the_replica(self):
+        with routing_scope():
+            self.assertEqual(self.read(), REPLICA)
+            # Never a stale calendar
+            self.assertEqual(Booking.objects.all().db, 'default')
+            with transaction.atomic():
+                self.assertEqual(self.read(), 'default')
+
+    def test_a_write_pins_its_scope_only(self):
+        with routing_scope():
+            self.assertEqual(self.read(), REPLICA)
+            self.listing.save()
+            self.assertEqual(self.read(), 'default')
+        with routing_scope():
+            self.assertEqual(self.read(), REPLICA)
+        # Outside any scope a write pins nothing, the process keeps reading from the replica
+        self.listing.save()
+        self.assertFalse(routing_state().pinned)
+        self.assertEqual(self.read(), REPLICA)
+
+    def test_tasks_and_command_runs_are_scoped(self):
+        reads = []
+
+        def task(*args):
+            Listing.objects.filter(pk=self.listing.pk).touch()
+            reads.append(self.read())
+
+        with mock.patch('listings.taskqueue.get_task', return_value=task):
+            run_task('touch', [])
+        self.assertEqual(reads, ['default'])
+        self.assertEqual(self.read(), REPLICA)
+
+        call_command('update_booking_statuses', stdout=StringIO())
+        self.assertEqual(self.read(), REPLICA)
+
+    def test_stickiness_cookie(self):
+        client = APIClient()
+        detail = f'/api/listings/{self.listing.pk}/'
+        self.assertTrue(self.replica_queries(client.get, detail))
+        self.assertNotIn(ReplicaStickinessMiddleware.cookie_name, client.cookies)
+
+        client.force_authenticate(self.host)
+        response = client.patch(detail, {'title': 'Harbour loft'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        cookie = response.cookies[ReplicaStickinessMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 5)
+        # The client's next reads stay on the primary while the replica may lag behind
+        self.assertEqual(self.replica_queries(client.get, detail), [])
+        del client.cookies[ReplicaStickinessMiddleware.cookie_name]
+        self.assertTrue(self.replica_queries(client.get, detail))
+
+    def test_lagging_or_unreachable_replica_falls_back_to_the_primary(self):
+        for lag, expected in [(30.0, 'default'), (DatabaseError('down'), 'default'), (1.0, REPLICA)]:
+            with self.subTest(lag=lag), routing_scope():
+                replica_monitor.status.clear()
+                with mock.patch('listings.db.replica_lag', side_effect=[lag]):
+                    self.assertEqual(self.read(), expected)
+                    # Checked once per LISTINGS_REPLICA_CHECK_SECONDS, not per read
+                    self.assertEqual(self.read(), expected)
+
+    @override_settings(LISTINGS_REPLICA_MODELS=['listings.listing', 'listings.raterule'])
+    def test_queryset_updates_read_from_the_primary(self):
+        other = create_listing(self.host, title='Cabin')
+        RateRule.objects.create(listing=self.listing, kind='price', amount=120)
+        with routing_scope():
+            self.assertEqual(self.replica_queries(
+                lambda: Listing.objects.filter(pk=self.listing.pk).update(latitude=42.36, longitude=-71.06)
+            ), [])
+            self.assertEqual(self.replica_queries(
+                lambda: RateRule.objects.filter(listing=self.listing).update(listing=other)
+            ), [])
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.geohash)
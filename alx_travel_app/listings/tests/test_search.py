@@ -0,0 +1,104 @@
+import json
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from listings.models import Listing
+from listings.search import get_backend
+from listings.tests.factories import create_listing
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class FullTextSearchTest(TestCase):
+    """?search= is answered from the full-text index: ranked, highlighted, and kept in sync by the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        cls.title = create_listing(host, title='Harbour loft', description='Bright rooms')
+        cls.city = create_listing(host, title='Quiet flat', city='Harbourton', description='Near the park')
+        cls.description = create_listing(host, title='Garden cabin', description='A short walk to the harbour front')
+        create_listing(host, title='Mountain chalet', description='Ski in and out')
+
+    def setUp(self):
+        if get_backend() is None:
+            self.skipTest('No full-text index on this database')
+
+    def search(self, query, path='/api/listings/'):
+        response = APIClient().get(path, query)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def ids(self, search, **query):
+        return [item['id'] for item in self.search(dict(query, search=search))]
+
+    def test_title_matches_rank_first(self):
+        # Title, then city, then description, as the field weights order them
+        self.assertEqual(self.ids('harbour'), [self.title.pk, self.city.pk, self.description.pk])
+        # An explicit ordering replaces the relevance
+        self.assertEqual(self.ids('harbour', ordering='-created_at'),
+                         [self.description.pk, self.city.pk, self.title.pk])
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.ids('harb LOFT'), [self.title.pk])
+        self.assertEqual(self.ids('harbour chalet'), [])
+        # Inside a word is not a prefix
+        self.assertEqual(self.ids('arbour'), [])
+        # Punctuation only
+        self.assertEqual(self.ids('"*'), [])
+
+    def test_highlight(self):
+        results = self.search({'search': 'harbour'}, path='/api/listings/search/')
+        highlights = {item['id']: item['highlight'] for item in results}
+        self.assertEqual(highlights[self.title.pk]['title'], '<mark>Harbour</mark> loft')
+        self.assertEqual(highlights[self.city.pk]['title'], 'Quiet flat')
+        self.assertIn('the <mark>harbour</mark> front', highlights[self.description.pk]['description'])
+
+    def test_index_follows_queryset_writes(self):
+        Listing.objects.filter(pk=self.title.pk).update(title='Seaside loft')
+        self.assertEqual(self.ids('seaside'), [self.title.pk])
+        self.assertNotIn(self.title.pk, self.ids('harbour'))
+        Listing.objects.filter(pk=self.city.pk).delete()
+        self.assertEqual(self.ids('harbour'), [self.description.pk])
+        created = Listing.objects.bulk_create([Listing(host=self.title.host, title='Seaside villa', description='',
+                                                       address='2 Main St', city='Boston', country='United States',
+                                                       price_per_night=90, property_type='house', max_guests=2,
+                                                       bedrooms=1, bathrooms=1)])
+        self.assertEqual(set(self.ids('seaside')), {self.title.pk, created[0].pk})
+
+    @override_settings(LISTINGS_FULL_TEXT_SEARCH=False)
+    def test_falls_back_to_search_filter(self):
+        # icontains lookups: inside words too, newest first rather than by relevance
+        self.assertEqual(self.ids('arbour'), [self.description.pk, self.city.pk, self.title.pk])
+        self.assertEqual(self.ids('harbour loft'), [self.title.pk])
+        results = self.search({'search': 'harbour loft'}, path='/api/listings/search/')
+        self.assertEqual(results[0]['highlight'], {'title': 'Harbour loft', 'description': None})
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False, LISTINGS_SLOW_REQUEST_MS=None)
+class SearchIndexMigrationTest(TransactionTestCase):
+    """The index migration reverses cleanly and indexes the existing listings when applied again"""
+
+    def setUp(self):
+        if get_backend() is None:
+            self.skipTest('No full-text index on this database')
+
+    def tearDown(self):
+        call_command('migrate', 'listings', verbosity=0)
+
+    def test_reverse_and_reapply(self):
+        listing = create_listing(User.objects.create_user('host'), title='Harbour loft')
+        call_command('migrate', 'listings', '0001', verbosity=0)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE 'listings_listing_fts%'")
+                self.assertEqual(cursor.fetchall(), [])
+        else:
+            self.assertNotIn('search_vector', [
+                column.name for column in connection.introspection.get_table_description(
+                    connection.cursor(), Listing._meta.db_table)
+            ])
+        call_command('migrate', 'listings', verbosity=0)
+        response = APIClient().get('/api/listings/', {'search': 'harbour'})
+        self.assertEqual([item['id'] for item in json.loads(response.content)['results']], [listing.pk])
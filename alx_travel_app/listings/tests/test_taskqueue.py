@@ -0,0 +1,91 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from listings.models import OutboxTask
+from listings.taskqueue import Worker, enqueue, task
+
+
+@override_settings(LISTINGS_TASK_BACKEND='database', LISTINGS_TASK_LEASE_SECONDS=300)
+class OutboxTest(TestCase):
+    """Task calls are outbox rows written with the caller's transaction and run by the workers"""
+
+    def setUp(self):
+        # Tasks registered by a test are dropped after it
+        patcher = mock.patch.dict('listings.taskqueue._tasks')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+        @task(name='test.record', max_attempts=3)
+        def record(*args):
+            self.calls.append(list(args))
+
+        @task(name='test.flaky', max_attempts=2)
+        def flaky(*args):
+            self.calls.append(list(args))
+            if len(self.calls) == 1:
+                raise ValueError('unavailable')
+
+        self.record, self.flaky = record, flaky
+
+    def test_calls_are_written_with_the_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.record.delay(1)
+            raise RuntimeError
+        self.assertFalse(OutboxTask.objects.exists())
+
+        with transaction.atomic():
+            self.record.delay(1, 'a')
+            self.record.delay_many([[2], [3]])
+        self.assertEqual([(row.name, row.args, row.max_attempts) for row in OutboxTask.objects.order_by('pk')],
+                         [('test.record', [1, 'a'], 3), ('test.record', [2], 3), ('test.record', [3], 3)])
+        # Nothing runs in the caller's process
+        self.assertEqual(self.calls, [])
+        self.assertEqual(Worker().run_batch(), 3)
+        self.assertEqual(self.calls, [[1, 'a'], [2], [3]])
+        self.assertFalse(OutboxTask.objects.exists())
+
+    def test_unknown_task_is_refused(self):
+        with self.assertRaises(KeyError):
+            enqueue('test.unknown', 1)
+
+    def test_failures_are_retried_with_backoff(self):
+        self.flaky.delay(7)
+        worker = Worker()
+        with self.assertLogs('listings.taskqueue', 'WARNING'):
+            self.assertEqual(worker.run_batch(), 1)
+        row = OutboxTask.objects.get()
+        self.assertEqual((row.status, row.attempts, row.locked_by), ('pending', 1, ''))
+        self.assertEqual(row.last_error, 'ValueError: unavailable')
+        self.assertGreater(row.run_at, timezone.now())
+        # Not due yet
+        self.assertEqual(worker.run_batch(), 0)
+        OutboxTask.objects.update(run_at=timezone.now())
+        self.assertEqual(worker.run_batch(), 1)
+        self.assertEqual(self.calls, [[7], [7]])
+        self.assertFalse(OutboxTask.objects.exists())
+        self.assertEqual((worker.processed, worker.failed), (2, 1))
+
+    def test_last_attempt_marks_the_call_failed(self):
+        self.flaky.delay(7)
+        OutboxTask.objects.update(attempts=1)
+        with self.assertLogs('listings.taskqueue', 'ERROR'):
+            self.assertEqual(Worker().run_batch(), 1)
+        row = OutboxTask.objects.get()
+        self.assertEqual((row.status, row.attempts, row.last_error), ('failed', 2, 'ValueError: unavailable'))
+        # Failed calls are left for inspection, never claimed again
+        self.assertEqual(Worker().run_batch(), 0)
+
+    def test_expired_lease_is_claimed_again(self):
+        self.record.delay(1)
+        self.record.delay(2)
+        # Claimed by a worker that died, and by one still running
+        OutboxTask.objects.filter(args=[1]).update(status='running', locked_by='gone', attempts=1,
+                                                   locked_at=timezone.now() - timedelta(seconds=301))
+        OutboxTask.objects.filter(args=[2]).update(status='running', locked_by='busy', attempts=1,
+                                                   locked_at=timezone.now())
+        self.assertEqual(Worker().run_batch(), 1)
+        self.assertEqual(self.calls, [[1]])
+        self.assertEqual(list(OutboxTask.objects.values_list('locked_by', flat=True)), ['busy'])
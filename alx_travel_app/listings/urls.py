@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import ListingViewSet, BookingViewSet, ReviewViewSet
 
 router = DefaultRouter()
@@ -9,4 +10,9 @@ router.register(r'reviews', ReviewViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Async read path, for ASGI deployments
+    path('async/listings/', async_views.listing_list, name='async-listing-list'),
+    path('async/listings/<int:pk>/', async_views.listing_detail, name='async-listing-detail'),
+    path('async/reviews/', async_views.review_list, name='async-review-list'),
+    path('async/reviews/<int:pk>/', async_views.review_detail, name='async-review-detail'),
 ]
\ No newline at end of file
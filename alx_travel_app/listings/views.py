@@ -1,60 +1,304 @@
-from rest_framework import viewsets, permissions, filters
+from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Listing, Booking, Review
-from .serializers import ListingSerializer, BookingSerializer, ReviewSerializer
+from django_filters.utils import translate_validation
+from django.db import transaction
+from django.db.models import Prefetch
+from . import bulk
+from .availability import availability_calendar
+from .cache import CachedReadMixin, listing_tag
+from .conditional import ConditionalRequestMixin
+from .fastpath import CompiledSerializer, FastListMixin
+from .filters import ListingFilter, BookingFilter, ReviewFilter
+from .geo import GEOHASH_PRECISION, cluster_precision, clusters
+from .models import Listing, Booking, Review, RateRule
+from .pricing import quote_stays
+from .search import ListingSearchFilter, highlight
+from .streaming import stream_format, stream_response
+from .serializers import (
+    ListingSerializer, ListingSummarySerializer, BookingSerializer, ReviewSerializer,
+    ListingBookingSerializer, ListingReviewSerializer, BookingExportSerializer, ReviewExportSerializer,
+    CalendarQuerySerializer, QuoteQuerySerializer, QuoteRequestSerializer, RateRuleSerializer
+)
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+class SparseFieldsetMixin:
+    """ViewSet mixin passing ?fields=, ?omit= and ?expand= to the serializer on reads"""
+    sparse_fieldset_params = ['fields', 'omit', 'expand']
+    
+    def sparse_fieldset(self):
+        """Requested field names per parameter, empty for write actions"""
+        if self.action not in ['list', 'retrieve', 'search']:
+            return {}
+        params = self.request.query_params
+        return {
+            name: [field.strip() for field in params[name].split(',') if field.strip()]
+            for name in self.sparse_fieldset_params if params.get(name)
+        }
+    
+    def selected_fields(self):
+        """Output fields of the current request, used to plan the queryset"""
+        return self.get_serializer_class().select_fields(**self.sparse_fieldset())
+    
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.sparse_fieldset())
+        return super().get_serializer(*args, **kwargs)
+
+
+class ExportMixin:
+    """ViewSet mixin streaming every filtered row as NDJSON or CSV with export_serializer_class"""
+    export_serializer_class = None
+    export_filename = 'export'
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Filtered rows by ascending id, as NDJSON or CSV (?stream=csv); ?after=<id> resumes after the last row received"""
+        output_format = stream_format(request, default='ndjson')
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).select_related(None)
+        after = request.query_params.get('after')
+        if after:
+            try:
+                queryset = queryset.filter(pk__gt=int(after))
+            except ValueError:
+                raise ValidationError({'after': ['A valid integer is required.']})
+        # The primary key order makes the last id received a resume point
+        queryset = queryset.order_by('pk')
+        compiled = CompiledSerializer(self.export_serializer_class(context=self.get_serializer_context()))
+        return stream_response(compiled, queryset, output_format, filename=self.export_filename)
+
+
+class ListingViewSet(SparseFieldsetMixin, CachedReadMixin, ConditionalRequestMixin, FastListMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing Listing instances"""
+    # Review changes bump their listing's updated_at, so it also covers the embedded reviews
+    etag_fields = ['updated_at']
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['city', 'country', 'property_type', 'max_guests', 'bedrooms', 'bathrooms',
-                       'has_wifi', 'has_kitchen', 'has_air_conditioning', 'has_heating',
-                       'has_tv', 'has_parking', 'has_pool']
+    filter_backends = [DjangoFilterBackend, ListingSearchFilter, filters.OrderingFilter]
+    filterset_class = ListingFilter
     search_fields = ['title', 'description', 'address', 'city', 'country']
-    ordering_fields = ['price_per_night', 'created_at']
+    ordering_fields = ['price_per_night', 'created_at', 'average_rating', 'review_count']
+    
+    def get_serializer_class(self):
+        if self.action in ['list', 'search']:
+            return ListingSummarySerializer
+        return ListingSerializer
+    
+    def get_queryset(self):
+        """Build the listing queryset with the columns and relations the current action serializes"""
+        queryset = Listing.objects.all()
+        if self.action in ['bookings', 'reviews', 'clusters', 'calendar', 'calendars', 'quote', 'rates']:
+            # These actions only need the listing row itself
+            return queryset
+        if self.action not in ['list', 'retrieve', 'search']:
+            return queryset.select_related('host').prefetch_related(
+                Prefetch('reviews', queryset=Review.objects.select_related('reviewer'))
+            )
+        
+        selected = self.selected_fields()
+        columns = {'id'}
+        for name in selected:
+            field = Listing._meta.get_field(name)
+            if field.concrete:
+                columns.add(name)
+        queryset = queryset.only(*columns)
+        if 'host' in selected:
+            queryset = queryset.select_related('host')
+        if 'reviews' in selected:
+            queryset = queryset.prefetch_related(
+                Prefetch('reviews', queryset=Review.objects.select_related('reviewer'))
+            )
+        return queryset
+    
+    def filter_queryset(self, queryset):
+        if self.action in ['bookings', 'reviews', 'calendar']:
+            # Their query parameters filter the nested rows, not the listing
+            return queryset
+        return super().filter_queryset(queryset)
+    
+    def get_permissions(self):
+        """Quotes are reads even when POSTed; rate rules are edited, and bookings read, by the listing's host"""
+        if self.action == 'quote':
+            return [permissions.AllowAny()]
+        if self.action == 'rates':
+            return [permissions.IsAuthenticatedOrReadOnly(), IsHostOrAdmin()]
+        if self.action == 'bookings':
+            # Bookings carry guest data, paginated as well as streamed
+            return [permissions.IsAuthenticated(), IsListingHostOrAdmin()]
+        return super().get_permissions()
+    
+    def cache_list_tags(self, request):
+        """Date-range searches also depend on the bookings"""
+        if 'check_in' in request.query_params or 'check_out' in request.query_params:
+            return ['listings', 'bookings']
+        return ['listings']
+    
+    def cache_detail_tags(self, pk):
+        return [listing_tag(pk)]
     
     def perform_create(self, serializer):
         serializer.save(host=self.request.user)
     
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Search listings by relevance with the matching words highlighted"""
+        query = request.query_params.get('search', '')
+        if not query.strip():
+            raise ValidationError({'search': ['This query parameter is required.']})
+        queryset = self.filter_queryset(self.get_queryset())
+        if 'search_rank' in queryset.query.extra:
+            queryset = highlight(queryset, query)
+        page = self.paginate_queryset(queryset)
+        listings = page if page is not None else queryset
+        data = self.get_serializer(listings, many=True).data
+        for item, listing in zip(data, listings):
+            item['highlight'] = {
+                'title': getattr(listing, 'search_title', listing.title),
+                'description': getattr(listing, 'search_snippet', None),
+            }
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """Group the listings of a map viewport (?bbox=) by geohash cell"""
+        queryset = self.filter_queryset(self.get_queryset())
+        bbox = ListingFilter(request.query_params, queryset=queryset).form
+        bbox = bbox.cleaned_data.get('bbox') if bbox.is_valid() else None
+        if not bbox:
+            raise ValidationError({'bbox': ['This query parameter is required.']})
+        try:
+            precision = int(request.query_params.get('precision') or cluster_precision(bbox))
+        except ValueError:
+            raise ValidationError({'precision': ['A valid integer is required.']})
+        if not 1 <= precision <= GEOHASH_PRECISION:
+            raise ValidationError({'precision': [f'Must be between 1 and {GEOHASH_PRECISION}.']})
+        return Response({'precision': precision, 'clusters': clusters(queryset, precision)})
+    
     @action(detail=True, methods=['get'])
-    def bookings(self, request, pk=None):
-        """Get all bookings for a listing"""
+    def calendar(self, request, pk=None):
+        """Per-night availability and price of a listing (?start=, ?end= excluded)"""
+        query = CalendarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
         listing = self.get_object()
-        bookings = Booking.objects.filter(listing=listing)
-        serializer = BookingSerializer(bookings, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(availability_calendar([listing], query.validated_data['start'], query.validated_data['end'])[0])
+    
+    @action(detail=False, methods=['get'])
+    def calendars(self, request):
+        """Availability calendars of several listings (?ids=1,2,3), e.g. for a page of search results"""
+        query = CalendarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ids = query.validated_data.get('ids')
+        if not ids:
+            raise ValidationError({'ids': ['This query parameter is required.']})
+        listings = self.get_queryset().filter(pk__in=ids).only('pk', 'price_per_night').order_by('pk')
+        return Response({'results': availability_calendar(
+            list(listings), query.validated_data['start'], query.validated_data['end']
+        )})
+    
+    @action(detail=False, methods=['get', 'post'])
+    def quote(self, request):
+        """Price stays: listings (?ids=1,2,3) over one stay (?check_in=, ?check_out=), or the body's list of stays (POST)"""
+        if request.method == 'POST':
+            query = QuoteRequestSerializer(data=request.data)
+            query.is_valid(raise_exception=True)
+            stays = query.validated_data['stays']
+        else:
+            query = QuoteQuerySerializer(data=request.query_params)
+            query.is_valid(raise_exception=True)
+            stays = [
+                {'listing': pk, 'check_in': query.validated_data['check_in'], 'check_out': query.validated_data['check_out']}
+                for pk in query.validated_data['ids']
+            ]
+        listings = self.get_queryset().only('pk', 'price_per_night').in_bulk({stay['listing'] for stay in stays})
+        return Response({'results': quote_stays(listings, stays)})
+    
+    @action(detail=True, methods=['get', 'put'])
+    def rates(self, request, pk=None):
+        """Rate rules of a listing; PUT replaces them all"""
+        listing = self.get_object()
+        if request.method == 'PUT':
+            serializer = RateRuleSerializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            with transaction.atomic():
+                listing.rate_rules.all().delete()
+                RateRule.objects.bulk_create([RateRule(listing=listing, **data) for data in serializer.validated_data])
+        rules = listing.rate_rules.order_by('-priority', 'pk')
+        return Response(RateRuleSerializer(rules, many=True).data)
+    
+    def nested_list(self, queryset, serializer_class, filterset_class):
+        """Filtered, paginated (or streamed with ?stream=) list of rows belonging to the current listing"""
+        listing = self.get_object()
+        filterset = filterset_class(self.request.query_params, queryset=queryset.filter(listing=listing),
+                                    request=self.request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        # Newest first, matching the (listing, -created_at) indexes, with the primary key breaking ties
+        queryset = filterset.qs.order_by('-created_at', '-pk')
+        compiled = CompiledSerializer(serializer_class(context=self.get_serializer_context()))
+        output_format = stream_format(self.request)
+        if output_format:
+            return stream_response(compiled, queryset, output_format)
+        rows = compiled.fetch(queryset)
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(compiled.to_representation(page))
+    
+    @action(detail=True, methods=['get'])
+    def bookings(self, request, pk=None):
+        """Bookings of a listing, filtered like /api/bookings/"""
+        return self.nested_list(Booking.objects.all(), ListingBookingSerializer, BookingFilter)
     
     @action(detail=True, methods=['get'])
     def reviews(self, request, pk=None):
-        """Get all reviews for a listing"""
-        listing = self.get_object()
-        reviews = Review.objects.filter(listing=listing)
-        serializer = ReviewSerializer(reviews, many=True, context={'request': request})
-        return Response(serializer.data)
+        """Reviews of a listing, filtered like /api/reviews/"""
+        return self.nested_list(Review.objects.all(), ListingReviewSerializer, ReviewFilter)
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(SparseFieldsetMixin, ConditionalRequestMixin, FastListMixin, ExportMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing Booking instances"""
+    # Bookings embed their listing and review
+    etag_fields = ['updated_at', 'listing__updated_at', 'review__updated_at']
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
+    export_serializer_class = BookingExportSerializer
+    export_filename = 'bookings'
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['status', 'listing', 'guest']
+    filterset_class = BookingFilter
     ordering_fields = ['check_in_date', 'check_out_date', 'created_at']
     
+    roles = ['guest', 'host']
+    
     def get_queryset(self):
-        """Filter bookings based on user role"""
+        """Filter bookings based on user role (?role=guest or ?role=host, both by default)"""
         user = self.request.user
-        if user.is_staff:
-            return Booking.objects.all()
-        return Booking.objects.filter(guest=user) | Booking.objects.filter(listing__host=user)
+        role = self.request.query_params.get('role')
+        queryset = Booking.objects.all()
+        if role == 'guest':
+            queryset = queryset.for_guest(user)
+        elif role == 'host':
+            queryset = queryset.for_host(user)
+        elif role:
+            raise ValidationError({'role': f"Must be one of: {', '.join(self.roles)}"})
+        elif not user.is_staff:
+            queryset = queryset.for_user(user)
+        
+        # Join or prefetch only the relations the response embeds
+        selected = self.selected_fields() if self.action in ['list', 'retrieve'] else BookingSerializer.Meta.fields
+        if 'listing' in selected:
+            queryset = queryset.select_related('listing__host').prefetch_related(
+                Prefetch('listing__reviews', queryset=Review.objects.select_related('reviewer'))
+            )
+        if 'guest' in selected:
+            queryset = queryset.select_related('guest')
+        if 'review' in selected:
+            queryset = queryset.select_related('review__reviewer')
+        return queryset
     
     def get_permissions(self):
         """Set custom permissions for different actions"""
-        if self.action in ['create', 'list', 'retrieve']:
+        if self.action in ['create', 'list', 'retrieve', 'export']:
             permission_classes = [permissions.IsAuthenticated]
         else:
             # For update, partial_update, destroy
@@ -63,19 +307,38 @@ class BookingViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(guest=self.request.user)
+    
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        """Create (POST) or update (PATCH) a batch of bookings; ?atomic=true writes all of it or nothing"""
+        items = bulk.batch_items(request.data)
+        atomic = bulk.all_or_nothing(request)
+        if request.method == 'POST':
+            return bulk.run_batch(bulk.create_bookings, request.user, items, atomic).response(status.HTTP_201_CREATED)
+        return bulk.run_batch(bulk.update_bookings, request.user, items, atomic).response(status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """Change the status of a batch of bookings; ?atomic=true changes all of it or nothing"""
+        items = bulk.batch_items(request.data)
+        result = bulk.run_batch(bulk.transition_bookings, request.user, items, bulk.all_or_nothing(request))
+        return result.response(status.HTTP_200_OK)
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseFieldsetMixin, ConditionalRequestMixin, ExportMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing Review instances"""
-    queryset = Review.objects.all()
+    # The nested reviewer is read with its review rather than with one query per row
+    queryset = Review.objects.select_related('reviewer')
     serializer_class = ReviewSerializer
+    export_serializer_class = ReviewExportSerializer
+    export_filename = 'reviews'
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['listing', 'reviewer', 'rating']
+    filterset_class = ReviewFilter
     ordering_fields = ['rating', 'created_at']
     
     def get_permissions(self):
         """Set custom permissions for different actions"""
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export']:
             permission_classes = [permissions.AllowAny]
         elif self.action == 'create':
             permission_classes = [permissions.IsAuthenticated, IsBookingGuest]
@@ -86,6 +349,15 @@ class ReviewViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(reviewer=self.request.user)
+    
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        """Create (POST) or update (PATCH) a batch of reviews; ?atomic=true writes all of it or nothing"""
+        items = bulk.batch_items(request.data)
+        atomic = bulk.all_or_nothing(request)
+        if request.method == 'POST':
+            return bulk.run_batch(bulk.create_reviews, request.user, items, atomic).response(status.HTTP_201_CREATED)
+        return bulk.run_batch(bulk.update_reviews, request.user, items, atomic).response(status.HTTP_200_OK)
 
 
 # Custom permissions
@@ -95,6 +367,20 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         return request.user.is_staff or obj.guest == request.user
 
 
+class IsHostOrAdmin(permissions.BasePermission):
+    """Custom permission to only allow the host of a listing or admins to edit it"""
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return request.user.is_staff or obj.host_id == request.user.pk
+
+
+class IsListingHostOrAdmin(permissions.BasePermission):
+    """Custom permission to only allow the host of a listing or admins to read its private data"""
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_staff or obj.host_id == request.user.pk
+
+
 class IsReviewerOrAdmin(permissions.BasePermission):
     """Custom permission to only allow reviewers or admins to edit a review"""
     def has_object_permission(self, request, view, obj):